@@ -2,6 +2,76 @@ import uasyncio
 import ujson
 import uos
 
+# Seconds, an idle persistent connection waits for the next request
+KEEP_ALIVE_TIMEOUT = 5
+# Requests, that are served on one connection, before it is closed
+MAX_KEEP_ALIVE_REQUESTS = 100
+
+# Subscribers of an event source, further clients get 503
+MAX_EVENT_SUBSCRIBERS = 4
+# Events, that are queued per subscriber, a subscriber, that falls further behind, is dropped
+EVENT_QUEUE_SIZE = 8
+# Seconds, a write to a subscriber may take, before it is dropped
+EVENT_WRITE_TIMEOUT = 5
+# Seconds without events, after which a comment is sent, so closed connections are noticed
+EVENT_PING_INTERVAL = 15
+
+# The status lines of the supported status codes, they are encoded once
+STATUS_LINES = {
+    200: b"HTTP/1.1 200 OK\r\n",
+    400: b"HTTP/1.1 400 Bad Request\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\n",
+    405: b"HTTP/1.1 405 Method Not Allowed\r\n",
+    500: b"HTTP/1.1 500 Internal Server Error\r\n",
+    503: b"HTTP/1.1 503 Service Unavailable\r\n",
+}
+
+# The types of path parameters, e.g. "/units/{unit:int}/state", a parameter without type is a str
+PARAM_TYPES = {
+    "str": str,
+    "int": int,
+}
+
+
+def _unquote(s: str) -> str:
+    # decodes the %XX escapes of an URL
+    if "%" not in s:
+        return s
+    parts = s.split("%")
+    buf = bytearray(parts[0].encode("utf-8"))
+    for part in parts[1:]:
+        try:
+            buf.append(int(part[:2], 16))
+            buf.extend(part[2:].encode("utf-8"))
+        except ValueError:
+            buf.extend(("%" + part).encode("utf-8"))
+    return bytes(buf).decode("utf-8")
+
+
+def parse_query(query: str) -> dict:
+    # name -> value, a name without value is mapped to ""
+    params = {}
+    for pair in query.split("&"):
+        if pair == "":
+            continue
+        name, _, value = pair.partition("=")
+        params[_unquote(name.replace("+", " "))] = _unquote(value.replace("+", " "))
+    return params
+
+def encode_event(data: any, event: str=None, event_id: int=None) -> bytes:
+    # a Server-Sent Event, str is sent as it is, everything else as json
+    if not isinstance(data, str):
+        data = ujson.dumps(data)
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}\n")
+    if event is not None:
+        lines.append(f"event: {event}\n")
+    for line in data.split("\n"):
+        lines.append(f"data: {line}\n")
+    lines.append("\n")
+    return "".join(lines).encode("utf-8")
+
 class HttpRequest:
     def __init__(self, method: str, url: str, version: str, reader, writer):
         self.method = method
@@ -10,6 +80,9 @@ class HttpRequest:
         self.reader = reader
         self.writer = writer
         self.headers = {}
+        # if the connection is kept open after the response, set by the server
+        self.keep_alive = False
+        self.closed = False
 
     async def _process_headers(self, ignore_headers:bool=False):
         while self.reader is not None:
@@ -65,33 +138,47 @@ class HttpRequest:
         fields = {item["name"]: item for item in _fields}
         return fields
 
+    def _wants_keep_alive(self) -> bool:
+        # HTTP/1.1 connections are persistent, unless the client asks to close them
+        connection = self.headers.get("Connection", "").lower()
+        if self.version == "HTTP/1.1":
+            return connection != "close"
+        return connection == "keep-alive"
+
     async def _process_body(self):
         self.raw_body = ""
         if "Content-Length" in self.headers:
+            # the whole body is read, even if it isn't parsed, the next request of the connection follows it
             if "Content-Type" in self.headers:
                 try:            
                     if self.headers["Content-Type"].startswith("text/html"):
-                        self.raw_body = await self.reader.read(int(self.headers["Content-Length"]))
+                        self.raw_body = await self.reader.readexactly(int(self.headers["Content-Length"]))
                         self.body = self.raw_body.decode("utf-8")
                     elif self.headers["Content-Type"].startswith("application/json"):
-                        self.raw_body = await self.reader.read(int(self.headers["Content-Length"]))
+                        self.raw_body = await self.reader.readexactly(int(self.headers["Content-Length"]))
                         self.body = ujson.loads(self.raw_body.decode("utf-8"))
                     elif self.headers["Content-Type"].startswith("multipart/form-data"):
                         self.fields = await self._process_form_fields()
                     else:
-                        self.raw_body = await self.reader.read(int(self.headers["Content-Length"]))   
+                        self.raw_body = await self.reader.readexactly(int(self.headers["Content-Length"]))   
                 except:
                     print("Could not parse Request Body")
                     raise ValueError("Could not parse Request Body")
+            else:
+                self.raw_body = await self.reader.readexactly(int(self.headers["Content-Length"]))
 
     async def write(self, buf):
         await self.writer.awrite(buf)
         await self.writer.drain()
 
-    async def close(self):
+    async def close(self, read: bool=True):
+        if self.closed:
+            return
+        self.closed = True
         try:
-            # Seems to be required for some Browsers
-            await self.reader.read(-1)
+            if read:
+                # Seems to be required for some Browsers
+                await self.reader.read(-1)
         finally:
             await self.writer.wait_closed()
             await self.reader.wait_closed()
@@ -101,66 +188,78 @@ class HttpResponse:
         self.request = request
         self.data = data
         self.code = code
+        self._body = None
         if headers is None:
             self.headers = {}
         else:
             self.headers = headers
-        _default_headers = {
-            "Connection": "close",
-            "Access-Control-Allow-Origin": "*"
-            }
-        
-        if isinstance(self.data, str):
-            _default_headers["Content-Length"] = len(self.data)
-            _default_headers["Content-Type"] = "text/html"
-        elif isinstance(self.data, dict):
-            _default_headers["Content-Length"] = len(ujson.dumps(self.data))
-            _default_headers["Content-Type"] = "application/json"
-        elif isinstance(self.data, list):
-            _default_headers["Content-Length"] = len(ujson.dumps(self.data))
-            _default_headers["Content-Type"] = "application/json"
-        elif isinstance(self.data, tuple):
-            if self.data[0] == "file":
-                _default_headers["Content-Length"] = uos.stat(self.data[1])[6]
+        if default_headers:
+            _default_headers = {
+                "Connection": "keep-alive" if request is not None and request.keep_alive else "close",
+                "Access-Control-Allow-Origin": "*"
+                }
+
+            # the body is encoded once, the length is counted in bytes
+            if isinstance(self.data, str):
+                _default_headers["Content-Length"] = len(self.body)
                 _default_headers["Content-Type"] = "text/html"
+            elif isinstance(self.data, dict):
+                _default_headers["Content-Length"] = len(self.body)
+                _default_headers["Content-Type"] = "application/json"
+            elif isinstance(self.data, list):
+                _default_headers["Content-Length"] = len(self.body)
+                _default_headers["Content-Type"] = "application/json"
+            elif isinstance(self.data, (bytes, bytearray, memoryview)):
+                # pre-encoded by the route
+                _default_headers["Content-Length"] = len(self.body)
+                _default_headers["Content-Type"] = "application/octet-stream"
+            elif isinstance(self.data, tuple):
+                if self.data[0] == "file":
+                    _default_headers["Content-Length"] = uos.stat(self.data[1])[6]
+                    _default_headers["Content-Type"] = "text/html"
 
-        if default_headers:
             for header in _default_headers:
                 if header not in self.headers:
-                    self.headers[header] = _default_headers[header]   
+                    self.headers[header] = _default_headers[header]
+
+    @property
+    def body(self):
+        # encoded on first access and then reused: str as UTF-8, dict and list as json, pre-encoded data as it is
+        if self._body is None:
+            data = self.data
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                self._body = data
+            elif isinstance(data, str):
+                self._body = data.encode("utf-8")
+            elif isinstance(data, (dict, list)):
+                self._body = ujson.dumps(data).encode("utf-8")
+            else:
+                self._body = b""
+        return self._body
+
+    def _head(self):
+        # the status line and the headers, up to the empty line
+        status = STATUS_LINES.get(self.code)
+        if status is None:
+            status = f"HTTP/1.1 {self.code} \r\n".encode("utf-8")
+        lines = [f"{header}: {self.headers[header]}\r\n" for header in self.headers]
+        lines.append("\r\n")
+        return status + "".join(lines).encode("utf-8")
 
     async def _send(self):
-        if self.code == 200:
-            await self.request.write(f"HTTP/1.1 200 OK\r\n")
-        elif self.code == 400:
-            await self.request.write(f"HTTP/1.1 400 Bad Request\r\n")
-        elif self.code == 404:
-            await self.request.write(f"HTTP/1.1 404 Not Found\r\n")
-        elif self.code == 405:
-            await self.request.write(f"HTTP/1.1 405 Method Not Allowed\r\n")
-        elif self.code == 500:
-            await self.request.write(f"HTTP/1.1 500 Internal Server Error\r\n")
-
-        for header in self.headers:
-            await self.request.write(f"{header}: {self.headers[header]}\r\n")
-
-        await self.request.write(f"\r\n")
-
-        if isinstance(self.data, str):
-            await self.request.write(self.data)
-        elif isinstance(self.data, dict):
-            await self.request.write(ujson.dumps(self.data))
-        elif isinstance(self.data, list):
-            await self.request.write(ujson.dumps(self.data))
-        elif isinstance(self.data, tuple):
+        # the head and the body are assembled in one buffer and sent with a single write,
+        # so a small response doesn't end up in many small TCP segments
+        head = self._head()
+        if isinstance(self.data, tuple):
             if self.data[0] == "file":
+                # the first chunk of the file goes out with the head
                 with open(self.data[1], encoding="utf-8") as f:
-                    while True:
-                        s = f.read(1024)
-                        if s != '':
-                            await self.request.write(s.encode("utf-8"))
-                        else:
-                            break
+                    buf = head + f.read(1024).encode("utf-8")
+                    while buf:
+                        await self.request.write(buf)
+                        buf = f.read(1024).encode("utf-8")
+                return
+        await self.request.write(head + self.body)
 
 class HttpError(HttpResponse):
     def __init__(self, request: HttpRequest, code: int, message: str=None):
@@ -175,11 +274,207 @@ class HttpError(HttpResponse):
                 super().__init__(request, "Method Not Allowed", code)      
             elif code == 500:
                 super().__init__(request, "Internal Server Error", code)
+            elif code == 503:
+                super().__init__(request, "Service Unavailable", code)
+
+class HttpEventStream(HttpResponse):
+    # the response of a subscriber of a HttpEventSource, it holds the connection open and sends the
+    # published events, until the client disconnects or is dropped
+    def __init__(self, request: HttpRequest, source, initial: bytes=b""):
+        super().__init__(request, initial, headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Connection": "close",
+            "Access-Control-Allow-Origin": "*",
+        }, default_headers=False)
+        self.source = source
+        # the encoded events, that weren't sent yet
+        self.queue = []
+        self.dropped = False
+        self._event = uasyncio.Event()
+
+    def _drop(self):
+        self.dropped = True
+        self.queue = []
+        self._event.set()
+
+    async def _next(self):
+        # the queued events in one buffer, a comment, if there were none for a while, None, if dropped
+        while not self.queue:
+            if self.dropped:
+                return None
+            self._event.clear()
+            try:
+                await uasyncio.wait_for(self._event.wait(), self.source.ping_interval)
+            except uasyncio.TimeoutError:
+                return b": ping\n\n"
+        buf = b"".join(self.queue)
+        self.queue = []
+        return buf
+
+    async def _send(self):
+        # the head and the initial events go out in one write, then all queued events in one write each
+        buf = self._head() + self.body
+        try:
+            while buf is not None:
+                await uasyncio.wait_for(self.request.write(buf), self.source.write_timeout)
+                buf = await self._next()
+        except (uasyncio.TimeoutError, OSError):
+            # the client is too slow or disconnected
+            pass
+        finally:
+            self.source._remove(self)
+            # the client doesn't send anything, that could be read
+            await self.request.close(read=False)
+
+class HttpEventSource:
+    # Pushes Server-Sent Events to the clients, that subscribed to it: a route returns subscribe(request),
+    # publish() encodes an event once and queues it for every subscriber. Further clients than
+    # max_subscribers get 503. A subscriber with queue_size queued events, or a write, that takes longer
+    # than write_timeout seconds, is dropped, so a slow client can't hold memory or slow down the others.
+    def __init__(self, max_subscribers: int=MAX_EVENT_SUBSCRIBERS, queue_size: int=EVENT_QUEUE_SIZE,
+            write_timeout: float=EVENT_WRITE_TIMEOUT, ping_interval: float=EVENT_PING_INTERVAL):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.write_timeout = write_timeout
+        self.ping_interval = ping_interval
+        self.subscribers = []
+        self.last_id = 0
+        # subscribers, that were dropped, because they were too slow
+        self.dropped = 0
+
+    def subscribe(self, request: HttpRequest, initial: list=None) -> HttpResponse:
+        # initial: events (event, data), that are sent to this client first, e.g. the current state
+        if len(self.subscribers) >= self.max_subscribers:
+            return HttpError(request, 503, "Too many subscribers")
+        buf = b""
+        if initial is not None:
+            buf = b"".join([encode_event(data, event) for event, data in initial])
+        stream = HttpEventStream(request, self, buf)
+        self.subscribers.append(stream)
+        return stream
+
+    def publish(self, data: any, event: str=None) -> int:
+        # returns the subscribers, the event was queued for
+        self.last_id += 1
+        if not self.subscribers:
+            return 0
+        buf = encode_event(data, event, self.last_id)
+        n = 0
+        for stream in self.subscribers[:]:
+            if len(stream.queue) >= self.queue_size:
+                self.dropped += 1
+                self._remove(stream)
+            else:
+                stream.queue.append(buf)
+                stream._event.set()
+                n += 1
+        return n
+
+    def close(self):
+        for stream in self.subscribers[:]:
+            self._remove(stream)
+
+    def _remove(self, stream: HttpEventStream):
+        stream._drop()
+        if stream in self.subscribers:
+            self.subscribers.remove(stream)
             
+class _RouteNode:
+    # a node of the segment trie: the static children, the parameter child and the routes, that end here
+    def __init__(self):
+        self.children = {}
+        # (name, type, node)
+        self.param = None
+        # method -> (is async, pattern)
+        self.methods = None
+        # the value of the Allow header of a 405 response
+        self.allow = None
+
+
+class HttpRouter:
+    # Routes without parameters are found with a single dict lookup, routes with parameters
+    # (e.g. "/units/{unit:int}/state") in a trie of the path segments
+    def __init__(self, routes: dict, async_routes: dict):
+        self.static = {}
+        self.root = _RouteNode()
+        self.size = len(routes) + len(async_routes)
+        for pattern in routes:
+            self._add(pattern, routes[pattern][0], False)
+        for pattern in async_routes:
+            self._add(pattern, async_routes[pattern][0], True)
+
+    def _add(self, pattern: str, methods: tuple, is_async: bool):
+        if "{" not in pattern:
+            node = self.static.get(pattern)
+            if node is None:
+                node = self.static[pattern] = _RouteNode()
+        else:
+            node = self.root
+            for segment in pattern.split("/")[1:]:
+                if segment.startswith("{") and segment.endswith("}"):
+                    name, _, type_name = segment[1:-1].partition(":")
+                    param_type = PARAM_TYPES.get(type_name or "str")
+                    if param_type is None:
+                        raise ValueError(f"Unknown parameter type {type_name} in route {pattern}")
+                    if node.param is None:
+                        node.param = (name, param_type, _RouteNode())
+                    elif node.param[0] != name or node.param[1] is not param_type:
+                        raise ValueError(f"Parameter {segment} of route {pattern} conflicts with another route")
+                    node = node.param[2]
+                else:
+                    child = node.children.get(segment)
+                    if child is None:
+                        child = node.children[segment] = _RouteNode()
+                    node = child
+        if node.methods is None:
+            node.methods = {}
+        for method in methods:
+            node.methods[method] = (is_async, pattern)
+        node.allow = ", ".join(sorted(node.methods))
+
+    def match(self, path: str) -> tuple:
+        # (node, params) or (None, None), if no route matches
+        node = self.static.get(path)
+        if node is not None:
+            return node, {}
+        params = {}
+        node = self._match(self.root, path.split("/"), 1, params)
+        if node is None:
+            return None, None
+        return node, params
+
+    def _match(self, node: _RouteNode, segments: list, i: int, params: dict) -> _RouteNode:
+        if i == len(segments):
+            return node if node.methods is not None else None
+        child = node.children.get(segments[i])
+        if child is not None:
+            found = self._match(child, segments, i + 1, params)
+            if found is not None:
+                return found
+        if node.param is not None and segments[i] != "":
+            name, param_type, child = node.param
+            try:
+                value = param_type(_unquote(segments[i]))
+            except ValueError:
+                return None
+            found = self._match(child, segments, i + 1, params)
+            if found is not None:
+                params[name] = value
+                return found
+        return None
+
+
 class HttpServer:
-    def __init__(self, port: int=80, address: str='0.0.0.0'):
+    # Connections are persistent (HTTP/1.1 keep-alive), requests are answered in the order they arrived.
+    # The routes are compiled into a HttpRouter, when the server starts and when routes are added,
+    # call compile(), if you remove routes or change their methods while the server runs.
+    def __init__(self, port: int=80, address: str='0.0.0.0', keep_alive_timeout: float=KEEP_ALIVE_TIMEOUT, max_requests: int=MAX_KEEP_ALIVE_REQUESTS):
         self.port = port
         self.address = address
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests = max_requests
+        self._router = None
         self.routes = {}
         self.async_routes = {}
 
@@ -198,17 +493,33 @@ class HttpServer:
         return decorator
 
     async def handle(self, reader, writer):
-        req_line = await reader.readline()
-        # request line should be like
-        # GET /index.html HTTP/1.1
-        req_items = req_line.decode("ascii").split(" ")
-        if len(req_items) != 3:
-            return
-        
-        request = HttpRequest(req_items[0], req_items[1], req_items[2], reader, writer)
+        served = 0
+        while True:
+            if served == 0:
+                req_line = await reader.readline()
+            else:
+                try:
+                    req_line = await uasyncio.wait_for(reader.readline(), self.keep_alive_timeout)
+                except (uasyncio.TimeoutError, OSError):
+                    req_line = b""
+            # request line should be like
+            # GET /index.html HTTP/1.1
+            req_items = req_line.decode("ascii").split(" ")
+            if len(req_items) != 3:
+                # the client closed the connection, or it was idle for too long
+                await writer.wait_closed()
+                return
+            served += 1
+            request = HttpRequest(req_items[0], req_items[1], req_items[2].strip(), reader, writer)
+            if not await self._handle_request(request, served >= self.max_requests):
+                return
+
+    async def _handle_request(self, request, last):
+        # Answers one request. Returns, if the connection is kept open for the next one.
         print(f"Request: {request.method:.10} {request.url:.30} -> ", end="")
         
         failed = False
+        keep_alive = False
 
         try:
             try:
@@ -228,31 +539,51 @@ class HttpServer:
                     await response._send()
                     print(f"400 (Could not process body)")
             if not failed:
-                if request.url in self.routes:
-                    if request.method in self.routes[request.url][0]:
-                        try:
-                            response = self.routes[request.url][1](request)
-                        except:
-                            response = HttpError(request, 500)     
-                    else:
-                        response = HttpError(request, 405, f"Method {request.method} not allowed")            
-                elif request.url in self.async_routes:
-                    if request.method in self.async_routes[request.url][0]:
-                        try:
-                            response = await self.async_routes[request.url][1](request)
-                        except:
-                            response = HttpError(request, 500)                    
-                    else:
-                        response = HttpError(request, 405, f"Method {request.method} not allowed")
-                else:
-                    response = HttpError(request, 404, f"URL {request.url} not found")
+                request.keep_alive = not last and request._wants_keep_alive()
+                response = await self._dispatch(request)
                 await response._send()
                 print(f"{response.code} {str(response.data):.100}")
+                # without a length, the client reads the body until the connection is closed
+                keep_alive = request.keep_alive and response.headers.get("Connection") == "keep-alive" \
+                    and "Content-Length" in response.headers
 
         finally:
             #uasyncio.sleep(0.2)
-            await request.close()
+            if not keep_alive:
+                await request.close()
+        return keep_alive
+
+    def compile(self) -> HttpRouter:
+        self._router = HttpRouter(self.routes, self.async_routes)
+        return self._router
+
+    async def _dispatch(self, request: HttpRequest) -> HttpResponse:
+        router = self._router
+        if router is None or router.size != len(self.routes) + len(self.async_routes):
+            router = self.compile()
+        path, _, query = request.url.partition("?")
+        request.path = path
+        try:
+            request.query = parse_query(query)
+        except (ValueError, UnicodeError):
+            return HttpError(request, 400, "Could not parse query string")
+        node, request.params = router.match(path)
+        if node is None:
+            return HttpError(request, 404, f"URL {request.url} not found")
+        route = node.methods.get(request.method)
+        if route is None:
+            response = HttpError(request, 405, f"Method {request.method} not allowed")
+            response.headers["Allow"] = node.allow
+            return response
+        is_async, pattern = route
+        try:
+            if is_async:
+                return await self.async_routes[pattern][1](request)
+            return self.routes[pattern][1](request)
+        except:
+            return HttpError(request, 500)
 
     async def run(self):
+        self.compile()
         return await uasyncio.start_server(self.handle, self.address, self.port)
         
\ No newline at end of file
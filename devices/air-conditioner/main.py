@@ -47,38 +47,35 @@ if sta_if.isconnected():
 else:
     print("could not connect to wifi (timeout)")
 
-srv = http_server.HttpServer()
-ac_state = {}
+# one entry per indoor unit: (uart, tx, rx)
+# a second unit could be connected to UART 1, e.g. (1, 4, 5)
+UNITS = [
+    (2, 17, 16),
+]
 
-adp = ac_adap.AcAdapter()
+srv = http_server.HttpServer()
+adapters = [ac_adap.AcAdapter(tx=tx, rx=rx, uart=uart) for uart, tx, rx in UNITS]
+adp = adapters[0]
+ac_state = adp.state
 
 routes.setup(sta_if, ac_state, adp)
 
+# /state, /rawState and /metrics are the first unit, /units/<n>/... each unit
 srv.async_routes["/state"] = (("GET", "POST", "OPTIONS"), routes.state)
 srv.routes["/rawState"] = (("GET", ), routes.raw_state)
+srv.routes["/metrics"] = (("GET", "OPTIONS"), routes.metrics)
+for n in range(len(adapters)):
+    srv.async_routes[f"/units/{n}/state"] = (("GET", "POST", "OPTIONS"), routes.unit_state(adapters[n]))
+    srv.routes[f"/units/{n}/rawState"] = (("GET", ), routes.unit_raw_state(adapters[n]))
+    srv.routes[f"/units/{n}/metrics"] = (("GET", "OPTIONS"), routes.unit_metrics(adapters[n]))
+# one event per change of a unit, instead of polling /state
+events = http_server.HttpEventSource()
+srv.routes["/events"] = (("GET", "OPTIONS"), routes.events(events, adapters))
+for n in range(len(adapters)):
+    adapters[n].on_change = routes.state_changed(events, n, adapters[n])
 srv.routes["/reset"] = (("GET",), routes.reset)
 srv.routes["/networkState"] = (("GET",), routes.networkState)
 
-async def read_ac_state():
-    global ac_state
-    while True:
-        try:
-            if adp.connected:
-                await uasyncio.sleep(5)
-                packet = await adp.ac_get_state1()
-                ac_state.update(packet.data)
-                ac_state["RAW1"] = str(packet)
-                packet = await adp.ac_get_state2()
-                ac_state.update(packet.data)
-                ac_state["RAW2"] = str(packet)
-            else:
-                await adp.ac_connect()
-        except:
-            adp.connected = False
-            adp.ac_connect()
-            print("ac error")
-
-
 async def check_wifi_state():
     # while wifi is connected, do noting
     while sta_if.isconnected():
@@ -105,7 +102,8 @@ async def check_wifi_state():
 
 loop = uasyncio.get_event_loop()
 loop.create_task(srv.run())
-loop.create_task(read_ac_state())
+for adapter in adapters:
+    loop.create_task(adapter.poller.run())
 loop.create_task(check_wifi_state())
 try:
     loop.run_forever()
@@ -5,6 +5,8 @@ import umachine
 _sta_if = None
 _ac_state = None
 _adp = None
+# unit -> the state, that was published last, events only carry the fields, that changed
+_published = {}
 
 def setup(sta_if, ac_state, adp):
     global _sta_if
@@ -47,21 +49,100 @@ def networkState(request: http_server.HttpRequest):
         })
 
 async def state(request: http_server.HttpRequest):
+    return await _state(request, _ac_state, _adp)
+
+def raw_state(request: http_server.HttpRequest):
+    return _raw_state(request, _ac_state)
+
+def unit_state(adp):
+    # the state route of one unit, if there is more than one
+    async def route(request: http_server.HttpRequest):
+        return await _state(request, adp.state, adp)
+    return route
+
+def unit_raw_state(adp):
+    def route(request: http_server.HttpRequest):
+        return _raw_state(request, adp.state)
+    return route
+
+def metrics(request: http_server.HttpRequest):
+    return _metrics(request, _adp)
+
+def unit_metrics(adp):
+    def route(request: http_server.HttpRequest):
+        return _metrics(request, adp)
+    return route
+
+def events(source, adapters):
+    # the event stream of all units, a new subscriber gets the full state of each unit first
+    def route(request: http_server.HttpRequest):
+        if request.method == "GET":
+            initial = []
+            for n in range(len(adapters)):
+                data = _public_state(adapters[n].state, adapters[n])
+                data["unit"] = n
+                initial.append(("state", data))
+            return source.subscribe(request, initial)
+        elif request.method == "OPTIONS":
+            return http_server.HttpResponse(request, "OK", headers={
+                "Access-Control-Allow-Methods": "GET, OPTIONS",
+                "Access-Control-Allow-Headers": "Content-Type",
+                "Access-Control-Allow-Origin": "*",
+            })
+    return route
+
+def state_changed(source, n, adp):
+    # the on_change callback of a unit, publishes the fields, that changed since the last event
+    def on_change():
+        data = _public_state(adp.state, adp)
+        last = _published.get(n, {})
+        _published[n] = data
+        if not source.subscribers:
+            return
+        changed = {"unit": n}
+        for key in data:
+            if last.get(key) != data[key]:
+                changed[key] = data[key]
+        source.publish(changed, "state")
+    return on_change
+
+def _metrics(request: http_server.HttpRequest, adp):
+    # round trip times, counters and queue wait of the link, see CN105Server.stats()
     if request.method == "GET":
-        global _ac_state
-        if _ac_state is None:
-            _ac_state = {}
-        data = {
-            "powerState": _ac_state.get("POWER", (None,None))[1],
-            "temperatureSet": _ac_state.get("TEMP", (None,None))[1],
-            "temperatureRoom": _ac_state.get("ROOMTEMP", (None,None))[1],
-            "mode": _ac_state.get("MODE", (None,None))[1],
-            "fan": _ac_state.get("FAN", (None,None))[1],
-            "vane": _ac_state.get("VANE", (None,None))[1],
-            "dir": _ac_state.get("DIR", (None,None))[1],
-            "errorState": _ac_state.get("ERROR", "OK"),
-        }
-        return http_server.HttpResponse(request, data)
+        return http_server.HttpResponse(request, adp.link.stats())
+    elif request.method == "OPTIONS":
+        return http_server.HttpResponse(request, "OK", headers={
+            "Access-Control-Allow-Methods": "GET, OPTIONS",
+            "Access-Control-Allow-Headers": "Content-Type",
+            "Access-Control-Allow-Origin": "*",
+        })
+
+def _public_state(ac_state, adp):
+    if ac_state is None:
+        ac_state = {}
+    return {
+        "powerState": ac_state.get("POWER", (None,None))[1],
+        "temperatureSet": ac_state.get("TEMP", (None,None))[1],
+        "temperatureRoom": ac_state.get("ROOMTEMP", (None,None))[1],
+        "mode": ac_state.get("MODE", (None,None))[1],
+        "fan": ac_state.get("FAN", (None,None))[1],
+        "vane": ac_state.get("VANE", (None,None))[1],
+        "dir": ac_state.get("DIR", (None,None))[1],
+        "errorState": ac_state.get("ERROR", "OK"),
+        "errorCode": ac_state.get("ERRORCODE", (None,None))[1],
+        "compressorFrequency": ac_state.get("COMPRESSOR", (None,None))[1],
+        "operating": ac_state.get("OPERATING", (None,None))[1],
+        "timerMode": ac_state.get("TIMERMODE", (None,None))[1],
+        "timerOnRemaining": ac_state.get("TIMERONREMAINING", (None,None))[1],
+        "timerOffRemaining": ac_state.get("TIMEROFFREMAINING", (None,None))[1],
+        "standby": ac_state.get("STANDBY", (None,None))[1],
+        "version": getattr(ac_state, "version", None),
+        "connectionState": adp.link.state,
+    }
+
+async def _state(request: http_server.HttpRequest, ac_state, adp):
+    if request.method == "GET":
+        return http_server.HttpResponse(request, _public_state(ac_state, adp))
     elif request.method == "POST":
         valid_keys = ["powerState", "temperatureSet", "mode", "fan", "vane", "dir"]
         
@@ -151,9 +232,11 @@ async def state(request: http_server.HttpRequest):
                 return http_server.HttpError(request, 400, "could not parse dir")
 
         try:
-            await _adp.ac_set_state(new_state)
+            response = await adp.ac_set_state(new_state)
         except:
             return http_server.HttpError(request, 500, "could not set new state")
+        if response is None:
+            return http_server.HttpError(request, 500, "could not set new state")
 
         return http_server.HttpResponse(request, "OK")
     elif request.method == "OPTIONS":
@@ -162,24 +245,26 @@ async def state(request: http_server.HttpRequest):
             "Access-Control-Allow-Headers": "Content-Type",
             "Access-Control-Allow-Origin": "*",
         })
-    
 
-def raw_state(request: http_server.HttpRequest):
+def _raw_state(request: http_server.HttpRequest, ac_state):
     if request.method == "GET":
-        global _ac_state
-        if _ac_state is None:
-            _ac_state = {}
+        if ac_state is None:
+            ac_state = {}
         data = {
-            "powerState": _ac_state.get("POWER", (None,None))[1],
-            "temperatureSet": _ac_state.get("TEMP", (None,None))[1],
-            "temperatureRoom": _ac_state.get("ROOMTEMP", (None,None))[1],
-            "mode": _ac_state.get("MODE", (None,None))[1],
-            "fan": _ac_state.get("FAN", (None,None))[1],
-            "vane": _ac_state.get("VANE", (None,None))[1],
-            "dir": _ac_state.get("DIR", (None,None))[1],
-            "raw1": _ac_state.get("RAW1", (None,None)),
-            "raw2": _ac_state.get("RAW2", (None,None)),
-            "errorState": _ac_state.get("ERROR", "OK"),
+            "powerState": ac_state.get("POWER", (None,None))[1],
+            "temperatureSet": ac_state.get("TEMP", (None,None))[1],
+            "temperatureRoom": ac_state.get("ROOMTEMP", (None,None))[1],
+            "mode": ac_state.get("MODE", (None,None))[1],
+            "fan": ac_state.get("FAN", (None,None))[1],
+            "vane": ac_state.get("VANE", (None,None))[1],
+            "dir": ac_state.get("DIR", (None,None))[1],
+            "raw1": ac_state.get("RAW1", (None,None)),
+            "raw2": ac_state.get("RAW2", (None,None)),
+            "raw4": ac_state.get("RAW4", (None,None)),
+            "raw5": ac_state.get("RAW5", (None,None)),
+            "raw6": ac_state.get("RAW6", (None,None)),
+            "raw9": ac_state.get("RAW9", (None,None)),
+            "errorState": ac_state.get("ERROR", "OK"),
         }
         return http_server.HttpResponse(request, data)
     elif request.method == "OPTIONS":
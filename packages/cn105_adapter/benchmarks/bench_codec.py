@@ -0,0 +1,268 @@
+"""CN105 codec benchmarks
+
+Measures the throughput (frames/s) and the memory, that is allocated per frame, of the codec: the encoding of
+each request type (and the prebuilt or preallocated frames, the server actually sends), the decoding of each
+response type, the mappings and the rejection of malformed frames.
+
+Runs on CPython and on the unix port of MicroPython, from the directory of the package:
+
+    python benchmarks/bench_codec.py [-n ITERATIONS] [--json] [--baseline FILE]
+    micropython benchmarks/bench_codec.py [-n ITERATIONS] [--json] [--baseline FILE]
+
+`--json` prints the results as json, save them as a baseline. `--baseline` compares the results with a saved
+baseline (of the same interpreter) and exits with 1, if a case got slower by more than `TOLERANCE` or
+allocates more memory than before.
+
+On MicroPython, the allocations are measured with `gc.mem_alloc()` while the garbage collector is disabled,
+that's every byte the hot path allocates on the device. On CPython, they are measured with tracemalloc, as the
+peak of the traced memory during a call. The numbers of both interpreters can't be compared.
+"""
+
+import sys
+import gc
+
+_here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, _here + "/..")
+
+import cn105_adapter
+
+if sys.implementation.name == "cpython":
+    import json
+    import time
+    import tracemalloc
+
+    def _ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def _ticks_diff(a, b):
+        return a - b
+
+if sys.implementation.name == "micropython":
+    import ujson as json
+    from utime import ticks_us as _ticks_us, ticks_diff as _ticks_diff
+
+ITERATIONS = 2000
+# Calls, that are measured for the allocations
+ALLOC_ITERATIONS = 50
+# A case is a regression, if its frames/s dropped by more than this
+TOLERANCE = 0.1
+
+
+def _frame(packet_type:int, payload:list) -> bytes:
+    raw = [cn105_adapter.cn105_adapter.START_BYTE, packet_type, 0x01, 0x30, len(payload)] + payload
+    return bytes(raw + [(0xfc - sum(raw)) & 0xff])
+
+
+def _page(rtype:int) -> list:
+    payload = [rtype] + [0x00] * 15
+    for i, pos in enumerate(cn105_adapter.schemas[rtype].positions):
+        payload[pos] = i + 1
+    return payload
+
+
+def _response(frame):
+    return cn105_adapter.CN105Response(frame)
+
+
+def _reject(frame):
+    try:
+        cn105_adapter.CN105Response(frame)
+    except ValueError:
+        return
+    raise RuntimeError("Malformed frame was accepted")
+
+
+def _decoder_case(data:bytes):
+    decoder = cn105_adapter.CN105FrameDecoder()
+    def run(arg):
+        decoder.feed(data)
+        frame = decoder.next_frame()
+        while frame is not None:
+            frame = decoder.next_frame()
+    return run
+
+
+def cases() -> list:
+    """All benchmark cases.
+
+    Returns:
+        list: (name, function, argument), each call of the function handles one frame (or one value).
+    """
+    # building the frames of the requests
+    result = [
+        ("encode.connect", lambda arg: cn105_adapter.CN105ConnectRequest().frame, None),
+    ]
+    for rtype in cn105_adapter.INFO_PAGES:
+        result.append((f"encode.get_0x{rtype:02x}", lambda rtype: cn105_adapter.CN105GetDataRequest(rtype).frame, rtype))
+    result.append(("encode.set_one", lambda data: cn105_adapter.CN105SetDataRequest(0x01, data).frame, {"power": 1}))
+    set_all = {"power": 1, "mode": 8, "tempSet": 15, "fan": 6, "vane": 7, "dir": 12}
+    result.append(("encode.set_all", lambda data: cn105_adapter.CN105SetDataRequest(0x01, data).frame, set_all))
+    # what the server does per request: it reads the prebuilt frames of the connect and get requests and writes
+    # the payload of a set request into its preallocated frame buffer
+    result.append(("cached.connect", lambda arg: cn105_adapter.CONNECT_REQUEST.frame, None))
+    for rtype in cn105_adapter.INFO_PAGES:
+        result.append((f"cached.get_0x{rtype:02x}", lambda rtype: cn105_adapter.GET_DATA_REQUESTS[rtype].frame, rtype))
+    buf = cn105_adapter.cn105_adapter._set_frame_buffer()
+    payload = cn105_adapter.CN105SetDataRequest(0x01, set_all).payload
+    result.append(("cached.set_all", lambda payload: cn105_adapter.cn105_adapter._write_set_frame(buf, payload), payload))
+
+    result.append(("decode.connect", _response, _frame(cn105_adapter.cn105_adapter.PT_CONNECT_RESPONSE, [0x00])))
+    result.append(("decode.set", _response, _frame(cn105_adapter.cn105_adapter.PT_SET_RESPONSE, [0x00] * 16)))
+    for rtype in cn105_adapter.INFO_PAGES:
+        frame = _frame(cn105_adapter.cn105_adapter.PT_GET_RESPONSE, _page(rtype))
+        result.append((f"decode.get_0x{rtype:02x}", _response, frame))
+    frame = _frame(cn105_adapter.cn105_adapter.PT_GET_RESPONSE, _page(0x02))
+    result.append(("decode.stream_0x02", _decoder_case(frame), None))
+
+    for name, mapping in [
+            ("power", cn105_adapter.powerMapping),
+            ("mode", cn105_adapter.modeMapping),
+            ("tempSet", cn105_adapter.tempSetMapping),
+            ("tempRoom", cn105_adapter.tempRoomMapping),
+            ("fan", cn105_adapter.fanMapping),
+            ("vane", cn105_adapter.vaneMapping),
+            ("dir", cn105_adapter.dirMapping)]:
+        raw, phys = mapping[len(mapping) - 1]
+        result.append((f"mapping.rawToPhys.{name}", lambda raw, mapping=mapping: cn105_adapter.rawToPhys(mapping, raw), raw))
+        result.append((f"mapping.physToRaw.{name}", lambda phys, mapping=mapping: cn105_adapter.physToRaw(mapping, phys), phys))
+
+    bad_crc = bytearray(frame)
+    bad_crc[-1] ^= 0xff
+    bad_header = bytearray(frame)
+    bad_header[3] = 0x31
+    result.append(("reject.crc", _reject, bytes(bad_crc)))
+    result.append(("reject.header", _reject, bytes(bad_header)))
+    result.append(("reject.short", _reject, frame[:6]))
+    result.append(("reject.long", _reject, frame + b"\x00"))
+    result.append(("reject.stream_noise", _decoder_case(bytes([0xfc, 0x00, 0x55, 0xaa]) + bytes(bad_crc) + frame), None))
+    return result
+
+
+def _allocated(fn, arg, n:int) -> float:
+    if sys.implementation.name == "micropython":
+        gc.collect()
+        gc.disable()
+        try:
+            before = gc.mem_alloc()
+            for i in range(n):
+                fn(arg)
+            return (gc.mem_alloc() - before) / n
+        finally:
+            gc.enable()
+    tracemalloc.start()
+    try:
+        total = 0
+        for i in range(n):
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            else:
+                # Python < 3.9, clearing the traces resets the peak, too
+                tracemalloc.clear_traces()
+            before = tracemalloc.get_traced_memory()[0]
+            fn(arg)
+            total += tracemalloc.get_traced_memory()[1] - before
+        return total / n
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn, arg, n:int=ITERATIONS) -> tuple:
+    """Measures one case.
+
+    Args:
+        fn (function): The function, that handles one frame.
+        arg: The argument of the function.
+        n (int, optional): The calls, that are timed. Defaults to `ITERATIONS`.
+
+    Returns:
+        tuple: (frames/s, bytes allocated per frame)
+    """
+    for i in range(10):
+        fn(arg)
+    gc.collect()
+    start = _ticks_us()
+    for i in range(n):
+        fn(arg)
+    elapsed = _ticks_diff(_ticks_us(), start)
+    fps = n * 1000000 / elapsed if elapsed > 0 else float("inf")
+    return fps, _allocated(fn, arg, min(n, ALLOC_ITERATIONS))
+
+
+def run(n:int=ITERATIONS) -> dict:
+    """Runs all cases.
+
+    Args:
+        n (int, optional): The calls, that are timed per case. Defaults to `ITERATIONS`.
+
+    Returns:
+        dict: case name -> {"fps": frames/s, "bytes": bytes allocated per frame}
+    """
+    results = {}
+    for name, fn, arg in cases():
+        fps, allocated = measure(fn, arg, n)
+        results[name] = {"fps": fps, "bytes": allocated}
+    return results
+
+
+def compare(results:dict, baseline:dict, tolerance:float=TOLERANCE) -> list:
+    """Compares results with a baseline.
+
+    Args:
+        results (dict): The results of `run()`.
+        baseline (dict): The results of an earlier run.
+        tolerance (float, optional): The allowed relative drop of the frames/s. Defaults to `TOLERANCE`.
+
+    Returns:
+        list: The names of the cases, that got slower or allocate more memory.
+    """
+    regressions = []
+    for name in results:
+        if name not in baseline:
+            continue
+        if results[name]["fps"] < baseline[name]["fps"] * (1 - tolerance) or \
+                results[name]["bytes"] > baseline[name]["bytes"] + 0.5:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv:list) -> int:
+    n = ITERATIONS
+    as_json = False
+    baseline = None
+    i = 0
+    while i < len(argv):
+        if argv[i] == "-n":
+            i += 1
+            n = int(argv[i])
+        elif argv[i] == "--json":
+            as_json = True
+        elif argv[i] == "--baseline":
+            i += 1
+            with open(argv[i]) as f:
+                baseline = json.load(f)
+        else:
+            print(f"Unknown argument {argv[i]}")
+            return 2
+        i += 1
+
+    results = run(n)
+    if as_json:
+        print(json.dumps(results))
+        return 0
+
+    regressions = compare(results, baseline) if baseline is not None else []
+    print(f"{sys.implementation.name}, {n} iterations")
+    print(f"{'case':28} {'frames/s':>12} {'bytes/frame':>12}")
+    for name in results:
+        line = f"{name:28} {results[name]['fps']:12.0f} {results[name]['bytes']:12.1f}"
+        if baseline is not None and name in baseline:
+            change = results[name]["fps"] / baseline[name]["fps"] - 1
+            line += f" {change*100:+7.1f}%"
+            if name in regressions:
+                line += " REGRESSION"
+        print(line)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,10 @@
-from .cn105_adapter import CN105Request, CN105Response, CN105Server, \
+from .cn105_adapter import CN105Request, CN105Response, CN105Server, CN105FrameDecoder, CN105Mapping, \
     CN105ConnectRequest, CN105GetDataRequest, CN105SetDataRequest, \
     powerMapping, modeMapping, tempSetMapping, tempRoomMapping, \
     fanMapping, vaneMapping, dirMapping, \
-    rawToPhys, physToRaw
+    rawToPhys, physToRaw, \
+    CONNECT_REQUEST, GET_DATA_REQUESTS, \
+    CN105Schema, fields, schemas, \
+    CN105Poller, INFO_PAGES, POLL_INTERVALS, MIN_POLL_INTERVALS, POLL_BACKOFF, \
+    STATE_DISCONNECTED, STATE_CONNECTING, STATE_CONNECTED, STATE_DEGRADED, \
+    CN105Histogram, CN105Metrics, RTT_BUCKETS_MS, QUEUE_WAIT_BUCKETS_MS
@@ -0,0 +1,137 @@
+"""CN105 bulk decoder
+
+Decodes large capture files (see `cn105_adapter.capture`) with NumPy. The file is memory-mapped and processed
+in chunks, so the memory doesn't depend on the size of the file: the frames of a chunk are validated (header,
+length and checksum) and the fields of `cn105_adapter.schemas` are extracted as columns, all without a loop
+over the frames in Python. This module only runs on CPython and requires NumPy.
+"""
+
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from .cn105_adapter import START_BYTE, PT_GET_RESPONSE, DIRECTION_RX, MAX_PACKET_LENGTH, \
+    CN105Mapping, field_mappings, schemas
+from .capture import CAPTURE_MAGIC, HEADER_SIZE, RECORD_SIZE
+
+# The layout of a record of a capture file
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<u8"),
+    ("direction", "u1"),
+    ("length", "u1"),
+    ("frame", "u1", (MAX_PACKET_LENGTH,)),
+])
+
+# Records, that are processed at once
+CHUNK_RECORDS = 1 << 20
+
+
+def load_capture(path:str) -> np.ndarray:
+    """Memory-maps the records of a capture file.
+
+    Args:
+        path (str): The capture file.
+
+    Raises:
+        ValueError: If the file is not a capture file.
+
+    Returns:
+        np.ndarray: The records (`RECORD_DTYPE`), nothing is read, until it is accessed.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError("Not a CN105 capture file")
+    n = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+    if n == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(n,))
+
+
+def valid_frames(records:np.ndarray) -> np.ndarray:
+    """Checks the frames of records: start byte, header, length and checksum.
+
+    Args:
+        records (np.ndarray): The records (`RECORD_DTYPE`).
+
+    Returns:
+        np.ndarray: A boolean mask, True for the valid frames.
+    """
+    frames = records["frame"]
+    payload_length = frames[:, 4].astype(np.intp)
+    valid = (frames[:, 0] == START_BYTE) & (frames[:, 2] == 0x01) & (frames[:, 3] == 0x30) \
+        & (payload_length <= 16) & (records["length"] == payload_length + 6)
+    # sum of the bytes in front of the checksum, the checksum is at position length + 5
+    end = np.minimum(payload_length + 5, MAX_PACKET_LENGTH - 1)
+    covered = np.arange(MAX_PACKET_LENGTH) < end[:, None]
+    crc = (0xfc - (frames * covered).sum(axis=1, dtype=np.uint32)) & 0xff
+    valid &= crc == np.take_along_axis(frames, end[:, None], axis=1)[:, 0]
+    return valid
+
+
+def decode_columns(path:str, rtype:int, names:List[str]=None, chunk:int=CHUNK_RECORDS) -> Dict[str, np.ndarray]:
+    """Extracts the fields of all valid get responses of a page.
+
+    Args:
+        path (str): The capture file.
+        rtype (int): The page (one of `cn105_adapter.INFO_PAGES`).
+        names (List[str], optional): The fields. Defaults to all fields of the page.
+        chunk (int, optional): Records, that are processed at once. Defaults to `CHUNK_RECORDS`.
+
+    Raises:
+        ValueError: If the page or a field is unknown.
+
+    Returns:
+        Dict[str, np.ndarray]: "timestamp" (microseconds, uint64) and one column (raw values, uint8) per field.
+    """
+    schema = schemas.get(rtype)
+    if schema is None:
+        raise ValueError(f"Unknown rtype 0x{rtype:02x}")
+    if names is None:
+        names = list(schema.names)
+    for name in names:
+        if name not in schema.index:
+            raise ValueError(f"Field {name} is not part of rtype 0x{rtype:02x}")
+    offsets = [5 + schema.positions[schema.index[name]] for name in names]
+
+    records = load_capture(path)
+    parts = {name: [] for name in ["timestamp"] + names}
+    for start in range(0, len(records), chunk):
+        block = records[start:start+chunk]
+        frames = block["frame"]
+        mask = (block["direction"] == DIRECTION_RX) & (frames[:, 1] == PT_GET_RESPONSE) & (frames[:, 5] == rtype)
+        mask &= valid_frames(block)
+        selected = frames[mask]
+        parts["timestamp"].append(np.asarray(block["timestamp"][mask]))
+        for name, offset in zip(names, offsets):
+            parts[name].append(selected[:, offset])
+
+    columns = {}
+    for name in parts:
+        dtype = np.uint64 if name == "timestamp" else np.uint8
+        columns[name] = np.concatenate(parts[name]) if parts[name] else np.zeros(0, dtype=dtype)
+    return columns
+
+
+def to_phys(name:str, column:np.ndarray) -> np.ndarray:
+    """Converts a column of raw values to physical values, with the mapping of the field.
+
+    Args:
+        name (str): The field.
+        column (np.ndarray): The raw values.
+
+    Returns:
+        np.ndarray: Numbers (float, NaN for unknown values) or strings (object, None for unknown values).
+            Fields without a mapping are returned unchanged.
+    """
+    mapping = field_mappings.get(name)
+    if mapping is None:
+        return column
+    if not isinstance(mapping, CN105Mapping):
+        mapping = CN105Mapping(mapping)
+    table = list(mapping.table) + [None] * (256 - len(mapping.table))
+    if all(value is None or isinstance(value, (int, float)) for value in table):
+        lookup = np.array([np.nan if value is None else value for value in table], dtype=float)
+    else:
+        lookup = np.array(table, dtype=object)
+    return lookup[column]
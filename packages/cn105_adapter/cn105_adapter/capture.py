@@ -0,0 +1,264 @@
+"""CN105 capture
+
+Records the frames on a CN105 bus into a compact, append-only binary file, and replays them.
+
+A capture file starts with a 32 byte header (`CAPTURE_MAGIC`, version), followed by records of 32 bytes each
+(`RECORD_FORMAT`, little endian): a monotonic timestamp in microseconds (uint64), the direction (uint8,
+`DIRECTION_TX` or `DIRECTION_RX`), the length of the frame (uint8) and the frame, padded to 22 bytes.
+"""
+
+import sys
+
+if sys.implementation.name == "cpython":
+    import asyncio
+    import struct
+    import time
+    from typing import List
+
+    def _ticks_us():
+        return time.monotonic_ns() // 1000
+
+    def _ticks_diff(a, b):
+        return a - b
+
+if sys.implementation.name == "micropython":
+    import uasyncio as asyncio
+    import ustruct as struct
+    from utime import ticks_us as _ticks_us, ticks_diff as _ticks_diff
+
+from .cn105_adapter import MAX_PACKET_LENGTH, DIRECTION_TX, DIRECTION_RX, CN105FrameDecoder, CN105Request, CN105Response
+
+CAPTURE_MAGIC = b"CN105CAP"
+CAPTURE_VERSION = 1
+RECORD_FORMAT = "<QBB22s"
+RECORD_SIZE = 32
+HEADER_SIZE = 32
+
+
+class _Clock:
+    # microseconds since the clock was created, without the wrap around of ticks_us on MicroPython
+    def __init__(self):
+        self._last = _ticks_us()
+        self._now = 0
+
+    def now(self) -> int:
+        ticks = _ticks_us()
+        self._now += _ticks_diff(ticks, self._last)
+        self._last = ticks
+        return self._now
+
+
+class CN105CaptureWriter:
+    """Appends the frames of a CN105Server to a capture file.
+
+        Records are collected in a preallocated buffer and written, when it is full (or on `flush()`),
+        so the bus isn't slowed down by a write per frame.
+
+        Args:
+            path (str): The capture file. If it exists, the records are appended.
+            buffer_records (int, optional): Records, that are buffered before they are written. Defaults to 16.
+    """
+    def __init__(self, path:str, buffer_records:int=16):
+        """Opens the capture file.
+
+        Args:
+            path (str): The capture file. If it exists, the records are appended.
+            buffer_records (int, optional): Records, that are buffered before they are written. Defaults to 16.
+        """
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            header = bytearray(HEADER_SIZE)
+            header[0:8] = CAPTURE_MAGIC
+            header[8] = CAPTURE_VERSION
+            header[9] = RECORD_SIZE
+            self.file.write(header)
+        self.clock = _Clock()
+        # continue after the last timestamp, so the timestamps of a file stay monotonic
+        self.offset = self._last_timestamp(path)
+        self._buf = bytearray(RECORD_SIZE * buffer_records)
+        self._n = 0
+        self.records = 0
+
+    def _last_timestamp(self, path:str) -> int:
+        size = self.file.tell()
+        if size < HEADER_SIZE + RECORD_SIZE:
+            return 0
+        with open(path, "rb") as f:
+            f.seek(size - RECORD_SIZE)
+            return struct.unpack(RECORD_FORMAT, f.read(RECORD_SIZE))[0] + 1
+
+    def record(self, direction:int, frame):
+        """Records a frame.
+
+        Args:
+            direction (int): `DIRECTION_TX` or `DIRECTION_RX`.
+            frame (bytes): The frame.
+        """
+        n = len(frame)
+        if n > MAX_PACKET_LENGTH:
+            n = MAX_PACKET_LENGTH
+        struct.pack_into(RECORD_FORMAT, self._buf, self._n * RECORD_SIZE, self.offset + self.clock.now(),
+            direction, n, bytes(frame[:n]))
+        self._n += 1
+        self.records += 1
+        if self._n * RECORD_SIZE == len(self._buf):
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered records.
+        """
+        if self._n > 0:
+            self.file.write(memoryview(self._buf)[:self._n * RECORD_SIZE])
+            self._n = 0
+        self.file.flush()
+
+    def close(self):
+        """Writes the buffered records and closes the file.
+        """
+        self.flush()
+        self.file.close()
+
+
+def read_capture(path:str):
+    """Reads the records of a capture file.
+
+    Args:
+        path (str): The capture file.
+
+    Raises:
+        ValueError: If the file is not a capture file.
+
+    Yields:
+        tuple: (timestamp in microseconds, direction, frame)
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+        if header[0:8] != CAPTURE_MAGIC:
+            raise ValueError("Not a CN105 capture file")
+        while True:
+            record = f.read(RECORD_SIZE)
+            if len(record) < RECORD_SIZE:
+                return
+            timestamp, direction, n, frame = struct.unpack(RECORD_FORMAT, record)
+            yield timestamp, direction, frame[:n]
+
+
+class CN105Replay:
+    """Replays a capture file.
+
+        `responses()` feeds the received frames through a frame decoder, as fast as possible. `run()` replays
+        the whole traffic through a CN105Server: the recorded requests are submitted at their recorded
+        times (divided by `speed`) and the replay answers them with the recorded responses, after the
+        recorded delay. So the decoder and the scheduler see the traffic, as it was on the bus.
+
+        Args:
+            path (str): The capture file.
+            speed (float, optional): Replay speed, 1 is real time, 0 is as fast as possible. Defaults to 1.
+    """
+    def __init__(self, path:str, speed:float=1):
+        """Initializes the replay.
+
+        Args:
+            path (str): The capture file.
+            speed (float, optional): Replay speed, 1 is real time, 0 is as fast as possible. Defaults to 1.
+        """
+        self.path = path
+        self.speed = speed
+        self.decoder = CN105FrameDecoder()
+        # request frame -> recorded answers (delay in seconds, frame), in the order of the capture
+        self._answers = {}
+        self._rx = bytearray()
+        self._rx_event = None
+        # requests, that weren't recorded (e.g. set requests, that were coalesced differently)
+        self.unmatched = 0
+
+    def frames(self):
+        """The records of the capture file, see `read_capture`."""
+        return read_capture(self.path)
+
+    def responses(self):
+        """Decodes all received frames of the capture.
+
+        Yields:
+            CN105Response: The responses.
+        """
+        for timestamp, direction, frame in self.frames():
+            if direction == DIRECTION_RX:
+                for packet in self.decoder.decode(frame):
+                    yield CN105Response(packet)
+
+    def _delay(self, us:int) -> float:
+        if self.speed == 0:
+            return 0
+        return us / 1000000 / self.speed
+
+    async def run(self, server) -> List[CN105Response]:
+        """Replays the traffic through a server. The replay is used as reader and writer of the server.
+
+        This is a coroutine.
+
+        Args:
+            server (CN105Server): The server.
+
+        Returns:
+            List[CN105Response]: The responses to the replayed requests (None, if a request failed).
+        """
+        server.sreader = self
+        server.swriter = self
+        self._rx_event = asyncio.Event()
+        requests = []
+        request = None
+        for timestamp, direction, frame in self.frames():
+            if direction == DIRECTION_TX:
+                request = (timestamp, frame)
+                requests.append(request)
+            elif request is not None:
+                self._answers.setdefault(request[1], []).append((self._delay(timestamp - request[0]), frame))
+        if not requests:
+            return []
+        start = requests[0][0]
+        loop_start = _Clock()
+        tasks = []
+        for timestamp, frame in requests:
+            delay = self._delay(timestamp - start) - loop_start.now() / 1000000
+            if delay > 0:
+                await asyncio.sleep(delay)
+            request = CN105Request(frame[1], list(frame[5:5+frame[4]]))
+            tasks.append(asyncio.create_task(self._submit(server, request)))
+        return [await task for task in tasks]
+
+    async def _submit(self, server, request:CN105Request) -> CN105Response:
+        try:
+            return await server._send_packet_and_wait_for_response(request)
+        except ValueError:
+            return None
+
+    def write(self, buf):
+        answers = self._answers.get(bytes(buf))
+        if not answers:
+            self.unmatched += 1
+            return
+        delay, frame = answers.pop(0)
+        asyncio.create_task(self._answer(delay, frame))
+
+    async def _answer(self, delay:float, frame:bytes):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._rx += frame
+        self._rx_event.set()
+
+    async def drain(self):
+        pass
+
+    async def read(self, n:int=-1) -> bytes:
+        while not self._rx:
+            self._rx_event.clear()
+            await self._rx_event.wait()
+        if n < 0:
+            n = len(self._rx)
+        raw = bytes(self._rx[:n])
+        self._rx = self._rx[n:]
+        return raw
+
+    def close(self):
+        pass
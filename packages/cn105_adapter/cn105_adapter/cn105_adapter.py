@@ -7,14 +7,28 @@ import sys
 
 if sys.implementation.name == "cpython":
     import asyncio
-    import platform
+    import time
+    from random import getrandbits
     from typing import Dict, List, Tuple
-    if platform.node() == "Tobias-DellXPS":
-        from serial_asyncio import open_serial_connection
+
+    def _ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def _ticks_diff(a, b):
+        return a - b
+
+    def _ticks_add(a, b):
+        return a + b
 
 if sys.implementation.name == "micropython":
     import uasyncio as asyncio
-    from umachine import UART
+    try:
+        from umachine import UART
+    except ImportError:
+        # the unix port has no UART, the codec still works (e.g. for the benchmarks)
+        UART = None
+    from urandom import getrandbits
+    from utime import ticks_ms as _ticks_ms, ticks_diff as _ticks_diff, ticks_add as _ticks_add
 
 START_BYTE = 0xfc
 PT_CONNECT_REQUEST = 0x5a
@@ -24,7 +38,66 @@ PT_GET_RESPONSE = 0x62
 PT_SET_REQUEST = 0x41
 PT_SET_RESPONSE = 0x61
 
+RESPONSE_TYPES = {
+    PT_CONNECT_REQUEST: PT_CONNECT_RESPONSE,
+    PT_GET_REQUEST: PT_GET_RESPONSE,
+    PT_SET_REQUEST: PT_SET_RESPONSE,
+}
+
+# 2400 baud, 8E1 -> 11 bits per byte; the longest packet has 16 bytes payload
+BAUDRATE = 2400
+MAX_PACKET_LENGTH = 22
+PACKET_TIME_MS = MAX_PACKET_LENGTH * 11 * 1000 // BAUDRATE
+# the UART read timeout, after the response has been sent
+RESPONSE_TIMEOUT_MS = 50
+TRANSACTION_TIME_MS = 2 * PACKET_TIME_MS + RESPONSE_TIMEOUT_MS
+
+# Directions of a recorded frame (see cn105_adapter.capture)
+DIRECTION_TX = 0
+DIRECTION_RX = 1
+
+# Connection states of a CN105Server
+STATE_DISCONNECTED = "disconnected"
+STATE_CONNECTING = "connecting"
+STATE_CONNECTED = "connected"
+# responses got lost recently, but the device still answers
+STATE_DEGRADED = "degraded"
+
+# A transaction is retried this often, if its response is missing or broken
+MAX_RETRIES = 2
+# Delay before a retry, plus a random jitter of up to RETRY_JITTER_MS
+RETRY_DELAY_MS = 50
+RETRY_JITTER_MS = 50
+# Failed transactions in a row, after which the connection is considered lost
+MAX_FAILURES = 3
+
+# Commands (connect, set) go ahead of background polling (get)
+PRIORITY_COMMAND = 0
+PRIORITY_POLL = 1
+
+# Upper bounds (ms) of the buckets of the round trip time histograms, a transaction takes
+# about 2 * PACKET_TIME_MS on the wire
+RTT_BUCKETS_MS = (100, 150, 200, 250, 300, 400, 500, 1000)
+# Upper bounds (ms) of the buckets of the queue wait histogram
+QUEUE_WAIT_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# The names of the request types in the metrics
+PACKET_TYPE_NAMES = {
+    PT_CONNECT_REQUEST: "connect",
+    PT_GET_REQUEST: "get",
+    PT_SET_REQUEST: "set",
+}
+
+# The payload layout of each request type: field -> (position in the payload, flag in byte 1 of a set request).
+# Set requests (0x01) write the fields of the settings page (0x02).
 fields = {
+    0x01:{
+        "power": (3, 0x01),
+        "mode": (4, 0x02),
+        "tempSet": (5, 0x04),
+        "fan": (6, 0x08),
+        "vane": (7, 0x10),
+        "dir": (10, 0x80),
+    },
     0x02:{
         "power": (3, 0x01),
         "mode": (4, 0x02),
@@ -35,40 +108,117 @@ fields = {
     },
     0x03:{
         "tempRoom": (3, 0x00),
-    }
+    },
+    # The meaning of the following pages is taken from other CN105 implementations,
+    # it may differ between models.
+    0x04:{
+        "errorCode": (4, 0x00),
+    },
+    0x05:{
+        "timerMode": (3, 0x00),
+        "timerOnSet": (4, 0x00),
+        "timerOffSet": (5, 0x00),
+        "timerOnRemaining": (6, 0x00),
+        "timerOffRemaining": (7, 0x00),
+    },
+    0x06:{
+        "compressorFrequency": (3, 0x00),
+        "operating": (4, 0x00),
+    },
+    0x09:{
+        "standby": (3, 0x00),
+        "stage": (4, 0x00),
+    },
 }
 
-powerMapping = [
+# The pages, that can be requested with a get request
+INFO_PAGES = (0x02, 0x03, 0x04, 0x05, 0x06, 0x09)
+
+# Seconds between two get requests of a page, while the page doesn't change. This is the longest time,
+# until a change, that wasn't made through the server (e.g. with the IR remote), shows up: 5 s for the
+# settings (0x02), like the fixed poll interval before. The other pages change slowly or are informational,
+# they are polled less often, e.g. the room temperature (0x03) can lag by up to 30 s.
+POLL_INTERVALS = {
+    0x02: 5,
+    0x03: 30,
+    0x04: 120,
+    0x05: 120,
+    0x06: 60,
+    0x09: 120,
+}
+
+# Seconds between two get requests of a page, right after a set request or a change of the page
+MIN_POLL_INTERVALS = {
+    0x02: 1,
+    0x03: 5,
+    0x04: 10,
+    0x05: 10,
+    0x06: 2,
+    0x09: 5,
+}
+
+# Factor, by which the interval of an unchanged page grows
+POLL_BACKOFF = 2
+
+class CN105Mapping(list):
+    """A mapping between raw and physical values: a list of (raw, phys) tuples.
+
+        On creation, the list is compiled into a table, that is indexed by the raw value, and a dict
+        from the physical value (upper case, if it's a string) to the raw value. Don't modify the
+        list afterwards, the tables would be outdated.
+
+        Args:
+            items (list[tuple]): The (raw, phys) tuples.
+    """
+    def __init__(self, items:List[Tuple[int, str or int]]):
+        """Initializes the mapping and compiles the lookup tables.
+
+        Args:
+            items (List[Tuple[int, str or int]]): The (raw, phys) tuples.
+        """
+        super().__init__(items)
+        table = [None] * (max([t[0] for t in items]) + 1)
+        reverse = {}
+        for raw, phys in items:
+            table[raw] = phys
+            reverse[phys.upper() if type(phys) is str else phys] = raw
+        self.table = tuple(table)
+        self.reverse = reverse
+
+powerMapping = CN105Mapping([
     (0x00, "OFF"),
     (0x01, "ON")
-]
+])
 
-modeMapping = [
+modeMapping = CN105Mapping([
     (0x01, "HEAT"),
     (0x02, "DRY"),
     (0x03, "COOL"),
     (0x07, "FAN"),
     (0x08, "AUTO")
-]
+])
 
-tempSetMapping = [
+# bit 0x10 adds half a degree
+tempSetMapping = CN105Mapping([
     (31-i, i) for i in range(16, 32)
-]
+] + [
+    (0x10 | (31-i), i + 0.5) for i in range(16, 32)
+])
 
-tempRoomMapping = [
+tempRoomMapping = CN105Mapping([
     (i, 10+i) for i in range(0, 31)
-]
+])
 
-fanMapping = [
+fanMapping = CN105Mapping([
     (0x00, "AUTO"),
     (0x01, "QUIET"),
     (0x02, "1"),
     (0x03, "2"),
     (0x05, "3"),
     (0x06, "4")
-]
+])
 
-vaneMapping = [
+vaneMapping = CN105Mapping([
     (0x00, "AUTO"),
     (0x01, "1"),
     (0x02, "2"),
@@ -76,9 +226,9 @@ vaneMapping = [
     (0x04, "4"),
     (0x05, "5"),
     (0x07, "SWING")
-]
+])
 
-dirMapping = [
+dirMapping = CN105Mapping([
     (0x00, "NA"),
     (0x01, "<<"),
     (0x02, "<"),
@@ -87,7 +237,7 @@ dirMapping = [
     (0x05, ">>"),
     (0x08, "<>"),
     (0x0C, "SWING")
-]
+])
 
 def rawToPhys(mapping: List[Tuple[int, str or int]], raw:int) -> str or int:
     """Converts the raw value to a physical value.
@@ -106,6 +256,11 @@ def rawToPhys(mapping: List[Tuple[int, str or int]], raw:int) -> str or int:
         "OFF"
         
     """
+    if isinstance(mapping, CN105Mapping):
+        table = mapping.table
+        if 0 <= raw < len(table):
+            return table[raw]
+        return None
     for t in mapping:
         if t[0] == raw:
             return t[1]
@@ -126,6 +281,10 @@ def physToRaw(mapping, phys:str or int):
         >>> cn105_adapter.physToRaw(cn105_adapter.powerMapping, "on")
         1
     """
+    if isinstance(mapping, CN105Mapping):
+        if type(phys) is str:
+            phys = phys.upper()
+        return mapping.reverse.get(phys)
     for t in mapping:
         if type(phys) is str:
             if t[1] == phys.upper():
@@ -135,6 +294,132 @@ def physToRaw(mapping, phys:str or int):
                 return t[0]
         
 
+field_mappings = {
+    "power": powerMapping,
+    "mode": modeMapping,
+    "tempSet": tempSetMapping,
+    "tempRoom": tempRoomMapping,
+    "fan": fanMapping,
+    "vane": vaneMapping,
+    "dir": dirMapping,
+}
+
+
+class CN105Schema:
+    """The compiled payload layout of one request type. You shouldn't have to create one by yourself,
+        use `cn105_adapter.schemas[rtype]`.
+
+        The fields are stored in parallel tuples (names, positions, flags, mappings), so a payload is
+        decoded or encoded in a single pass, without looking anything up in the `fields` table.
+
+        Args:
+            rtype (int): The request type.
+            layout (dict): The fields, name -> (position in the payload, flag).
+    """
+    def __init__(self, rtype:int, layout:Dict):
+        """Compiles the layout.
+
+        Args:
+            rtype (int): The request type.
+            layout (Dict): The fields, name -> (position in the payload, flag).
+        """
+        self.rtype = rtype
+        self.names = tuple(layout)
+        self.positions = tuple([layout[name][0] for name in self.names])
+        self.flags = tuple([layout[name][1] for name in self.names])
+        self.mappings = tuple([field_mappings.get(name) for name in self.names])
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def record(self, raw, offset:int=5) -> tuple:
+        """Reads all fields of a packet.
+
+        Args:
+            raw (bytes or list[int]): The packet (or only the payload, with offset 0).
+            offset (int, optional): The position of the payload in raw. Defaults to 5.
+
+        Returns:
+            tuple: The raw values, in the order of `names`.
+        """
+        return tuple([raw[offset + pos] for pos in self.positions])
+
+    def decode(self, raw, offset:int=5, data:Dict=None) -> Dict:
+        """Reads all fields of a packet into a dict.
+
+        Args:
+            raw (bytes or list[int]): The packet (or only the payload, with offset 0).
+            offset (int, optional): The position of the payload in raw. Defaults to 5.
+            data (Dict, optional): The dict to fill. Defaults to a new one.
+
+        Returns:
+            Dict: field name -> raw value.
+        """
+        if data is None:
+            data = {}
+        names = self.names
+        positions = self.positions
+        for i in range(len(names)):
+            data[names[i]] = raw[offset + positions[i]]
+        return data
+
+    def encode(self, data:Dict, payload:List[int]) -> List[int]:
+        """Writes the given fields into a payload and sets their flags.
+
+        Args:
+            data (Dict): field name -> raw value.
+            payload (List[int]): The payload (16 bytes, byte 0 is the request type).
+
+        Raises:
+            ValueError: If data contains a field, that is not part of this layout.
+
+        Returns:
+            List[int]: The payload.
+        """
+        index = self.index
+        for key in data:
+            i = index.get(key)
+            if i is None:
+                raise ValueError(f"Key {key} is not allowed in this request")
+            payload[1] |= self.flags[i]
+            payload[self.positions[i]] = data[key]
+        return payload
+
+    def merge(self, payload:List[int], update:List[int]) -> List[int]:
+        """Copies the fields, that are flagged in the update, into the payload.
+
+        Args:
+            payload (List[int]): The payload of a set request, that is modified.
+            update (List[int]): The payload of a newer set request.
+
+        Returns:
+            List[int]: The payload.
+        """
+        flags = update[1]
+        for i in range(len(self.flags)):
+            if flags & self.flags[i]:
+                payload[1] |= self.flags[i]
+                payload[self.positions[i]] = update[self.positions[i]]
+        return payload
+
+    def to_phys(self, data:Dict) -> Dict:
+        """Converts raw field values to physical values.
+
+        Args:
+            data (Dict): field name -> raw value.
+
+        Returns:
+            Dict: field name -> physical value (None, if unknown).
+        """
+        phys = {}
+        for key in data:
+            i = self.index.get(key)
+            if i is not None and self.mappings[i] is not None:
+                phys[key] = rawToPhys(self.mappings[i], data[key])
+        return phys
+
+
+schemas = {rtype: CN105Schema(rtype, layout) for rtype, layout in fields.items()}
+
+
 class CN105Request:
     """A Basic Request for the Mitsubishi CN105-Protocol. You shouldn't have to create one by yourself.
 
@@ -157,9 +442,17 @@ class CN105Request:
             0x01, 0x30,
             len(payload)] + payload
         self.raw += self._crc()
+        self._frame = None
     
     def _crc(self):
-        return [0xfc - (sum(self.raw) & 0xff)]
+        return [(0xfc - sum(self.raw)) & 0xff]
+
+    @property
+    def frame(self) -> bytes:
+        """The packet as it is sent on the wire. It is built on first access and then reused."""
+        if self._frame is None:
+            self._frame = bytes(self.raw)
+        return self._frame
 
     def __str__(self):
         return f"CN105Request(type=0x{self.packet_type:02x}, payload=[{', '.join(f'0x{x:02x}' for x in self.payload)}])"
@@ -176,59 +469,99 @@ class CN105GetDataRequest(CN105Request):
     """A Get Data Request for the Mitsubishi CN105-Protocol. You shouldn't have to create one by yourself.
 
         Args:
-            rtype (int, optional): Type of the Get Date request, 0x02 or 0x03. Defaults to 0x02.
+            rtype (int, optional): Type of the Get Date request, one of `INFO_PAGES`. Defaults to 0x02.
     """
     def __init__(self, rtype:int=0x02):
         """Initializes the Get Data Request.
 
         Args:
-            rtype (int, optional): Type of the Get Date request, 0x02 or 0x03. Defaults to 0x02.
+            rtype (int, optional): Type of the Get Date request, one of `INFO_PAGES`. Defaults to 0x02.
         """
         super().__init__(packet_type=PT_GET_REQUEST, payload=[rtype] + [0x00]*15)
 
 
+def _set_frame_buffer() -> bytearray:
+    # a frame of a set request, with the header and room for the payload and the checksum
+    return bytearray([START_BYTE, PT_SET_REQUEST, 0x01, 0x30, 0x10] + [0x00]*17)
+
+
+def _write_set_frame(buf:bytearray, payload) -> bytearray:
+    # writes the payload of a set request and its checksum into a frame buffer
+    crc = START_BYTE + PT_SET_REQUEST + 0x01 + 0x30 + 0x10
+    for i in range(16):
+        buf[5+i] = payload[i]
+        crc += payload[i]
+    buf[21] = (0xfc - crc) & 0xff
+    return buf
+
+
 class CN105SetDataRequest(CN105Request):
     """A Set Data Request for the Mitsubishi CN105-Protocol. You shouldn't have to create one by yourself.
 
+        Only the payload is encoded (in place, into a bytearray). The server writes it into a preallocated
+        frame, when it is sent, `frame` and `raw` are built on demand.
+
         Args:
             rtype (int, optional): Type of the Get Date request. Currently, only 0x02 is allowed. Defaults to 0x02.
             data (dict, optional): Data, that is set on the in this packet. Defaults to None.
+            payload (bytearray, optional): An already encoded payload, instead of rtype and data. Defaults to None.
 
         Raises:
             ValueError: If the dict is empty.
             ValueError: If the dict contains a key, that is not allowed in this packet.
     """
-    def __init__(self, rtype:int=0x02, data:Dict=None):
+    def __init__(self, rtype:int=0x02, data:Dict=None, payload:bytearray=None):
         """Initializes the Set Data Request.
 
         Args:
             rtype (int, optional): Type of the Get Date request. Currently, only 0x02 is allowed. Defaults to 0x02.
             data (Dict, optional): Data, that is set on the in this packet. Defaults to None.
+            payload (bytearray, optional): An already encoded payload, instead of rtype and data. Defaults to None.
 
         Raises:
             ValueError: If the dict is empty.
             ValueError: If the dict contains a key, that is not allowed in this packet.
         """
-        if (data is None) or (data == {}):
-            raise ValueError("Empty data dict is not allowed")
-        
-        payload = [rtype] + [0x00]*15
-        for key in data:
-            if key not in fields[rtype]:
-                raise ValueError(f"Key {key} is not allowed in this request")
-            
-            payload[1] |= fields[rtype][key][1]
+        if payload is None:
+            if (data is None) or (data == {}):
+                raise ValueError("Empty data dict is not allowed")
 
-            pos = fields[rtype][key][0]
-            payload[pos] = data[key]
+            if rtype not in schemas:
+                raise ValueError(f"Request type 0x{rtype:02x} can't be set")
 
-        super().__init__(packet_type=PT_SET_REQUEST, payload=payload)
+            payload = bytearray(16)
+            payload[0] = rtype
+            schemas[rtype].encode(data, payload)
+        self.packet_type = PT_SET_REQUEST
+        self.payload = payload
+        self._frame = None
+
+    @property
+    def raw(self) -> List[int]:
+        """The packet as a list (it is created on each access)."""
+        return list(self.frame)
+
+    @property
+    def frame(self) -> bytes:
+        """The packet as it is sent on the wire. It is built on first access and then reused."""
+        if self._frame is None:
+            self._frame = bytes(_write_set_frame(_set_frame_buffer(), self.payload))
+        return self._frame
+
+# Requests, that never change, are built once and reused
+CONNECT_REQUEST = CN105ConnectRequest()
+GET_DATA_REQUESTS = {rtype: CN105GetDataRequest(rtype=rtype) for rtype in INFO_PAGES}
+for _request in [CONNECT_REQUEST] + list(GET_DATA_REQUESTS.values()):
+    _request.frame
 
 class CN105Response:
     """A Response from the Mitsubishi CN105-Protocol. You shouldn't have to create one by yourself.
 
+        The packet is parsed in place: the fields are read at their offsets in `raw`, nothing is copied.
+        If you pass a memoryview or bytearray, don't modify it as long as you use the response.
+
         Args:
-            raw (bytes or list[int]): The data, that was received from the device.
+            raw (bytes, bytearray, memoryview or list[int]): The data, that was received from the device.
 
         Raises:
             ValueError: If the raw content couldn't be parsed.
@@ -237,52 +570,77 @@ class CN105Response:
         """Initializes the Response and parses the payload.
 
         Args:
-            raw (bytes or List[int]): The data, that was received from the device.
+            raw (bytes, bytearray, memoryview or List[int]): The data, that was received from the device.
 
         Raises:
             ValueError: If the raw content couldn't be parsed.
         """
-        if type(raw) is bytes:
-            raw = [int(x) for x in raw]
         self.raw = raw
         self.data = {}
+        self._payload = None
 
-        if len(raw) < 7:
+        length = len(raw)
+        if length < 7:
             raise ValueError("Packet incomplete (shorter than 7 bytes)")
 
         if raw[0] != START_BYTE:
             raise ValueError("Packet doesn't start with expected start byte")
 
-        if raw[1] not in [PT_CONNECT_RESPONSE, PT_GET_RESPONSE, PT_SET_RESPONSE]:
+        packet_type = raw[1]
+        if packet_type != PT_GET_RESPONSE and packet_type != PT_SET_RESPONSE and packet_type != PT_CONNECT_RESPONSE:
             raise ValueError("Unknown packet type")
 
-        self.packet_type = raw[1]
+        self.packet_type = packet_type
 
-        if raw[2:4] != [0x01, 0x30]:
+        if raw[2] != 0x01 or raw[3] != 0x30:
             raise ValueError("Wrong Header")
         
         payload_length = raw[4]
         
-        if len(raw) < payload_length + 6:
+        if length < payload_length + 6:
             raise ValueError("Packet so short")
         
-        if len(raw) > payload_length + 6:
+        if length > payload_length + 6:
             raise ValueError("Packet so long")
         
-        self.payload = raw[5:5+payload_length]
+        self.payload_length = payload_length
 
         if not(self._check_crc()):
             raise ValueError("Wrong CRC")
 
         self._parse_payload()
 
+    @property
+    def payload(self) -> List[int]:
+        """The payload as a list. It is created on first access and then reused."""
+        if self._payload is None:
+            raw = self.raw
+            self._payload = [raw[i] for i in range(5, 5 + self.payload_length)]
+        return self._payload
+
+    def same_payload(self, payload:bytes) -> bool:
+        """Compares the payload with a copy of an earlier one, in place, without creating a list.
+
+        Args:
+            payload (bytes): The earlier payload.
+
+        Returns:
+            bool: If the payloads are equal.
+        """
+        n = self.payload_length
+        if payload is None or len(payload) != n:
+            return False
+        raw = self.raw
+        for i in range(n):
+            if raw[5+i] != payload[i]:
+                return False
+        return True
+
     def _parse_payload(self):
         if self.packet_type == PT_GET_RESPONSE:
-            rtype = self.payload[0]
-            if self.payload[0] in [0x02, 0x03]:
-                for key in fields[rtype]:
-                    pos = fields[rtype][key][0]
-                    self.data[key] = self.payload[pos]
+            schema = schemas.get(self.raw[5])
+            if schema is not None:
+                schema.decode(self.raw, 5, self.data)
         elif self.packet_type == PT_SET_RESPONSE:
             pass
         
@@ -290,109 +648,784 @@ class CN105Response:
         return f"CN105Response(type=0x{self.packet_type:02x}, payload=[{', '.join(f'0x{x:02x}' for x in self.payload)}])"
 
     def _check_crc(self):
-        return 0xfc - (sum(self.raw[:-1]) & 0xff) == self.raw[-1]
+        raw = self.raw
+        last = len(raw) - 1
+        return (0xfc - sum(raw) + raw[last]) & 0xff == raw[last]
+
+
+class CN105FrameDecoder:
+    """Splits the bytes received from the UART into CN105 packets.
+
+        Received bytes are pushed into a reusable buffer with `feed`, `next_frame` returns the complete
+        packets one by one. Each packet is located by the start byte and its length byte and has to
+        have a valid header and checksum. Line noise and broken packets are skipped by scanning for
+        the next start byte (resync).
+
+        Args:
+            size (int, optional): Size of the receive buffer in bytes. Defaults to 64.
+    """
+    def __init__(self, size:int=64):
+        """Initializes the decoder.
+
+        Args:
+            size (int, optional): Size of the receive buffer in bytes. Defaults to 64.
+        """
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self.resyncs = 0
+        self.crc_errors = 0
+
+    def reset(self):
+        """Drops all buffered bytes."""
+        self._start = 0
+        self._end = 0
+
+    def feed(self, data: bytes):
+        """Pushes received bytes into the buffer.
+
+        If the buffer overflows, the oldest bytes are dropped.
+
+        Args:
+            data (bytes): The received bytes.
+        """
+        size = len(self._buf)
+        n = len(data)
+        if n > size:
+            data = data[n-size:]
+            n = size
+            self._start = self._end
+            self.resyncs += 1
+        if self._end + n > size:
+            pending = self._end - self._start
+            if pending + n > size:
+                # drop the oldest bytes
+                self._start += pending + n - size
+                pending = size - n
+                self.resyncs += 1
+            self._mv[0:pending] = self._mv[self._start:self._end]
+            self._start = 0
+            self._end = pending
+        self._mv[self._end:self._end+n] = data
+        self._end += n
+
+    def next_frame(self) -> bytes:
+        """Returns the next complete packet in the buffer.
+
+        Returns:
+            bytes: The packet, or None if there is no complete packet (yet).
+        """
+        buf = self._buf
+        while True:
+            start = self._start
+            end = self._end
+            while start < end and buf[start] != START_BYTE:
+                start += 1
+            if start != self._start:
+                self._start = start
+                self.resyncs += 1
+            if end - start < 5:
+                return None
+            length = buf[start+4]
+            if buf[start+2] != 0x01 or buf[start+3] != 0x30 or length > 16:
+                # not a packet, search for the next start byte
+                self._start = start + 1
+                continue
+            if end - start < length + 6:
+                return None
+            crc = 0
+            for i in range(start, start + length + 5):
+                crc += buf[i]
+            if (0xfc - crc) & 0xff != buf[start+length+5]:
+                self._start = start + 1
+                self.crc_errors += 1
+                continue
+            self._start = start + length + 6
+            return bytes(self._mv[start:self._start])
+
+    def decode(self, data: bytes):
+        """Pushes received bytes into the buffer and yields all complete packets.
+
+        Args:
+            data (bytes): The received bytes.
+
+        Yields:
+            bytes: The packets.
+        """
+        self.feed(data)
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+
+def _merge_set_requests(queued: CN105Request, request: CN105Request) -> CN105Request:
+    # The fields, that are flagged in the newer request, overwrite the ones of the queued request
+    payload = schemas[queued.payload[0]].merge(bytearray(queued.payload), request.payload)
+    return CN105SetDataRequest(payload=payload)
+
+
+class CN105Histogram:
+    """A histogram with fixed buckets, e.g. for times in ms. Adding a value doesn't allocate memory.
+
+        Args:
+            buckets (tuple[int]): The upper bounds of the buckets, ascending. Larger values are counted in an extra bucket.
+    """
+    def __init__(self, buckets):
+        """Initializes an empty histogram.
+
+        Args:
+            buckets (tuple[int]): The upper bounds of the buckets, ascending. Larger values are counted in an extra bucket.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value:int):
+        """Adds a value.
+
+        Args:
+            value (int): The value.
+        """
+        buckets = self.buckets
+        i = 0
+        n = len(buckets)
+        while i < n and value > buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> Dict:
+        """The histogram as a dict, e.g. for json.
+
+        Returns:
+            Dict: "le" (the upper bounds), "counts" (per bucket, the last one is above all bounds), "count" and "sum".
+        """
+        return {"le": list(self.buckets), "counts": list(self.counts), "count": self.count, "sum": self.sum}
+
+
+class CN105Metrics:
+    """Counters and histograms of the transactions of a CN105Server, see `CN105Server.stats()`.
+
+        The round trip time of an answered attempt (from sending the request to the complete response) is
+        recorded per request type, the time a transaction waited in the queue for all of them.
+    """
+    def __init__(self):
+        """Initializes the metrics with zeros.
+        """
+        self.rtt = {name: CN105Histogram(RTT_BUCKETS_MS) for name in PACKET_TYPE_NAMES.values()}
+        self.queue_wait = CN105Histogram(QUEUE_WAIT_BUCKETS_MS)
+        # answered transactions
+        self.transactions = 0
+        # attempts without a response
+        self.timeouts = 0
+        # attempts with a broken response or a failed port
+        self.errors = 0
+        # transactions, that were given up after all retries
+        self.failures = 0
+        # transactions, that expired in the queue
+        self.dropped = 0
+
+    def observe_rtt(self, packet_type:int, ms:int):
+        """Records the round trip time of an answered attempt.
+
+        Args:
+            packet_type (int): The type of the request.
+            ms (int): The round trip time in ms.
+        """
+        name = PACKET_TYPE_NAMES.get(packet_type)
+        if name is not None:
+            self.rtt[name].observe(ms)
+
+
+class _Transaction:
+    """A request, that is queued for the bus, and the response to it, once it is processed.
+    """
+    def __init__(self, request: CN105Request, timeout:float=None):
+        self.request = request
+        self.priority = PRIORITY_POLL if request.packet_type == PT_GET_REQUEST else PRIORITY_COMMAND
+        self.created = _ticks_ms()
+        # the caller gives up after this point in time (ticks), retries aren't started after it
+        self.deadline = None if timeout is None else _ticks_add(self.created, int(timeout * 1000))
+        self.response = None
+        self.error = None
+        self.done = asyncio.Event()
+
+    async def wait(self) -> CN105Response:
+        await self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
 
 
 class CN105Server:
     """A Server, that sends and receives packets to and from a CN105 Client.
 
+        All packets go through a single transaction queue: callers wait on their own transaction,
+        while one worker task owns the UART and sends the packets in order. Connect and set requests
+        are sent before queued get requests. A get request for a page, that is already queued, joins
+        the queued one, and get requests that waited longer than `max_poll_age` are dropped.
+        Set requests are held back for `coalesce_window`, set requests arriving in the meantime are
+        merged into the same packet (the last written value of a field wins).
+
+        Each server owns its UART and its queue, so several servers (e.g. on UART 1 and 2 of an ESP32)
+        run side by side on one event loop, none of them blocks the others while it waits for a response.
+
+        Each attempt of a transaction waits at most `response_timeout` for the response. A missing or
+        broken response is retried up to `retries` times, after a short delay with random jitter.
+        `state` is one of the STATE_* constants: a lost response turns a connected server into
+        `STATE_DEGRADED`, the next answered transaction back into `STATE_CONNECTED`. After `max_failures`
+        failed transactions in a row, the server is disconnected and has to connect again.
+
         Args:
             tx (int, optional): The tx pin. Defaults to 17.
             rx (int, optional): The rx pin. Defaults to 16.
+            max_poll_age (float, optional): Seconds, after which a queued get request is dropped. Defaults to 10.
+            coalesce_window (float, optional): Seconds, a set request waits for further set requests. Defaults to 0.05.
+            response_timeout (float, optional): Seconds, an attempt waits for the response. Defaults to `TRANSACTION_TIME_MS`.
+            retries (int, optional): How often a transaction is retried. Defaults to `MAX_RETRIES`.
+            max_failures (int, optional): Failed transactions in a row, until the server disconnects. Defaults to `MAX_FAILURES`.
+            verbose (bool, optional): Print each packet. Defaults to True.
+            uart (int, optional): The id of the hardware UART. Defaults to 2.
+            capture (CN105CaptureWriter, optional): Records every sent and received frame. Defaults to None.
     """
-    def __init__(self, tx:int=17, rx:int=16):
+    def __init__(self, tx:int=17, rx:int=16, max_poll_age:float=10, coalesce_window:float=0.05,
+            response_timeout:float=TRANSACTION_TIME_MS/1000, retries:int=MAX_RETRIES, max_failures:int=MAX_FAILURES,
+            verbose:bool=True, uart:int=2, capture=None):
         """Initializes the Server
 
         Args:
             tx (int, optional): The tx pin. Defaults to 17.
             rx (int, optional): The rx pin. Defaults to 16.
+            max_poll_age (float, optional): Seconds, after which a queued get request is dropped. Defaults to 10.
+            coalesce_window (float, optional): Seconds, a set request waits for further set requests. Defaults to 0.05.
+            response_timeout (float, optional): Seconds, an attempt waits for the response. Defaults to `TRANSACTION_TIME_MS`.
+            retries (int, optional): How often a transaction is retried. Defaults to `MAX_RETRIES`.
+            max_failures (int, optional): Failed transactions in a row, until the server disconnects. Defaults to `MAX_FAILURES`.
+            verbose (bool, optional): Print each packet. Defaults to True.
+            uart (int, optional): The id of the hardware UART. Defaults to 2.
+            capture (CN105CaptureWriter, optional): Records every sent and received frame. Defaults to None.
         """
         if tx != 0:
-            self.uart = UART(2, baudrate=2400, tx=tx, rx=rx, parity=0)
-            self.uart.init(timeout=50)
+            self.uart = UART(uart, baudrate=BAUDRATE, tx=tx, rx=rx, parity=0)
+            self.uart.init(timeout=RESPONSE_TIMEOUT_MS)
             self.swriter = asyncio.StreamWriter(self.uart, {})
             self.sreader = asyncio.StreamReader(self.uart)
-        self.connected = False
+        self.state = STATE_DISCONNECTED
+        # failed transactions in a row
+        self.failures = 0
+        # attempts, that were repeated
+        self.retry_count = 0
+        self.response_timeout_ms = int(response_timeout * 1000)
+        self.retries = retries
+        self.max_failures = max_failures
+        self.verbose = verbose
+        # see cn105_adapter.capture
+        self.capture = capture
         self.waiting_for_response = False
+        self.decoder = CN105FrameDecoder()
+        # on CPython, `open()` sets a transport, that feeds received bytes straight into the decoder
+        self.transport = None
+        self._rx_event = None
+        # set requests are written into this buffer, only the worker uses it
+        self._set_frame = _set_frame_buffer()
+        self.max_poll_age_ms = int(max_poll_age * 1000)
+        self.coalesce_window_ms = int(coalesce_window * 1000)
+        # longest time a request of each packet type waited in the queue (ms)
+        self.max_wait_ms = {}
+        self.metrics = CN105Metrics()
+        self._queue = []
+        self._queue_event = None
+        self._worker = None
+        # the transaction, that is on the bus
+        self._current = None
+
+    def _log(self, message:str):
+        if self.verbose:
+            print(message)
+
+    @property
+    def connected(self) -> bool:
+        """If the device answered the connect request, and didn't stop answering since then.
+        """
+        return self.state == STATE_CONNECTED or self.state == STATE_DEGRADED
 
-    async def _start_sim(self):
-        self.sreader, self.swriter = await open_serial_connection(url='COM50', baudrate=2400)
+    @connected.setter
+    def connected(self, value:bool):
+        self.state = STATE_CONNECTED if value else STATE_DISCONNECTED
+        self.failures = 0
+
+    async def open(self, path:str, baudrate:int=BAUDRATE, parity:str="E"):
+        """Opens a serial port or pty (CPython only, see `cn105_adapter.transport`).
+
+        Args:
+            path (str): The path of the port (e.g. /dev/ttyUSB0).
+            baudrate (int, optional): The baudrate. Defaults to `BAUDRATE`.
+            parity (str, optional): "N", "E" or "O". Defaults to "E".
+        """
+        from .transport import open_serial
+        self._rx_event = asyncio.Event()
+        await open_serial(self, path, baudrate, parity)
+
+    def data_received(self, data:bytes):
+        """Called by the transport with received bytes.
+
+        Args:
+            data (bytes): The bytes.
+        """
+        self.decoder.feed(data)
+        self._rx_event.set()
+
+    def connection_lost(self, exc:Exception):
+        """Called by the transport, if the port was closed.
+
+        Args:
+            exc (Exception): The error, or None if the port was closed regularly.
+        """
+        self.transport = None
+        self.connected = False
+        if self._rx_event is not None:
+            self._rx_event.set()
+
+    def close(self):
+        """Stops the worker, writes the buffered capture records and closes the port.
+        """
+        self._stop_worker()
+        if self.capture is not None:
+            self.capture.flush()
+        if self.transport is not None:
+            self.transport.close()
+        elif hasattr(self, "swriter"):
+            self.swriter.close()
 
     def _stop_sim(self):
-        self.swriter.close()
-    
-    async def _send_packet_and_wait_for_response(self, request: CN105Request) -> CN105Response:    
-        # Wait, if another request is being processed
-        while self.waiting_for_response:
-            await asyncio.sleep(1)
-            print("waiting...")
+        self.close()
+
+    def _stop_worker(self):
+        # the callers of the queued and the current transaction mustn't wait forever
+        pending = self._queue
+        if self._current is not None:
+            pending = [self._current] + pending
+        self._queue = []
+        self._current = None
+        for transaction in pending:
+            if not transaction.done.is_set():
+                transaction.error = ValueError("Server closed")
+                transaction.done.set()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def _submit(self, transaction: _Transaction) -> _Transaction:
+        # The worker is started lazily, so that it runs on the loop of the caller
+        if self._worker is None:
+            self._queue_event = asyncio.Event()
+            self._worker = asyncio.create_task(self._process_queue())
+
+        request = transaction.request
+        if transaction.priority == PRIORITY_POLL:
+            for queued in self._queue:
+                if queued.request.packet_type == request.packet_type and queued.request.payload == request.payload:
+                    return queued
+        elif request.packet_type == PT_SET_REQUEST:
+            for queued in self._queue:
+                if queued.request.packet_type == PT_SET_REQUEST and queued.request.payload[0] == request.payload[0] \
+                        and request.payload[0] in schemas:
+                    queued.request = _merge_set_requests(queued.request, request)
+                    return queued
+
+        i = len(self._queue)
+        while i > 0 and self._queue[i-1].priority > transaction.priority:
+            i -= 1
+        self._queue.insert(i, transaction)
+        self._queue_event.set()
+        return transaction
+
+    async def _process_queue(self):
+        while True:
+            if not self._queue:
+                self._queue_event.clear()
+                await self._queue_event.wait()
+                continue
+            transaction = self._queue[0]
+            if transaction.request.packet_type == PT_SET_REQUEST:
+                # keep the set request in the queue, until the coalescing window is over
+                remaining = self.coalesce_window_ms - _ticks_diff(_ticks_ms(), transaction.created)
+                if remaining > 0:
+                    await asyncio.sleep(remaining / 1000)
+                    continue
+            self._queue.pop(0)
+            waited = _ticks_diff(_ticks_ms(), transaction.created)
+            packet_type = transaction.request.packet_type
+            self.max_wait_ms[packet_type] = max(waited, self.max_wait_ms.get(packet_type, 0))
+            self.metrics.queue_wait.observe(waited)
+            if transaction.priority == PRIORITY_POLL and waited > self.max_poll_age_ms:
+                transaction.error = ValueError("Get request dropped, it waited too long")
+                self.metrics.dropped += 1
+            elif transaction.deadline is not None and _ticks_diff(transaction.deadline, _ticks_ms()) <= 0:
+                transaction.error = ValueError("Request dropped, its deadline has passed")
+                self.metrics.dropped += 1
+            else:
+                self._current = transaction
+                await self._transact(transaction)
+                self._current = None
+            transaction.done.set()
+
+    async def _transact(self, transaction: _Transaction):
+        # Errors are handed to the caller. They are caught here and not in the worker loop, so
+        # that their traceback doesn't reference the (still running) worker frame.
+        attempt = 0
+        while True:
+            timeout = self.response_timeout_ms
+            if transaction.deadline is not None:
+                timeout = min(timeout, _ticks_diff(transaction.deadline, _ticks_ms()))
+            try:
+                transaction.response = await asyncio.wait_for(self._transfer(transaction.request), timeout / 1000)
+                self._answered()
+                return
+            except asyncio.TimeoutError:
+                error = ValueError("AC didn't responde")
+                self.metrics.timeouts += 1
+            except Exception as e:
+                error = e
+                self.metrics.errors += 1
+            if self.state == STATE_CONNECTED:
+                self.state = STATE_DEGRADED
+            delay = RETRY_DELAY_MS + getrandbits(8) * RETRY_JITTER_MS // 256
+            if attempt >= self.retries or (transaction.deadline is not None and \
+                    _ticks_diff(transaction.deadline, _ticks_ms()) <= delay):
+                transaction.error = error
+                self._failed()
+                return
+            attempt += 1
+            self.retry_count += 1
+            await asyncio.sleep(delay / 1000)
+
+    def _answered(self):
+        self.metrics.transactions += 1
+        self.failures = 0
+        if self.state == STATE_DEGRADED:
+            self.state = STATE_CONNECTED
+
+    def _failed(self):
+        self.metrics.failures += 1
+        self.failures += 1
+        if self.connected and self.failures >= self.max_failures:
+            self._log("AC doesn't answer anymore, disconnecting")
+            self.connected = False
+
+    def latency_bound(self) -> float:
+        """Worst-case time, until a command (connect or set request), that is submitted now, is answered.
+
+        A command has to wait for the transaction on the bus and for the commands queued before it,
+        but never for queued get requests. Set requests are held back for the coalescing window. Each of
+        these transactions (and the command itself) can take all its attempts, with the retry delays in between.
+
+        Returns:
+            float: The bound in seconds.
+        """
+        commands = 0
+        for queued in self._queue:
+            if queued.priority == PRIORITY_COMMAND:
+                commands += 1
+        transaction = (self.retries + 1) * self.response_timeout_ms + self.retries * (RETRY_DELAY_MS + RETRY_JITTER_MS)
+        return ((commands + 2) * transaction + self.coalesce_window_ms) / 1000
+
+    def stats(self) -> Dict:
+        """The metrics of the link, e.g. to tune the poll intervals.
 
-        print("Sending:   " + str(request))
+        Returns:
+            Dict: The connection state, the counters (transactions, timeouts, errors, retries, failures,
+                dropped, crcErrors, resyncs) and the histograms (rttMs per request type, queueWaitMs),
+                see `CN105Histogram.to_dict()`.
+        """
+        metrics = self.metrics
+        return {
+            "state": self.state,
+            "transactions": metrics.transactions,
+            "timeouts": metrics.timeouts,
+            "errors": metrics.errors,
+            "retries": self.retry_count,
+            "failures": metrics.failures,
+            "dropped": metrics.dropped,
+            "crcErrors": self.decoder.crc_errors,
+            "resyncs": self.decoder.resyncs,
+            "rttMs": {name: metrics.rtt[name].to_dict() for name in metrics.rtt},
+            "queueWaitMs": metrics.queue_wait.to_dict(),
+        }
+
+    async def _transfer(self, request: CN105Request) -> CN105Response:
+        if self.verbose:
+            print("Sending:   " + str(request))
         self.waiting_for_response = True
-        self.swriter.write(bytearray(request.raw))
-        await self.swriter.drain()
-        raw = await self.sreader.read(30)
-        self.waiting_for_response = False
-        if raw is not None:
-            response = CN105Response(raw)
+        try:
+            # bytes, that arrived after the last response, can't belong to this one
+            self.decoder.reset()
+            transport = self.transport
+            frame = self._frame(request)
+            start = _ticks_ms()
+            if transport is not None:
+                transport.write(frame)
+            else:
+                self.swriter.write(frame)
+                await self.swriter.drain()
+            if self.capture is not None:
+                self.capture.record(DIRECTION_TX, frame)
+            while True:
+                frame = self.decoder.next_frame()
+                if frame is not None and self.capture is not None:
+                    self.capture.record(DIRECTION_RX, frame)
+                if frame is None and transport is not None:
+                    if self.transport is None:
+                        raise ValueError("Serial port closed")
+                    self._rx_event.clear()
+                    await self._rx_event.wait()
+                elif frame is None:
+                    raw = await self.sreader.read(MAX_PACKET_LENGTH)
+                    if not raw:
+                        raise ValueError("AC didn't responde")
+                    self.decoder.feed(raw)
+                elif frame[1] == RESPONSE_TYPES[request.packet_type] and \
+                        (request.packet_type != PT_GET_REQUEST or frame[5] == request.payload[0]):
+                    break
+                # anything else, e.g. the late response to an attempt, that timed out, is dropped as noise
+        finally:
+            self.waiting_for_response = False
+        response = CN105Response(frame)
+        self.metrics.observe_rtt(request.packet_type, _ticks_diff(_ticks_ms(), start))
+        if self.verbose:
             print("Receiving: " + str(response))
-            return response
-        
-        raise ValueError("AC didn't responde")
-        
+        return response
 
-    async def connect(self) -> bool:
+    def _frame(self, request: CN105Request) -> bytes:
+        payload = request.payload
+        if request.packet_type != PT_SET_REQUEST or len(payload) != 16:
+            return request.frame
+        # patch the payload and checksum of the set request in place
+        return _write_set_frame(self._set_frame, payload)
+
+    async def _send_packet_and_wait_for_response(self, request: CN105Request, timeout:float=None) -> CN105Response:
+        transaction = self._submit(_Transaction(request, timeout))
+        return await transaction.wait()
+
+    async def connect(self, timeout:float=None) -> bool:
         """Send a connect request to the CN105 device.
 
+        Args:
+            timeout (float, optional): Seconds, after which the request is given up (including retries). Defaults to None.
+
         Returns:
             bool: If the device returned a connect response.
         """
-        print("Connecting to AC... ")
-        request = CN105ConnectRequest()
-        response = await self._send_packet_and_wait_for_response(request)
+        self._log("Connecting to AC... ")
+        request = CONNECT_REQUEST
+        self.state = STATE_CONNECTING
+        try:
+            response = await self._send_packet_and_wait_for_response(request, timeout)
+        except Exception:
+            self.connected = False
+            raise
         self.connected = response.packet_type == PT_CONNECT_RESPONSE
         if self.connected:
-            print("done")
+            self._log("done")
         else:
-            print("failed")
+            self._log("failed")
         return self.connected
     
-    async def get_data(self, rtype: int) -> CN105Response:
+    async def get_data(self, rtype: int, timeout:float=None) -> CN105Response:
         """Send a Get Data Request to the CN105 device.
 
         Args:
-            rtype (int): The type of the Get Data Request (0x02 or 0x03).
+            rtype (int): The type of the Get Data Request (one of `INFO_PAGES`).
+            timeout (float, optional): Seconds, after which the request is given up (including retries). Defaults to None.
 
         Returns:
             CN105Response: The Response, that was returned from the device.
         """
-        print("Getting state of AC... ")
-        request = CN105GetDataRequest(rtype=rtype)
-        response = await self._send_packet_and_wait_for_response(request)
+        self._log("Getting state of AC... ")
+        request = GET_DATA_REQUESTS.get(rtype)
+        if request is None:
+            request = CN105GetDataRequest(rtype=rtype)
+        response = await self._send_packet_and_wait_for_response(request, timeout)
         if response.packet_type == PT_GET_RESPONSE:
-            print("done")
+            self._log("done")
             return response
         else:
-            print("failed")
+            self._log("failed")
             return None
 
-    async def set_data(self, data: Dict) -> CN105Response:
+    async def set_data(self, data: Dict, timeout:float=None) -> CN105Response:
         """Send a Set Data Request to the CN105 device.
 
         Args:
             data (dict): The data, that should be set on the device.
+            timeout (float, optional): Seconds, after which the request is given up (including retries). Defaults to None.
 
         Returns:
             CN105Response: The Response, that was returned from the device.
         """
-        print("Setting state of AC... ")
+        self._log("Setting state of AC... ")
         request = CN105SetDataRequest(data=data)
-        response = await self._send_packet_and_wait_for_response(request)
+        response = await self._send_packet_and_wait_for_response(request, timeout)
         if response.packet_type == PT_SET_RESPONSE:
-            print("done")
+            self._log("done")
             return response
         else:
-            print("failed")
+            self._log("failed")
             return None
-        
-    
\ No newline at end of file
+
+
+class CN105Poller:
+    """Polls the info pages of a CN105 device, each page on its own, adaptive interval.
+
+        A page is polled with its minimum interval after it changed or after `wake()` (e.g. after a set
+        request). As long as it doesn't change, its interval grows by `backoff` up to its maximum interval.
+        This way, changes show up fast, while a unit in steady state is rarely polled. The maximum interval
+        bounds, how stale a page can be, if it is changed elsewhere (see `POLL_INTERVALS`). If the server is not
+        connected (or disconnected, because the device stopped answering), it connects first.
+
+        Args:
+            server (CN105Server): The server, that is polled.
+            intervals (dict, optional): rtype -> maximum seconds between two get requests. Defaults to `POLL_INTERVALS`.
+            on_response (callable, optional): Called with each CN105Response. Defaults to None.
+            min_intervals (dict, optional): rtype -> minimum seconds between two get requests. Defaults to `MIN_POLL_INTERVALS`,
+                if `intervals` is not set, otherwise to `intervals` (fixed intervals).
+            backoff (float, optional): Factor, by which the interval of an unchanged page grows. Defaults to `POLL_BACKOFF`.
+    """
+    def __init__(self, server:CN105Server, intervals:Dict=None, on_response=None, min_intervals:Dict=None, backoff:float=POLL_BACKOFF):
+        """Initializes the poller.
+
+        Args:
+            server (CN105Server): The server, that is polled.
+            intervals (Dict, optional): rtype -> maximum seconds between two get requests. Defaults to `POLL_INTERVALS`.
+            on_response (callable, optional): Called with each CN105Response. Defaults to None.
+            min_intervals (Dict, optional): rtype -> minimum seconds between two get requests. Defaults to `MIN_POLL_INTERVALS`,
+                if `intervals` is not set, otherwise to `intervals` (fixed intervals).
+            backoff (float, optional): Factor, by which the interval of an unchanged page grows. Defaults to `POLL_BACKOFF`.
+        """
+        self.server = server
+        if intervals is None:
+            intervals = POLL_INTERVALS
+            if min_intervals is None:
+                min_intervals = MIN_POLL_INTERVALS
+        elif min_intervals is None:
+            min_intervals = intervals
+        self.intervals = dict(intervals)
+        self.min_intervals = {rtype: min(min_intervals.get(rtype, self.intervals[rtype]), self.intervals[rtype]) for rtype in self.intervals}
+        self.backoff = backoff
+        self.on_response = on_response
+        # created by run(), so that it belongs to the loop of the poller
+        self._wake = None
+        self._stopped = False
+        self._interval = dict(self.min_intervals)
+        self._payload = {}
+        now = _ticks_ms()
+        self._due = {rtype: now for rtype in self.intervals}
+
+    def wake(self, rtype:int=None):
+        """Polls a page (or all pages) now and with its minimum interval afterwards.
+
+        Call this after a set request, the device is polled fast, until its state is stable again.
+
+        Args:
+            rtype (int, optional): The page. Defaults to None (all pages).
+        """
+        now = _ticks_ms()
+        for page in self.intervals:
+            if rtype is None or page == rtype:
+                self._interval[page] = self.min_intervals[page]
+                self._due[page] = now
+        if self._wake is not None:
+            self._wake.set()
+
+    def stop(self):
+        """Stops `run()` after the current poll. It doesn't send any further request.
+        """
+        self._stopped = True
+        if self._wake is not None:
+            self._wake.set()
+
+    def next_delay(self) -> float:
+        """Time until the next page is due.
+
+        Returns:
+            float: The delay in seconds (0, if a page is due).
+        """
+        now = _ticks_ms()
+        delay = None
+        for due in self._due.values():
+            d = _ticks_diff(due, now)
+            if delay is None or d < delay:
+                delay = d
+        if delay is None or delay < 0:
+            return 0
+        return delay / 1000
+
+    def _reschedule(self, rtype:int, now:int, response:CN105Response):
+        # the payload is only copied, if it changed
+        last = self._payload.get(rtype)
+        if not response.same_payload(last):
+            if last is not None:
+                self._interval[rtype] = self.min_intervals[rtype]
+            self._payload[rtype] = bytes(response.raw[5:5+response.payload_length])
+        interval = self._interval[rtype]
+        self._due[rtype] = _ticks_add(now, int(interval * 1000))
+        self._interval[rtype] = min(interval * self.backoff, self.intervals[rtype])
+
+    async def poll(self) -> List[CN105Response]:
+        """Sends a get request for each page, that is due.
+
+        Returns:
+            List[CN105Response]: The responses.
+        """
+        responses = []
+        for rtype in self.intervals:
+            now = _ticks_ms()
+            if _ticks_diff(self._due[rtype], now) > 0:
+                continue
+            # if the request fails, the page is retried after its current interval
+            self._due[rtype] = _ticks_add(now, int(self._interval[rtype] * 1000))
+            response = await self.server.get_data(rtype)
+            if response is not None:
+                self._reschedule(rtype, now, response)
+                responses.append(response)
+                if self.on_response is not None:
+                    self.on_response(response)
+        return responses
+
+    async def _alarm(self, delay:float):
+        await asyncio.sleep(delay)
+        self._wake.set()
+
+    async def run(self):
+        """Polls the pages, until `stop()` is called.
+
+        This is a coroutine.
+        """
+        self._stopped = False
+        self._wake = asyncio.Event()
+        while not self._stopped:
+            try:
+                if not self.server.connected:
+                    if not await self.server.connect():
+                        await asyncio.sleep(1)
+                        continue
+                await self.poll()
+            except Exception as e:
+                # lost responses are retried by the server, it disconnects, if the device stops answering
+                print("ac error: " + str(e))
+                if not self.server.connected:
+                    await asyncio.sleep(1)
+                    continue
+            if self._stopped:
+                return
+            self._wake.clear()
+            # not wait_for, before Python 3.12 it can swallow the cancellation of the poller
+            alarm = asyncio.create_task(self._alarm(self.next_delay()))
+            try:
+                await self._wake.wait()
+            finally:
+                alarm.cancel()
@@ -0,0 +1,362 @@
+"""CN105 gateway
+
+Runs many CN105 links (serial ports or ptys) on one asyncio loop and exposes all units through one HTTP API.
+This module only runs on CPython.
+"""
+
+import asyncio
+from typing import Dict
+
+from .cn105_adapter import CN105Server, CN105Poller, CN105Response, BAUDRATE, \
+    STATE_CONNECTED, STATE_DEGRADED, field_mappings, rawToPhys, physToRaw, schemas
+
+try:
+    import http_server
+except ImportError:
+    http_server = None
+
+# The counters of `CN105Server.stats()` and their names in the Prometheus text format
+PROMETHEUS_COUNTERS = (
+    ("transactions", "cn105_transactions_total", "Answered transactions"),
+    ("timeouts", "cn105_timeouts_total", "Attempts without a response"),
+    ("errors", "cn105_errors_total", "Attempts with a broken response"),
+    ("retries", "cn105_retries_total", "Repeated attempts"),
+    ("failures", "cn105_failures_total", "Transactions, that were given up"),
+    ("dropped", "cn105_dropped_total", "Transactions, that expired in the queue"),
+    ("crcErrors", "cn105_crc_errors_total", "Received frames with a wrong checksum"),
+    ("resyncs", "cn105_resyncs_total", "Bytes skipped to find the next frame"),
+)
+
+
+def _histogram_lines(name:str, labels:str, histogram:Dict) -> list:
+    # Prometheus histograms are cumulative and in seconds
+    lines = []
+    total = 0
+    for le, count in zip(histogram["le"], histogram["counts"]):
+        total += count
+        lines.append(f'{name}_bucket{{{labels},le="{le / 1000}"}} {total}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram["sum"] / 1000}')
+    lines.append(f'{name}_count{{{labels}}} {histogram["count"]}')
+    return lines
+
+
+def to_prometheus(stats:Dict[str, Dict]) -> str:
+    """Formats the metrics of several links in the Prometheus text format.
+
+    Args:
+        stats (Dict[str, Dict]): unit name -> `CN105Server.stats()`.
+
+    Returns:
+        str: The metrics, each series is labeled with its unit.
+    """
+    lines = [
+        "# HELP cn105_connected If the unit answers",
+        "# TYPE cn105_connected gauge",
+    ]
+    for unit in stats:
+        connected = stats[unit]["state"] in (STATE_CONNECTED, STATE_DEGRADED)
+        lines.append(f'cn105_connected{{unit="{unit}"}} {int(connected)}')
+    for key, name, description in PROMETHEUS_COUNTERS:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} counter")
+        for unit in stats:
+            lines.append(f'{name}{{unit="{unit}"}} {stats[unit][key]}')
+    lines.append("# HELP cn105_rtt_seconds Round trip time of answered attempts")
+    lines.append("# TYPE cn105_rtt_seconds histogram")
+    for unit in stats:
+        for packet_type, histogram in stats[unit]["rttMs"].items():
+            lines += _histogram_lines("cn105_rtt_seconds", f'unit="{unit}",type="{packet_type}"', histogram)
+    lines.append("# HELP cn105_queue_wait_seconds Time, transactions waited in the queue")
+    lines.append("# TYPE cn105_queue_wait_seconds histogram")
+    for unit in stats:
+        lines += _histogram_lines("cn105_queue_wait_seconds", f'unit="{unit}"', stats[unit]["queueWaitMs"])
+    return "\n".join(lines) + "\n"
+
+
+class CN105StateStore:
+    """The state of all units of a gateway: unit -> field -> raw value.
+
+        Each unit has a version, that is incremented on every change, so clients can tell, if they missed
+        an update. A unit only holds one value per field, the memory doesn't grow over time.
+    """
+    def __init__(self):
+        """Initializes an empty store.
+        """
+        self.units = {}
+        self.versions = {}
+
+    def add(self, unit:str):
+        """Adds a unit without any state.
+
+        Args:
+            unit (str): The name of the unit.
+        """
+        self.units[unit] = {}
+        self.versions[unit] = 0
+
+    def update(self, unit:str, data:Dict) -> bool:
+        """Writes raw field values of a unit.
+
+        Args:
+            unit (str): The name of the unit.
+            data (Dict): field name -> raw value.
+
+        Returns:
+            bool: If a value changed.
+        """
+        state = self.units[unit]
+        changed = False
+        for key in data:
+            if state.get(key) != data[key]:
+                state[key] = data[key]
+                changed = True
+        if changed:
+            self.versions[unit] += 1
+        return changed
+
+    def get(self, unit:str) -> Dict:
+        """Reads the state of a unit.
+
+        Args:
+            unit (str): The name of the unit.
+
+        Returns:
+            Dict: field name -> physical value (the raw value, if the field has no mapping).
+        """
+        state = self.units[unit]
+        phys = {}
+        for key in state:
+            mapping = field_mappings.get(key)
+            phys[key] = state[key] if mapping is None else rawToPhys(mapping, state[key])
+        return phys
+
+
+class CN105Unit:
+    """One indoor unit of a gateway: its link, its poller and the port, it is connected to.
+
+        Args:
+            name (str): The name of the unit, it is used in the URLs of the HTTP API.
+            server (CN105Server): The link to the unit.
+            url (str, optional): The serial port or pty, the link is opened on. Defaults to None (already opened).
+            poller (CN105Poller, optional): The poller of the unit. Defaults to None.
+    """
+    def __init__(self, name:str, server:CN105Server, url:str=None, poller:CN105Poller=None):
+        """Initializes the unit.
+
+        Args:
+            name (str): The name of the unit, it is used in the URLs of the HTTP API.
+            server (CN105Server): The link to the unit.
+            url (str, optional): The serial port or pty, the link is opened on. Defaults to None (already opened).
+            poller (CN105Poller, optional): The poller of the unit. Defaults to None.
+        """
+        self.name = name
+        self.server = server
+        self.url = url
+        self.poller = poller
+        self.task = None
+
+
+class CN105Gateway:
+    """Runs the links to many CN105 units on one asyncio loop.
+
+        Each unit has its own CN105Server (with its own transaction queue) and its own CN105Poller, all
+        units share one CN105StateStore. The work per link is bounded by its poll intervals, and its memory
+        by the (deduplicated) transaction queue and the fixed size frame decoder.
+
+        Example:
+            >>> gateway = CN105Gateway()
+            >>> gateway.add_unit("living-room", url="/dev/ttyUSB0")
+            >>> gateway.add_unit("office", url="/dev/ttyUSB1")
+            >>> srv = http_server.HttpServer(port=8080)
+            >>> gateway.register(srv)
+            >>> await gateway.start()
+            >>> await srv.run()
+
+        Args:
+            store (CN105StateStore, optional): The state store. Defaults to a new one.
+    """
+    def __init__(self, store:CN105StateStore=None):
+        """Initializes the gateway.
+
+        Args:
+            store (CN105StateStore, optional): The state store. Defaults to a new one.
+        """
+        self.store = CN105StateStore() if store is None else store
+        self.units = {}
+
+    def add_unit(self, name:str, url:str=None, server:CN105Server=None, intervals:Dict=None, min_intervals:Dict=None) -> CN105Unit:
+        """Adds a unit. The link is opened by `start()`.
+
+        Args:
+            name (str): The name of the unit, it is used in the URLs of the HTTP API.
+            url (str, optional): The serial port or pty of the unit. Defaults to None.
+            server (CN105Server, optional): An already opened link, instead of url. Defaults to None.
+            intervals (Dict, optional): The maximum poll intervals, see CN105Poller. Defaults to None.
+            min_intervals (Dict, optional): The minimum poll intervals, see CN105Poller. Defaults to None.
+
+        Raises:
+            ValueError: If there is already a unit with this name, or neither url nor server is given.
+
+        Returns:
+            CN105Unit: The unit.
+        """
+        if name in self.units:
+            raise ValueError(f"Unit {name} already exists")
+        if url is None and server is None:
+            raise ValueError("Either url or server is required")
+        if server is None:
+            server = CN105Server(tx=0, verbose=False)
+        unit = CN105Unit(name, server, url)
+        unit.poller = CN105Poller(server, intervals=intervals, min_intervals=min_intervals,
+            on_response=lambda response: self._on_response(unit, response))
+        self.units[name] = unit
+        self.store.add(name)
+        return unit
+
+    def _on_response(self, unit:CN105Unit, response:CN105Response):
+        self.store.update(unit.name, response.data)
+
+    async def _open(self, unit:CN105Unit):
+        await unit.server.open(unit.url, BAUDRATE, "E")
+
+    async def start(self):
+        """Opens the links of all units and starts polling them.
+
+        This is a coroutine.
+        """
+        units = [unit for unit in self.units.values() if unit.task is None]
+        await asyncio.gather(*[self._open(unit) for unit in units if unit.url is not None])
+        for unit in units:
+            unit.task = asyncio.create_task(unit.poller.run())
+
+    async def stop(self):
+        """Stops polling and closes the links of all units.
+
+        This is a coroutine.
+        """
+        tasks = []
+        for unit in self.units.values():
+            if unit.task is not None:
+                unit.poller.stop()
+                unit.task.cancel()
+                tasks.append(unit.task)
+                unit.task = None
+        # the pollers have to end first, otherwise they would restart the workers of the links
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for unit in self.units.values():
+            if unit.url is not None:
+                unit.server.close()
+            else:
+                unit.server._stop_worker()
+        await asyncio.sleep(0)
+
+    def state(self, name:str) -> Dict:
+        """The state of a unit, as it is returned by the HTTP API.
+
+        Args:
+            name (str): The name of the unit.
+
+        Returns:
+            Dict: The fields of the unit, its connection state and the version of its state.
+        """
+        unit = self.units[name]
+        data = self.store.get(name)
+        data["unit"] = name
+        data["connectionState"] = unit.server.state
+        data["version"] = self.store.versions[name]
+        return data
+
+    def metrics(self) -> str:
+        """The link metrics of all units, in the Prometheus text format.
+
+        Returns:
+            str: The metrics, see `to_prometheus`.
+        """
+        return to_prometheus({name: self.units[name].server.stats() for name in self.units})
+
+    def to_raw(self, state:Dict) -> Dict:
+        """Converts physical field values of a set request to raw values.
+
+        Args:
+            state (Dict): field name -> physical value (e.g. {"power": "ON", "tempSet": 22.5}).
+
+        Raises:
+            ValueError: If a field or value is not allowed.
+
+        Returns:
+            Dict: field name -> raw value.
+        """
+        schema = schemas[0x01]
+        data = {}
+        for key in state:
+            if key not in schema.index:
+                raise ValueError(f"Key {key} is not allowed in this request")
+            raw = physToRaw(field_mappings[key], state[key])
+            if raw is None:
+                raise ValueError(f"Value {state[key]} is not allowed for {key}")
+            data[key] = raw
+        return data
+
+    async def set_state(self, name:str, state:Dict) -> Dict:
+        """Sets fields of a unit.
+
+        Args:
+            name (str): The name of the unit.
+            state (Dict): field name -> physical value (e.g. {"power": "ON", "tempSet": 22.5}).
+
+        Raises:
+            ValueError: If a field or value is not allowed, or the unit didn't confirm the set request.
+
+        Returns:
+            Dict: The new state of the unit (see `state()`).
+        """
+        return await self._set_raw(name, self.to_raw(state))
+
+    async def _set_raw(self, name:str, data:Dict) -> Dict:
+        unit = self.units[name]
+        response = await unit.server.set_data(data)
+        if response is None:
+            raise ValueError(f"Unit {name} didn't confirm the set request")
+        # the confirmed values are written through, the next poll reconciles them
+        self.store.update(name, data)
+        return self.state(name)
+
+    def register(self, srv):
+        """Adds the routes of the HTTP API to a http_server.HttpServer.
+
+        `GET /units` lists the units, `GET /units/<name>/state` returns the state of a unit,
+        `POST /units/<name>/state` sets fields of a unit and `GET /metrics` returns the link metrics
+        of all units for Prometheus.
+
+        Args:
+            srv (http_server.HttpServer): The server.
+        """
+        srv.routes["/units"] = (("GET",), self._units_route)
+        srv.routes["/metrics"] = (("GET",), self._metrics_route)
+        # one route for all units, also for units, that are added later
+        srv.async_routes["/units/{name}/state"] = (("GET", "POST"), self._state_route)
+
+    def _units_route(self, request):
+        return http_server.HttpResponse(request, list(self.units))
+
+    def _metrics_route(self, request):
+        return http_server.HttpResponse(request, self.metrics(), headers={"Content-Type": "text/plain; version=0.0.4"})
+
+    async def _state_route(self, request):
+        name = request.params["name"]
+        if name not in self.units:
+            return http_server.HttpError(request, 404, f"Unit {name} not found")
+        if request.method == "GET":
+            return http_server.HttpResponse(request, self.state(name))
+        body = getattr(request, "body", None)
+        if not isinstance(body, dict):
+            return http_server.HttpError(request, 400, "Expected a json object")
+        try:
+            data = self.to_raw(body)
+        except ValueError as e:
+            return http_server.HttpError(request, 400, str(e))
+        try:
+            return http_server.HttpResponse(request, await self._set_raw(name, data))
+        except ValueError as e:
+            return http_server.HttpError(request, 500, str(e))
@@ -0,0 +1,185 @@
+"""CN105 serial transport
+
+An asyncio transport for serial ports and ptys on CPython (Linux, macOS). The port is configured with termios and
+read with the event loop of asyncio, received bytes are passed straight to the frame decoder of a CN105Server.
+This module only runs on CPython.
+"""
+
+import asyncio
+import os
+import termios
+
+from .cn105_adapter import BAUDRATE, MAX_PACKET_LENGTH
+
+PARITIES = {
+    "N": 0,
+    "E": termios.PARENB,
+    "O": termios.PARENB | termios.PARODD,
+}
+
+
+def configure(fd:int, baudrate:int=BAUDRATE, parity:str="E"):
+    """Puts a serial port into raw mode, with 8 data bits and 1 stop bit.
+
+    Args:
+        fd (int): The file descriptor of the port.
+        baudrate (int, optional): The baudrate. Defaults to `BAUDRATE`.
+        parity (str, optional): "N", "E" or "O". Defaults to "E".
+
+    Raises:
+        ValueError: If the baudrate or parity is not supported.
+    """
+    speed = getattr(termios, f"B{baudrate}", None)
+    if speed is None:
+        raise ValueError(f"Baudrate {baudrate} is not supported")
+    if parity not in PARITIES:
+        raise ValueError(f"Parity {parity} is not supported")
+    iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(fd)
+    iflag = termios.IGNBRK
+    if parity != "N":
+        iflag |= termios.INPCK
+    oflag = 0
+    lflag = 0
+    cflag = termios.CS8 | termios.CREAD | termios.CLOCAL | PARITIES[parity]
+    cc[termios.VMIN] = 1
+    cc[termios.VTIME] = 0
+    termios.tcsetattr(fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, speed, speed, cc])
+
+
+class CN105SerialTransport(asyncio.Transport):
+    """A transport on the file descriptor of a serial port or pty. You shouldn't have to create one by yourself,
+        use `open_serial`.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The event loop.
+            fd (int): The file descriptor (non-blocking).
+            protocol (asyncio.Protocol): The protocol, that receives the bytes.
+    """
+    def __init__(self, loop:asyncio.AbstractEventLoop, fd:int, protocol:asyncio.Protocol):
+        """Initializes the transport and starts reading.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The event loop.
+            fd (int): The file descriptor (non-blocking).
+            protocol (asyncio.Protocol): The protocol, that receives the bytes.
+        """
+        super().__init__()
+        self._loop = loop
+        self._fd = fd
+        self._protocol = protocol
+        self._buffer = bytearray()
+        self._closing = False
+        protocol.connection_made(self)
+        loop.add_reader(fd, self._read_ready)
+
+    def _read_ready(self):
+        try:
+            data = os.read(self._fd, MAX_PACKET_LENGTH)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # e.g. EIO, if the other side of a pty is closed
+            self._close(e)
+            return
+        if data:
+            self._protocol.data_received(data)
+        else:
+            self._close(None)
+
+    def write(self, data):
+        """Writes bytes to the port. Bytes, that don't fit into the buffer of the OS, are sent later.
+
+        Args:
+            data (bytes): The bytes.
+        """
+        if self._closing:
+            return
+        if not self._buffer:
+            try:
+                n = os.write(self._fd, data)
+            except (BlockingIOError, InterruptedError):
+                n = 0
+            except OSError as e:
+                self._close(e)
+                return
+            if n == len(data):
+                return
+            self._loop.add_writer(self._fd, self._write_ready)
+            data = data[n:]
+        self._buffer += data
+
+    def _write_ready(self):
+        try:
+            n = os.write(self._fd, self._buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._close(e)
+            return
+        del self._buffer[:n]
+        if not self._buffer:
+            self._loop.remove_writer(self._fd)
+
+    def get_write_buffer_size(self) -> int:
+        return len(self._buffer)
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self):
+        """Closes the port.
+        """
+        self._close(None)
+
+    def _close(self, exc):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        os.close(self._fd)
+        self._protocol.connection_lost(exc)
+
+
+class CN105SerialProtocol(asyncio.Protocol):
+    """Passes the received bytes to a CN105Server.
+
+        Args:
+            server (CN105Server): The server.
+    """
+    def __init__(self, server):
+        """Initializes the protocol.
+
+        Args:
+            server (CN105Server): The server.
+        """
+        self.server = server
+
+    def data_received(self, data:bytes):
+        self.server.data_received(data)
+
+    def connection_lost(self, exc):
+        self.server.connection_lost(exc)
+
+
+async def open_serial(server, path:str, baudrate:int=BAUDRATE, parity:str="E") -> CN105SerialTransport:
+    """Opens a serial port or pty for a CN105Server.
+
+    Args:
+        server (CN105Server): The server, that uses the port.
+        path (str): The path of the port (e.g. /dev/ttyUSB0).
+        baudrate (int, optional): The baudrate. Defaults to `BAUDRATE`.
+        parity (str, optional): "N", "E" or "O". Defaults to "E".
+
+    Returns:
+        CN105SerialTransport: The transport, it is also set as `server.transport`.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        configure(fd, baudrate, parity)
+    except Exception:
+        os.close(fd)
+        raise
+    transport = CN105SerialTransport(asyncio.get_running_loop(), fd, CN105SerialProtocol(server))
+    server.transport = transport
+    return transport
@@ -1,25 +1,14 @@
+import asyncio
+import os
+import random
+import sys
 
-START_BYTE = 0xfc
-PT_CONNECT_REQUEST = 0x5a
-PT_CONNECT_RESPONSE = 0x7a
-PT_GET_REQUEST = 0x42
-PT_GET_RESPONSE = 0x62
-PT_SET_REQUEST = 0x41
-PT_SET_RESPONSE = 0x61
-
-fields = {
-    0x02:{
-        "power": (3, 0x01),
-        "mode": (4, 0x02),
-        "tempSet": (5, 0x04),
-        "fan": (6, 0x08),
-        "vane": (7, 0x10),
-        "dir": (10, 0x80),
-    },
-    0x03:{
-        "tempRoom": (3, 0x00),
-    }
-}
+from cn105_adapter.cn105_adapter import START_BYTE, BAUDRATE, CN105FrameDecoder, \
+    PT_CONNECT_REQUEST, PT_CONNECT_RESPONSE, PT_GET_REQUEST, PT_GET_RESPONSE, PT_SET_REQUEST, PT_SET_RESPONSE, \
+    schemas
+
+if sys.platform != "win32":
+    import tty
 
 class CN105SimResponse:
     def __init__(self, packet_type, payload):
@@ -33,7 +22,7 @@ class CN105SimResponse:
         self.raw += self._crc()
     
     def _crc(self):
-        return [0xfc - (sum(self.raw) & 0xff)]
+        return [(0xfc - sum(self.raw)) & 0xff]
 
     def __str__(self):
         return f"CN105SimResponse(type=0x{self.packet_type:02x}, payload=[{', '.join(f'0x{x:02x}' for x in self.payload)}])"
@@ -45,8 +34,14 @@ class CN105SimConnectResponse(CN105SimResponse):
 
 
 class CN105SimGetDataResponse(CN105SimResponse):
-    def __init__(self, rtype=0x02):
-        super().__init__(packet_type=PT_GET_RESPONSE, payload=[rtype] + [0x00]*15)
+    def __init__(self, rtype=0x02, payload=None):
+        if payload is None:
+            payload = [rtype] + [0x00]*15
+        super().__init__(packet_type=PT_GET_RESPONSE, payload=list(payload))
+
+class CN105SimSetDataResponse(CN105SimResponse):
+    def __init__(self):
+        super().__init__(packet_type=PT_SET_RESPONSE, payload=[0x00]*16)
 
 class CN105SimRequest:
     def __init__(self, raw):
@@ -83,17 +78,211 @@ class CN105SimRequest:
         self._parse_payload()
 
     def _parse_payload(self):
-        if self.packet_type == PT_GET_RESPONSE:
-            rtype = self.payload[0]
-            if self.payload[0] in [0x02, 0x03]:
-                for key in fields[rtype]:
-                    pos = fields[rtype][key][0]
-                    self.data[key] = self.payload[pos]
-        elif self.packet_type == PT_SET_RESPONSE:
-            pass
+        if self.packet_type == PT_SET_REQUEST:
+            schema = schemas.get(self.payload[0])
+            if schema is not None:
+                for key, value in schema.decode(self.payload, 0).items():
+                    if self.payload[1] & schema.flags[schema.index[key]]:
+                        self.data[key] = value
         
     def __str__(self):
         return f"CN105SimRequest(type=0x{self.packet_type:02x}, payload=[{', '.join(f'0x{x:02x}' for x in self.payload)}])"
 
     def _check_crc(self):
-        return 0xfc - (sum(self.raw[:-1]) & 0xff) == self.raw[-1]
\ No newline at end of file
+        return (0xfc - sum(self.raw[:-1])) & 0xff == self.raw[-1]
+
+
+class CN105SimUnit:
+    """The state of a simulated indoor unit: the payloads of its info pages (rtype -> 16 bytes).
+
+    Set requests are applied to page 0x02, the compressor (page 0x06) runs, while the unit is on.
+    Pages, that aren't given, are all zero.
+    """
+    def __init__(self, pages=None):
+        self.pages = {}
+        if pages is not None:
+            for rtype in pages:
+                self.pages[rtype] = list(pages[rtype])
+
+    def page(self, rtype):
+        if rtype not in self.pages:
+            self.pages[rtype] = [rtype] + [0x00]*15
+        return self.pages[rtype]
+
+    def apply(self, request):
+        schema = schemas.get(request.payload[0])
+        if schema is None:
+            return
+        page = self.page(0x02)
+        for i in range(len(schema.names)):
+            if request.payload[1] & schema.flags[i]:
+                page[schema.positions[i]] = request.payload[schema.positions[i]]
+        if 0x06 in self.pages:
+            self.pages[0x06][3] = 40 if page[3] else 0
+            self.pages[0x06][4] = page[3]
+
+    def respond(self, request):
+        if request.packet_type == PT_CONNECT_REQUEST:
+            return CN105SimConnectResponse()
+        elif request.packet_type == PT_GET_REQUEST:
+            return CN105SimGetDataResponse(request.payload[0], self.page(request.payload[0]))
+        elif request.packet_type == PT_SET_REQUEST:
+            self.apply(request)
+            return CN105SimSetDataResponse()
+
+
+# A unit in heat mode, that is switched off: 22 degrees set, 21 degrees in the room
+DEFAULT_PAGES = {
+    0x02: [0x02, 0x00, 0x00, 0x00, 0x01, 0x09, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00],
+    0x03: [0x03, 0x00, 0x00, 0x0b, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00],
+    0x06: [0x06] + [0x00]*15,
+}
+
+
+class CN105SimStream:
+    """In-memory replacement for the UART streams of a CN105Server, that answers like the simulated AC.
+
+    Use it as reader and writer at the same time. `chunk` limits the bytes returned per read (to split
+    packets), `noise` is sent in front of every response. `unit` holds the info pages, that are returned
+    and changed by the requests. The next `drop` requests aren't answered.
+    Like a UART stream, read blocks until data arrives.
+    """
+    def __init__(self, delay=0.0, chunk=None, noise=b"", unit=None):
+        self.delay = delay
+        self.chunk = chunk
+        self.noise = noise
+        self.sent = []
+        self.unit = CN105SimUnit() if unit is None else unit
+        self.drop = 0
+        self._rx = bytearray()
+
+    def page(self, rtype):
+        return self.unit.page(rtype)
+
+    def write(self, buf):
+        request = CN105SimRequest([int(x) for x in buf])
+        self.sent.append(request)
+        if self.drop > 0:
+            self.drop -= 1
+            return
+        response = self.unit.respond(request)
+        self._rx += self.noise + bytes(response.raw)
+
+    async def drain(self):
+        pass
+
+    async def read(self, n=-1):
+        await asyncio.sleep(self.delay)
+        while not self._rx:
+            await asyncio.sleep(0.005)
+        if self.chunk is not None:
+            n = self.chunk
+        if n < 0:
+            n = len(self._rx)
+        raw = bytes(self._rx[:n])
+        self._rx = self._rx[n:]
+        return raw
+
+    def close(self):
+        pass
+
+
+class CN105Emulator:
+    """Emulates a heat pump on the master side of a pty, a CN105Server opens `path` (the slave side).
+
+    The emulator keeps the state of a CN105SimUnit. Responses are sent after `latency` plus a random
+    `jitter`, and, if `baud_timing` is set, paced like on a 2400 baud line (8E1). Faults are injected
+    with the given probabilities per response:
+
+        - drop_rate: the response is not sent at all
+        - byte_drop_rate: one byte of the response is dropped
+        - corrupt_rate: one byte of the response is flipped (the checksum doesn't match)
+        - split_rate: the response is sent in two parts, with a gap of `split_gap` in between
+
+    `stats` counts the requests and the injected faults. Only runs on Linux/macOS.
+    """
+    def __init__(self, unit=None, latency=0.01, jitter=0.0, baud_timing=True, drop_rate=0.0, byte_drop_rate=0.0,
+            corrupt_rate=0.0, split_rate=0.0, split_gap=0.02, seed=None):
+        self.unit = CN105SimUnit(DEFAULT_PAGES) if unit is None else unit
+        self.latency = latency
+        self.jitter = jitter
+        self.baud_timing = baud_timing
+        self.drop_rate = drop_rate
+        self.byte_drop_rate = byte_drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.split_rate = split_rate
+        self.split_gap = split_gap
+        self.random = random.Random(seed)
+        self.decoder = CN105FrameDecoder()
+        self.requests = []
+        self.stats = {"requests": 0, "dropped": 0, "byte_dropped": 0, "corrupted": 0, "split": 0}
+        self.path = None
+        self._master = None
+        self._queue = None
+        self._task = None
+
+    async def start(self):
+        """Opens the pty pair and starts answering. Returns the path of the slave side."""
+        self._master, slave = os.openpty()
+        # the slave side is opened again by the server, this keeps the pty open in between
+        self._slave = slave
+        tty.setraw(slave)
+        self.path = os.ttyname(slave)
+        os.set_blocking(self._master, False)
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self._master, self._read_ready)
+        self._task = asyncio.create_task(self._answer())
+        return self.path
+
+    def stop(self):
+        if self._master is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._master)
+        self._task.cancel()
+        os.close(self._master)
+        os.close(self._slave)
+        self._master = None
+
+    def _read_ready(self):
+        try:
+            data = os.read(self._master, 64)
+        except OSError:
+            return
+        for frame in self.decoder.decode(data):
+            request = CN105SimRequest(list(frame))
+            self.requests.append(request)
+            self.stats["requests"] += 1
+            self._queue.put_nowait((request, asyncio.get_running_loop().time()))
+
+    def byte_time(self, n):
+        return n * 11 / BAUDRATE if self.baud_timing else 0
+
+    async def _answer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request, received = await self._queue.get()
+            response = self.unit.respond(request)
+            # the request took its time on the line, before it was complete
+            delay = self.byte_time(len(request.raw)) + self.latency + self.random.uniform(0, self.jitter)
+            await asyncio.sleep(max(0, received + delay - loop.time()))
+            if self.random.random() < self.drop_rate:
+                self.stats["dropped"] += 1
+                continue
+            raw = bytearray(response.raw)
+            if self.random.random() < self.byte_drop_rate:
+                del raw[self.random.randrange(len(raw))]
+                self.stats["byte_dropped"] += 1
+            if self.random.random() < self.corrupt_rate:
+                raw[self.random.randrange(1, len(raw))] ^= 0x01
+                self.stats["corrupted"] += 1
+            parts = [raw]
+            if self.random.random() < self.split_rate:
+                i = self.random.randrange(1, len(raw))
+                parts = [raw[:i], raw[i:]]
+                self.stats["split"] += 1
+            for i in range(len(parts)):
+                if i > 0:
+                    await asyncio.sleep(self.split_gap)
+                await asyncio.sleep(self.byte_time(len(parts[i])))
+                os.write(self._master, bytes(parts[i]))
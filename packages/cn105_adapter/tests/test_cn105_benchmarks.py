@@ -0,0 +1,29 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import bench_codec
+
+
+class TestCN105Benchmarks(unittest.TestCase):
+    def test_all_cases_run(self):
+        results = bench_codec.run(n=20)
+        for rtype in (0x02, 0x03, 0x04, 0x05, 0x06, 0x09):
+            self.assertIn(f"encode.get_0x{rtype:02x}", results)
+            self.assertIn(f"cached.get_0x{rtype:02x}", results)
+            self.assertIn(f"decode.get_0x{rtype:02x}", results)
+        for name in results:
+            self.assertGreater(results[name]["fps"], 0)
+            self.assertGreaterEqual(results[name]["bytes"], 0)
+
+    def test_compare(self):
+        baseline = {"a": {"fps": 1000, "bytes": 100}, "b": {"fps": 1000, "bytes": 100}}
+        results = {
+            "a": {"fps": 950, "bytes": 100},
+            "b": {"fps": 850, "bytes": 100},
+            "c": {"fps": 1, "bytes": 1000},
+        }
+        self.assertEqual(bench_codec.compare(results, baseline), ["b"])
+        results["a"]["bytes"] = 120
+        self.assertEqual(bench_codec.compare(results, baseline), ["a", "b"])
@@ -0,0 +1,86 @@
+import unittest
+import os
+import random
+import tempfile
+import cn105_adapter
+from cn105_adapter import capture
+import ac_sim
+
+try:
+    import numpy
+    from cn105_adapter import bulk
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "numpy is required")
+class TestCN105BulkDecoder(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".cap")
+        os.close(fd)
+        os.remove(self.path)
+        rnd = random.Random(3)
+        writer = capture.CN105CaptureWriter(self.path, buffer_records=64)
+        for i in range(500):
+            writer.record(capture.DIRECTION_TX, cn105_adapter.GET_DATA_REQUESTS[0x02].frame)
+            payload = [0x02] + [rnd.randrange(0, 16) for j in range(15)]
+            frame = bytearray(ac_sim.CN105SimGetDataResponse(0x02, payload).raw)
+            if i % 10 == 0:
+                # broken checksum
+                frame[-1] ^= 0xff
+            elif i % 10 == 5:
+                # broken header
+                frame[3] = 0x31
+            writer.record(capture.DIRECTION_RX, frame)
+            writer.record(capture.DIRECTION_RX, bytes(ac_sim.CN105SimGetDataResponse(0x03, [0x03, 0, 0, i % 32] + [0]*12).raw))
+        writer.close()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_load(self):
+        records = bulk.load_capture(self.path)
+        self.assertEqual(len(records), 1500)
+        self.assertEqual(records["direction"][:3].tolist(), [0, 1, 1])
+        self.assertEqual(bytes(records["frame"][0][:records["length"][0]]), cn105_adapter.GET_DATA_REQUESTS[0x02].frame)
+
+    def test_valid_frames(self):
+        records = bulk.load_capture(self.path)
+        valid = bulk.valid_frames(records)
+        self.assertEqual(int(valid.sum()), 1500 - 100)
+        self.assertFalse(valid[1])
+        self.assertTrue(valid[2])
+
+    def test_columns_match_responses(self):
+        columns = bulk.decode_columns(self.path, 0x02, chunk=100)
+        responses = [r for r in capture.CN105Replay(self.path).responses() if r.raw[5] == 0x02]
+        self.assertEqual(len(columns["timestamp"]), 400)
+        self.assertEqual(len(responses), 400)
+        for name in cn105_adapter.schemas[0x02].names:
+            self.assertEqual(columns[name].tolist(), [r.data[name] for r in responses])
+
+    def test_selected_fields(self):
+        columns = bulk.decode_columns(self.path, 0x03, ["tempRoom"])
+        self.assertEqual(list(columns), ["timestamp", "tempRoom"])
+        self.assertEqual(columns["tempRoom"].tolist(), [i % 32 for i in range(500)])
+        phys = bulk.to_phys("tempRoom", columns["tempRoom"])
+        self.assertEqual(phys[:3].tolist(), [10.0, 11.0, 12.0])
+
+    def test_to_phys(self):
+        phys = bulk.to_phys("mode", numpy.array([1, 3, 4], dtype=numpy.uint8))
+        self.assertEqual(phys.tolist(), ["HEAT", "COOL", None])
+        phys = bulk.to_phys("tempSet", numpy.array([0, 0x1f, 200], dtype=numpy.uint8))
+        self.assertEqual(phys[:2].tolist(), [31, 16.5])
+        self.assertTrue(numpy.isnan(phys[2]))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            bulk.decode_columns(self.path, 0x07)
+        with self.assertRaises(ValueError):
+            bulk.decode_columns(self.path, 0x03, ["power"])
+
+    def test_empty_capture(self):
+        os.remove(self.path)
+        capture.CN105CaptureWriter(self.path).close()
+        columns = bulk.decode_columns(self.path, 0x02)
+        self.assertEqual(len(columns["power"]), 0)
@@ -0,0 +1,91 @@
+import unittest
+import asyncio
+import os
+import tempfile
+import cn105_adapter
+from cn105_adapter import capture
+import ac_sim
+
+
+class TestCN105Capture(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".cap")
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def record(self, speed_up=False):
+        writer = capture.CN105CaptureWriter(self.path, buffer_records=4)
+        adp = cn105_adapter.CN105Server(tx=0, verbose=False, capture=writer)
+        adp.sreader = adp.swriter = ac_sim.CN105SimStream(delay=0.02)
+        adp.sreader.page(0x03)[3] = 0x0b
+        await adp.connect()
+        await adp.get_data(2)
+        await adp.get_data(3)
+        await adp.set_data({"power": 1})
+        adp._stop_sim()
+        writer.close()
+        return writer
+
+    async def test_records(self):
+        writer = await self.record()
+        self.assertEqual(writer.records, 8)
+        self.assertEqual(os.path.getsize(self.path), capture.HEADER_SIZE + 8 * capture.RECORD_SIZE)
+        records = list(capture.read_capture(self.path))
+        self.assertEqual([r[1] for r in records], [capture.DIRECTION_TX, capture.DIRECTION_RX] * 4)
+        self.assertEqual(records[0][2], cn105_adapter.CONNECT_REQUEST.frame)
+        self.assertEqual(records[3][2][1], 0x62)
+        timestamps = [r[0] for r in records]
+        self.assertEqual(timestamps, sorted(timestamps))
+        # the responses took 20 ms each
+        self.assertGreater(timestamps[1] - timestamps[0], 15000)
+
+    async def test_append(self):
+        await self.record()
+        last = list(capture.read_capture(self.path))[-1][0]
+        await self.record()
+        records = list(capture.read_capture(self.path))
+        self.assertEqual(len(records), 16)
+        self.assertGreater(records[8][0], last)
+
+    async def test_close_flushes(self):
+        writer = capture.CN105CaptureWriter(self.path, buffer_records=16)
+        adp = cn105_adapter.CN105Server(tx=0, verbose=False, capture=writer)
+        adp.sreader = adp.swriter = ac_sim.CN105SimStream(delay=0.01)
+        await adp.connect()
+        await adp.get_data(2)
+        adp.close()
+        self.assertEqual(len(list(capture.read_capture(self.path))), 4)
+        writer.close()
+
+    def test_not_a_capture(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\x00" * 64)
+        with self.assertRaises(ValueError):
+            list(capture.read_capture(self.path))
+
+    async def test_responses(self):
+        await self.record()
+        responses = list(capture.CN105Replay(self.path).responses())
+        self.assertEqual([r.packet_type for r in responses], [0x7a, 0x62, 0x62, 0x61])
+        self.assertEqual(responses[2].data, {"tempRoom": 0x0b})
+
+    async def test_replay(self):
+        await self.record()
+        for speed in (1, 10, 0):
+            replay = capture.CN105Replay(self.path, speed=speed)
+            adp = cn105_adapter.CN105Server(tx=0, verbose=False, coalesce_window=0)
+            start = asyncio.get_running_loop().time()
+            responses = await replay.run(adp)
+            duration = asyncio.get_running_loop().time() - start
+            adp._stop_worker()
+            self.assertEqual([r.packet_type for r in responses], [0x7a, 0x62, 0x62, 0x61])
+            self.assertEqual(responses[2].data, {"tempRoom": 0x0b})
+            self.assertEqual(replay.unmatched, 0)
+            if speed == 1:
+                self.assertGreater(duration, 0.1)
+            else:
+                self.assertLess(duration, 0.05)
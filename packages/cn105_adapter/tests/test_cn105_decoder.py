@@ -0,0 +1,44 @@
+import unittest
+import cn105_adapter
+
+CONNECT_RESPONSE = bytes([0xfc, 0x7a, 0x01, 0x30, 0x01, 0x00, 0x54])
+GET_RESPONSE = bytes([0xfc, 0x62, 0x01, 0x30, 0x10, 0x02, 0x00, 0x00, 0x00, 0x02, 0x0e, 0x00, 0x07, 0x00, 0x00, 0x03, 0xa2, 0x32, 0x00, 0x00, 0x00, 0x6d])
+
+class TestCN105FrameDecoder(unittest.TestCase):
+    def setUp(self):
+        self.decoder = cn105_adapter.CN105FrameDecoder()
+
+    def test_single_frame(self):
+        self.assertEqual(list(self.decoder.decode(GET_RESPONSE)), [GET_RESPONSE])
+        self.assertEqual(self.decoder.resyncs, 0)
+
+    def test_split_frame(self):
+        self.assertEqual(list(self.decoder.decode(GET_RESPONSE[:3])), [])
+        self.assertEqual(list(self.decoder.decode(GET_RESPONSE[3:10])), [])
+        self.assertEqual(list(self.decoder.decode(GET_RESPONSE[10:])), [GET_RESPONSE])
+
+    def test_merged_frames(self):
+        frames = list(self.decoder.decode(CONNECT_RESPONSE + GET_RESPONSE + CONNECT_RESPONSE))
+        self.assertEqual(frames, [CONNECT_RESPONSE, GET_RESPONSE, CONNECT_RESPONSE])
+
+    def test_noise_is_skipped(self):
+        frames = list(self.decoder.decode(b"\x00\x13\xfc\x01" + GET_RESPONSE + b"\xfc\xfc" + CONNECT_RESPONSE))
+        self.assertEqual(frames, [GET_RESPONSE, CONNECT_RESPONSE])
+        self.assertGreater(self.decoder.resyncs, 0)
+
+    def test_wrong_crc_is_skipped(self):
+        broken = GET_RESPONSE[:-1] + b"\x00"
+        frames = list(self.decoder.decode(broken + CONNECT_RESPONSE))
+        self.assertEqual(frames, [CONNECT_RESPONSE])
+        self.assertEqual(self.decoder.crc_errors, 1)
+
+    def test_buffer_is_reused(self):
+        for i in range(100):
+            for j in range(0, len(GET_RESPONSE), 5):
+                frames = list(self.decoder.decode(GET_RESPONSE[j:j+5]))
+            self.assertEqual(frames, [GET_RESPONSE])
+        self.assertEqual(len(self.decoder._buf), 64)
+
+    def test_overflow_drops_oldest_bytes(self):
+        frames = list(self.decoder.decode(b"\xfc\x62\x01\x30\x10" + bytes(100) + CONNECT_RESPONSE))
+        self.assertEqual(frames, [CONNECT_RESPONSE])
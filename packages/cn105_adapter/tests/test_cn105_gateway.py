@@ -0,0 +1,146 @@
+import unittest
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "http_server"))
+import cn105_adapter
+from cn105_adapter import gateway
+import ac_sim
+
+
+class TestCN105StateStore(unittest.TestCase):
+    def test_update(self):
+        store = gateway.CN105StateStore()
+        store.add("a")
+        self.assertTrue(store.update("a", {"power": 1, "tempRoom": 12}))
+        self.assertFalse(store.update("a", {"power": 1}))
+        self.assertEqual(store.versions["a"], 1)
+        self.assertEqual(store.get("a"), {"power": "ON", "tempRoom": 22})
+
+    def test_unmapped_fields_are_raw(self):
+        store = gateway.CN105StateStore()
+        store.add("a")
+        store.update("a", {"compressorFrequency": 42})
+        self.assertEqual(store.get("a"), {"compressorFrequency": 42})
+
+
+class TestCN105Gateway(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.gateway = gateway.CN105Gateway()
+        self.streams = {}
+
+    def add_units(self, n):
+        for i in range(n):
+            server = cn105_adapter.CN105Server(tx=0, verbose=False)
+            self.streams[f"unit{i}"] = server.sreader = server.swriter = ac_sim.CN105SimStream()
+            self.gateway.add_unit(f"unit{i}", server=server, intervals={0x02: 10, 0x03: 10})
+
+    async def asyncTearDown(self):
+        await self.gateway.stop()
+
+    async def test_units_are_polled(self):
+        self.add_units(3)
+        self.streams["unit1"].page(0x02)[3] = 1
+        await self.gateway.start()
+        await asyncio.sleep(0.05)
+        for name, stream in self.streams.items():
+            self.assertEqual([r.packet_type for r in stream.sent], [0x5a, 0x42, 0x42])
+            self.assertEqual(self.gateway.state(name)["connectionState"], cn105_adapter.STATE_CONNECTED)
+        self.assertEqual(self.gateway.state("unit0")["power"], "OFF")
+        self.assertEqual(self.gateway.state("unit1")["power"], "ON")
+
+    async def test_many_units(self):
+        self.add_units(40)
+        await self.gateway.start()
+        for i in range(100):
+            await asyncio.sleep(0.02)
+            if min(self.gateway.store.versions.values()) == 2:
+                break
+        for name in self.streams:
+            self.assertEqual(self.gateway.store.versions[name], 2)
+            self.assertEqual(len(self.gateway.units[name].server._queue), 0)
+
+    async def test_set_state(self):
+        self.add_units(2)
+        await self.gateway.start()
+        await asyncio.sleep(0.05)
+        state = await self.gateway.set_state("unit1", {"power": "on", "tempSet": 22.5})
+        self.assertEqual(state["power"], "ON")
+        self.assertEqual(state["tempSet"], 22.5)
+        self.assertEqual(state["version"], 3)
+        self.assertEqual(self.streams["unit1"].page(0x02)[3], 1)
+        self.assertEqual(self.streams["unit0"].page(0x02)[3], 0)
+        # the state is written through, no extra get requests are sent
+        await asyncio.sleep(0.05)
+        self.assertEqual([r.packet_type for r in self.streams["unit1"].sent], [0x5a, 0x42, 0x42, 0x41])
+
+    async def test_stop_ends_pollers(self):
+        self.add_units(2)
+        await self.gateway.start()
+        await asyncio.sleep(0.05)
+        tasks = [unit.task for unit in self.gateway.units.values()]
+        await self.gateway.stop()
+        self.assertTrue(all(task.done() for task in tasks))
+        await asyncio.sleep(0.05)
+        # the workers of the links aren't restarted
+        for unit in self.gateway.units.values():
+            self.assertIsNone(unit.server._worker)
+
+    async def test_metrics(self):
+        self.add_units(2)
+        await self.gateway.start()
+        for i in range(100):
+            await asyncio.sleep(0.02)
+            if min(self.gateway.store.versions.values()) == 2:
+                break
+        text = self.gateway.metrics()
+        self.assertIn('cn105_connected{unit="unit0"} 1', text)
+        self.assertIn('cn105_transactions_total{unit="unit1"} 3', text)
+        self.assertIn('cn105_rtt_seconds_bucket{unit="unit0",type="get",le="+Inf"} 2', text)
+        self.assertIn('cn105_rtt_seconds_count{unit="unit0",type="connect"} 1', text)
+        self.assertIn('cn105_queue_wait_seconds_count{unit="unit1"} 3', text)
+        self.assertTrue(text.endswith("\n"))
+
+    def test_prometheus_buckets_are_cumulative(self):
+        stats = cn105_adapter.CN105Server(tx=0, verbose=False).stats()
+        stats["rttMs"]["get"] = {"le": [100, 200], "counts": [1, 2, 3], "count": 6, "sum": 1500}
+        lines = gateway.to_prometheus({"a": stats}).splitlines()
+        self.assertIn('cn105_rtt_seconds_bucket{unit="a",type="get",le="0.1"} 1', lines)
+        self.assertIn('cn105_rtt_seconds_bucket{unit="a",type="get",le="0.2"} 3', lines)
+        self.assertIn('cn105_rtt_seconds_bucket{unit="a",type="get",le="+Inf"} 6', lines)
+        self.assertIn('cn105_rtt_seconds_sum{unit="a",type="get"} 1.5', lines)
+        self.assertIn('cn105_connected{unit="a"} 0', lines)
+
+    def test_invalid_set_state(self):
+        with self.assertRaises(ValueError):
+            self.gateway.to_raw({"tempRoom": 22})
+        with self.assertRaises(ValueError):
+            self.gateway.to_raw({"power": "maybe"})
+
+    def test_duplicate_unit(self):
+        self.add_units(1)
+        with self.assertRaises(ValueError):
+            self.gateway.add_unit("unit0", url="/dev/null")
+
+    @unittest.skipIf(gateway.http_server is None, "http_server package required")
+    def test_register(self):
+        self.add_units(2)
+        srv = gateway.http_server.HttpServer()
+        self.gateway.register(srv)
+        self.assertIn("/units", srv.routes)
+        self.assertIn("/metrics", srv.routes)
+        self.assertIn("/units/{name}/state", srv.async_routes)
+        node, params = srv.compile().match("/units/unit1/state")
+        self.assertEqual(params, {"name": "unit1"})
+        self.assertEqual(node.methods["POST"], (True, "/units/{name}/state"))
+
+    @unittest.skipIf(gateway.http_server is None, "http_server package required")
+    async def test_unknown_unit_is_404(self):
+        self.add_units(1)
+        for method in ("GET", "POST"):
+            request = gateway.http_server.HttpRequest(method, "/units/nope/state", "HTTP/1.1", None, None)
+            request.params = {"name": "nope"}
+            request.body = {"power": "on"}
+            response = await self.gateway._state_route(request)
+            self.assertEqual(response.code, 404)
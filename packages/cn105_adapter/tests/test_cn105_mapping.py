@@ -63,4 +63,30 @@ class TestHttpServer(unittest.TestCase):
         self.assertTrue(cn105_adapter.physToRaw(cn105_adapter.tempRoomMapping, 10) == 0)
         self.assertTrue(cn105_adapter.physToRaw(cn105_adapter.tempRoomMapping, 18) == 8)
         self.assertTrue(cn105_adapter.physToRaw(cn105_adapter.tempRoomMapping, 21) == 11)
-        self.assertTrue(cn105_adapter.physToRaw(cn105_adapter.tempRoomMapping, 25) == 15)
\ No newline at end of file
+        self.assertTrue(cn105_adapter.physToRaw(cn105_adapter.tempRoomMapping, 25) == 15)
+
+    def test_tempSetMapping_half_degree(self):
+        self.assertTrue(cn105_adapter.rawToPhys(cn105_adapter.tempSetMapping, 0x10) == 31.5)
+        self.assertTrue(cn105_adapter.rawToPhys(cn105_adapter.tempSetMapping, 0x1b) == 20.5)
+        self.assertTrue(cn105_adapter.physToRaw(cn105_adapter.tempSetMapping, 20.5) == 0x1b)
+        self.assertTrue(cn105_adapter.physToRaw(cn105_adapter.tempSetMapping, 20.0) == 11)
+
+    def test_unknown_values(self):
+        self.assertTrue(cn105_adapter.rawToPhys(cn105_adapter.modeMapping, 4) is None)
+        self.assertTrue(cn105_adapter.rawToPhys(cn105_adapter.modeMapping, 200) is None)
+        self.assertTrue(cn105_adapter.rawToPhys(cn105_adapter.modeMapping, -1) is None)
+        self.assertTrue(cn105_adapter.physToRaw(cn105_adapter.modeMapping, "WARM") is None)
+
+    def test_compiled_tables(self):
+        for mapping in [cn105_adapter.powerMapping, cn105_adapter.modeMapping, cn105_adapter.tempSetMapping,
+                        cn105_adapter.tempRoomMapping, cn105_adapter.fanMapping, cn105_adapter.vaneMapping,
+                        cn105_adapter.dirMapping]:
+            for raw, phys in mapping:
+                self.assertTrue(cn105_adapter.rawToPhys(mapping, raw) == phys)
+                self.assertTrue(cn105_adapter.physToRaw(mapping, phys) == raw)
+
+    def test_plain_list_mapping(self):
+        mapping = [(0x00, "OFF"), (0x01, "ON")]
+        self.assertTrue(cn105_adapter.rawToPhys(mapping, 1) == "ON")
+        self.assertTrue(cn105_adapter.physToRaw(mapping, "off") == 0)
+
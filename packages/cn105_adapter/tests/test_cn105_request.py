@@ -47,4 +47,25 @@ class TestHttpServer(unittest.TestCase):
         self.assertTrue(str(req) == "CN105Request(type=0x41, payload=[0x02, 0x07, 0x00, 0x01, 0x03, 0x03, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])")
         self.assertTrue(req.raw == [0xfc, 0x41, 0x01, 0x30, 0x10, 0x02, 0x07, 0x00, 0x01, 0x03, 0x03, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x6E])
 
-        
\ No newline at end of file
+    def test_cn105_request_frame(self):
+        req = cn105_adapter.CN105SetDataRequest(data={"power": 1, "mode": 8, "tempSet": 15, "fan": 6, "vane": 7, "dir": 12})
+        # the checksum wraps around
+        self.assertTrue(req.raw[-1] == 0xac)
+        self.assertTrue(req.frame == bytes(req.raw))
+        self.assertTrue(req.frame is req.frame)
+
+    def test_cn105_set_request_uses_preallocated_frame(self):
+        req = cn105_adapter.CN105SetDataRequest(data={"power": 1, "mode": 3, "tempSet": 3})
+        self.assertTrue(type(req.payload) is bytearray)
+        server = cn105_adapter.CN105Server(tx=0, verbose=False)
+        frame = server._frame(req)
+        self.assertTrue(frame is server._set_frame)
+        self.assertTrue(frame == req.frame)
+
+    def test_cn105_constant_requests(self):
+        self.assertTrue(cn105_adapter.CONNECT_REQUEST.frame == bytes([0xfc, 0x5a, 0x01, 0x30, 0x02, 0xca, 0x01, 0xa8]))
+        self.assertTrue(type(cn105_adapter.CONNECT_REQUEST.frame) is bytes)
+        for rtype in (0x02, 0x03):
+            req = cn105_adapter.GET_DATA_REQUESTS[rtype]
+            self.assertTrue(req.frame == bytes(cn105_adapter.CN105GetDataRequest(rtype=rtype).raw))
+
@@ -21,4 +21,33 @@ class TestHttpServer(unittest.TestCase):
         self.assertTrue(str(req) == "CN105Response(type=0x61, payload=[0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])")
         self.assertTrue(req.packet_type == 0x61)
         self.assertTrue(req.payload == [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
-        self.assertTrue(req.data == {})
\ No newline at end of file
+        self.assertTrue(req.data == {})
+
+    def test_cn105_response_from_buffers(self):
+        raw = [0xfc, 0x62, 0x01, 0x30, 0x10, 0x02, 0x00, 0x00, 0x00, 0x02, 0x0e, 0x00, 0x07, 0x00, 0x00, 0x03, 0xa2, 0x32, 0x00, 0x00, 0x00, 0x6d]
+        for buf in [bytes(raw), bytearray(raw), memoryview(bytes(raw)), memoryview(bytearray([0x00] + raw))[1:]]:
+            req = cn105_adapter.CN105Response(buf)
+            self.assertTrue(req.raw is buf)
+            self.assertTrue(req.packet_type == 0x62)
+            self.assertTrue(req.payload == raw[5:-1])
+            self.assertTrue(req.data == {'power': 0, 'mode': 2, 'tempSet': 14, 'fan': 0, 'vane': 7, 'dir': 3})
+
+    def test_cn105_response_same_payload(self):
+        raw = [0xfc, 0x62, 0x01, 0x30, 0x10, 0x02, 0x00, 0x00, 0x00, 0x02, 0x0e, 0x00, 0x07, 0x00, 0x00, 0x03, 0xa2, 0x32, 0x00, 0x00, 0x00, 0x6d]
+        req = cn105_adapter.CN105Response(memoryview(bytes(raw)))
+        self.assertTrue(req.same_payload(bytes(raw[5:-1])))
+        self.assertFalse(req.same_payload(bytes(raw[5:-2])))
+        self.assertFalse(req.same_payload(bytes([0x02] + [0x00]*15)))
+        self.assertFalse(req.same_payload(None))
+        self.assertTrue(req.payload is req.payload)
+
+    def test_cn105_response_errors(self):
+        raw = bytes([0xfc, 0x7a, 0x01, 0x30, 0x01, 0x00, 0x54])
+        with self.assertRaises(ValueError):
+            cn105_adapter.CN105Response(raw[:-1])
+        with self.assertRaises(ValueError):
+            cn105_adapter.CN105Response(raw + b"\x00")
+        with self.assertRaises(ValueError):
+            cn105_adapter.CN105Response(raw[:3] + b"\x31" + raw[4:])
+        with self.assertRaises(ValueError):
+            cn105_adapter.CN105Response(raw[:-1] + b"\x55")
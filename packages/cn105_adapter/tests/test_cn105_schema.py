@@ -0,0 +1,39 @@
+import unittest
+import cn105_adapter
+
+GET_RESPONSE = bytes([0xfc, 0x62, 0x01, 0x30, 0x10, 0x02, 0x00, 0x00, 0x01, 0x01, 0x1b, 0x00, 0x07, 0x00, 0x00, 0x03, 0xa2, 0x32, 0x00, 0x00, 0x00, 0x6d])
+
+class TestCN105Schema(unittest.TestCase):
+    def test_schemas_are_compiled_from_fields(self):
+        for rtype, layout in cn105_adapter.fields.items():
+            schema = cn105_adapter.schemas[rtype]
+            self.assertEqual(schema.names, tuple(layout))
+            self.assertEqual(schema.positions, tuple(layout[name][0] for name in layout))
+            self.assertEqual(schema.flags, tuple(layout[name][1] for name in layout))
+
+    def test_record(self):
+        schema = cn105_adapter.schemas[0x02]
+        self.assertEqual(schema.record(GET_RESPONSE), (0x01, 0x01, 0x1b, 0x00, 0x07, 0x03))
+        self.assertEqual(schema.record(GET_RESPONSE[5:], 0), (0x01, 0x01, 0x1b, 0x00, 0x07, 0x03))
+
+    def test_decode(self):
+        data = cn105_adapter.schemas[0x02].decode(GET_RESPONSE)
+        self.assertEqual(data, {'power': 1, 'mode': 1, 'tempSet': 0x1b, 'fan': 0, 'vane': 7, 'dir': 3})
+        self.assertEqual(cn105_adapter.schemas[0x02].to_phys(data),
+                         {'power': "ON", 'mode': "HEAT", 'tempSet': 20.5, 'fan': "AUTO", 'vane': "SWING", 'dir': "|"})
+
+    def test_encode(self):
+        payload = cn105_adapter.schemas[0x01].encode({"power": 1, "dir": 3}, [0x01] + [0x00]*15)
+        self.assertEqual(payload, [0x01, 0x81, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x03, 0x00, 0x00, 0x00, 0x00, 0x00])
+        with self.assertRaises(ValueError):
+            cn105_adapter.schemas[0x01].encode({"tempRoom": 1}, [0x01] + [0x00]*15)
+
+    def test_merge(self):
+        schema = cn105_adapter.schemas[0x02]
+        payload = schema.encode({"power": 1, "mode": 3}, [0x02] + [0x00]*15)
+        update = schema.encode({"power": 0, "fan": 2}, [0x02] + [0x00]*15)
+        self.assertEqual(schema.merge(payload, update), schema.encode({"power": 0, "mode": 3, "fan": 2}, [0x02] + [0x00]*15))
+
+    def test_set_request_with_unknown_rtype(self):
+        with self.assertRaises(ValueError):
+            cn105_adapter.CN105SetDataRequest(rtype=0x09, data={"power": 1})
@@ -2,56 +2,431 @@ import unittest
 import cn105_adapter
 import asyncio
 import sys
-import platform
 import ac_sim
 
-if sys.implementation.name == "cpython":
-    from serial_asyncio import open_serial_connection
-
+@unittest.skipIf(sys.platform == "win32", "ptys are required")
 class TestAscyncHttpServer(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
-        if platform.node() != "Tobias-DellXPS":
-            # Tests will fail, if there is no COM50 <--> COM51 connection.
-            self.skipTest("specific setup required")
-        self.sim_running = True
-
-        async def run_sim():
-            self.reader, self.writer = await open_serial_connection(url='COM51', baudrate=2400)
-            while self.sim_running:
-                raw = await self.reader.read(30)
-                raw = [int(x) for x in raw]
-                #print(" ".join([f"{x:02x}" for x in raw]))
-                request = ac_sim.CN105SimRequest(raw)
-                print(f"Server Receiving: {request}")
-                if request.packet_type == ac_sim.PT_CONNECT_REQUEST:
-                    response = ac_sim.CN105SimConnectResponse()
-                if request.packet_type == ac_sim.PT_GET_REQUEST:
-                    response = ac_sim.CN105SimGetDataResponse()
-                print(f"Server Sending: {request}")
-                self.writer.write(bytearray(response.raw))
-                await self.writer.drain()
-
-        self.task = asyncio.create_task(run_sim())
-        return await super().asyncSetUp()
+        # the emulated heat pump runs on a pty pair
+        self.emulator = ac_sim.CN105Emulator(seed=1)
+        await self.emulator.start()
+        self.adp = cn105_adapter.CN105Server(tx=0)
+        await self.adp.open(self.emulator.path)
 
     async def asyncTearDown(self):
-        self.sim_running = False
-        self.writer.close()
-        self.task.cancel()
-        asyncio.ensure_future(self.task)
-        return await super().asyncTearDown()
-    
+        self.adp.close()
+        self.emulator.stop()
+
     async def test_connect(self):
-        adp = cn105_adapter.CN105Server(tx=0)
-        await adp._start_sim()
-        await adp.connect()
-        adp._stop_sim()
-    
+        self.assertTrue(await self.adp.connect())
+
     async def test_getData(self):
-        adp = cn105_adapter.CN105Server(tx=0)
-        await adp._start_sim()
-        await adp.connect()
-        state = await adp.get_data(2)
-        self.assertTrue(state.data == {'power': 0, 'mode': 0, 'tempSet': 0, 'fan': 0, 'vane': 0, 'dir': 0})
-        adp._stop_sim()
-        
\ No newline at end of file
+        await self.adp.connect()
+        state = await self.adp.get_data(2)
+        self.assertTrue(state.data == {'power': 0, 'mode': 1, 'tempSet': 9, 'fan': 0, 'vane': 0, 'dir': 0})
+        state = await self.adp.get_data(3)
+        self.assertEqual(cn105_adapter.rawToPhys(cn105_adapter.tempRoomMapping, state.data["tempRoom"]), 21)
+
+    async def test_setData(self):
+        await self.adp.connect()
+        await self.adp.set_data({"power": 1, "tempSet": 5})
+        state = await self.adp.get_data(2)
+        self.assertEqual(state.data["power"], 1)
+        self.assertEqual(state.data["tempSet"], 5)
+        state = await self.adp.get_data(6)
+        self.assertEqual(state.data["operating"], 1)
+
+    async def test_line_timing(self):
+        await self.adp.connect()
+        start = asyncio.get_running_loop().time()
+        await self.adp.get_data(2)
+        # 22 bytes each way at 2400 baud (8E1) plus the latency of the unit
+        self.assertGreater(asyncio.get_running_loop().time() - start, 2 * cn105_adapter.cn105_adapter.PACKET_TIME_MS / 1000)
+
+
+@unittest.skipIf(sys.platform == "win32", "ptys are required")
+class TestCN105EmulatorFaults(unittest.IsolatedAsyncioTestCase):
+    async def start(self, **kwargs):
+        self.emulator = ac_sim.CN105Emulator(baud_timing=False, latency=0.002, seed=2, **kwargs)
+        await self.emulator.start()
+        self.adp = cn105_adapter.CN105Server(tx=0, verbose=False, response_timeout=0.05, retries=5)
+        await self.adp.open(self.emulator.path)
+
+    async def asyncTearDown(self):
+        self.adp.close()
+        self.emulator.stop()
+
+    async def run_gets(self, n):
+        for i in range(n):
+            response = await self.adp.get_data(2)
+            self.assertEqual(response.raw[5], 2)
+
+    async def test_split_frames(self):
+        await self.start(split_rate=1.0)
+        await self.run_gets(10)
+        self.assertEqual(self.emulator.stats["split"], 10)
+        self.assertEqual(self.adp.retry_count, 0)
+
+    async def test_corrupted_frames_are_retried(self):
+        await self.start(corrupt_rate=0.3)
+        await self.run_gets(20)
+        self.assertGreater(self.emulator.stats["corrupted"], 0)
+        self.assertEqual(self.adp.retry_count, self.emulator.stats["corrupted"])
+        self.assertEqual(self.adp.decoder.crc_errors + self.adp.decoder.resyncs > 0, True)
+
+    async def test_dropped_bytes_and_frames_are_retried(self):
+        await self.start(drop_rate=0.2, byte_drop_rate=0.2, jitter=0.01)
+        await self.run_gets(20)
+        self.assertEqual(self.adp.retry_count, self.emulator.stats["dropped"] + self.emulator.stats["byte_dropped"])
+        self.assertEqual(self.emulator.stats["requests"], 20 + self.adp.retry_count)
+
+
+class TestCN105ServerQueue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.adp = cn105_adapter.CN105Server(tx=0)
+        self.stream = ac_sim.CN105SimStream(delay=0.01)
+        self.adp.sreader = self.stream
+        self.adp.swriter = self.stream
+
+    def tearDown(self):
+        self.adp._stop_sim()
+
+    async def test_requests_are_sent_in_order(self):
+        responses = await asyncio.gather(
+            self.adp.get_data(2),
+            self.adp.get_data(3),
+        )
+        self.assertEqual([r.packet_type for r in responses], [0x62, 0x62])
+        self.assertEqual([r.payload[0] for r in self.stream.sent], [0x02, 0x03])
+
+    async def test_set_goes_ahead_of_queued_gets(self):
+        responses = await asyncio.gather(
+            self.adp.get_data(2),
+            self.adp.get_data(3),
+            self.adp.set_data({"power": 1}),
+        )
+        self.assertEqual([r.packet_type for r in responses], [0x62, 0x62, 0x61])
+        self.assertEqual([r.packet_type for r in self.stream.sent], [0x41, 0x42, 0x42])
+        self.assertEqual(self.stream.sent[1].payload[0], 0x02)
+
+    async def test_duplicate_get_joins_queued_one(self):
+        responses = await asyncio.gather(
+            self.adp.get_data(2),
+            self.adp.get_data(2),
+        )
+        self.assertIs(responses[0], responses[1])
+        self.assertEqual(len(self.stream.sent), 1)
+
+    async def test_stale_get_is_dropped(self):
+        self.adp.max_poll_age_ms = -1
+        with self.assertRaises(ValueError):
+            await self.adp.get_data(2)
+        self.assertEqual(len(self.stream.sent), 0)
+        # commands are never dropped
+        response = await self.adp.set_data({"power": 1})
+        self.assertEqual(response.packet_type, 0x61)
+
+    async def test_latency_bound(self):
+        module = cn105_adapter.cn105_adapter
+        transaction = 3 * module.TRANSACTION_TIME_MS + 2 * (module.RETRY_DELAY_MS + module.RETRY_JITTER_MS)
+        self.assertEqual(self.adp.latency_bound(), (2 * transaction + 50) / 1000)
+        await asyncio.gather(*[self.adp.get_data(rtype) for rtype in (2, 3)], self.adp.set_data({"power": 1}))
+        self.assertLessEqual(self.adp.max_wait_ms[0x41], self.adp.latency_bound() * 1000)
+
+    async def test_latency_bound_with_dropped_responses(self):
+        # the responses to the poll on the bus get lost twice, the set request waits for all its attempts
+        self.stream.drop = 2
+        poll = asyncio.create_task(self.adp.get_data(2))
+        await asyncio.sleep(0)
+        bound = self.adp.latency_bound()
+        start = asyncio.get_running_loop().time()
+        await self.adp.set_data({"power": 1})
+        elapsed = asyncio.get_running_loop().time() - start
+        await poll
+        self.assertEqual(self.adp.retry_count, 2)
+        self.assertGreater(elapsed, 2 * self.adp.response_timeout_ms / 1000)
+        self.assertLessEqual(elapsed, bound)
+
+    async def test_waiting_caller_is_woken_without_delay(self):
+        start = asyncio.get_running_loop().time()
+        await asyncio.gather(self.adp.get_data(2), self.adp.set_data({"power": 1}))
+        # two round trips of 10 ms each, no polling sleeps in between
+        self.assertLess(asyncio.get_running_loop().time() - start, 0.5)
+
+    async def test_no_request_is_built_for_polling(self):
+        frames = []
+        write = self.stream.write
+        self.stream.write = lambda buf: (frames.append(buf), write(buf))
+        await self.adp.connect()
+        await self.adp.get_data(2)
+        await self.adp.get_data(3)
+        self.assertIs(frames[0], cn105_adapter.CONNECT_REQUEST.frame)
+        self.assertIs(frames[1], cn105_adapter.GET_DATA_REQUESTS[0x02].frame)
+        self.assertIs(frames[2], cn105_adapter.GET_DATA_REQUESTS[0x03].frame)
+
+    async def test_set_request_is_patched_in_place(self):
+        await self.adp.set_data({"power": 1})
+        await self.adp.set_data({"mode": 8, "tempSet": 15})
+        self.assertEqual(self.stream.sent[0].raw, cn105_adapter.CN105SetDataRequest(data={"power": 1}).raw)
+        self.assertEqual(self.stream.sent[1].raw, cn105_adapter.CN105SetDataRequest(data={"mode": 8, "tempSet": 15}).raw)
+
+    async def test_split_and_noisy_responses(self):
+        self.stream.chunk = 5
+        self.stream.noise = b"\x00\xfc\x13"
+        response = await self.adp.get_data(2)
+        self.assertEqual(response.packet_type, 0x62)
+        response = await self.adp.set_data({"power": 1})
+        self.assertEqual(response.packet_type, 0x61)
+        self.assertGreater(self.adp.decoder.resyncs, 0)
+
+    async def test_missing_response_is_raised_to_caller(self):
+        self.stream.write = lambda buf: None
+        with self.assertRaises(ValueError):
+            await self.adp.get_data(2)
+        self.assertFalse(self.adp.waiting_for_response)
+
+    async def test_close_fails_pending_transactions(self):
+        self.stream.write = lambda buf: None
+        tasks = [asyncio.create_task(self.adp.get_data(rtype)) for rtype in (2, 3)]
+        tasks.append(asyncio.create_task(self.adp.set_data({"power": 1})))
+        await asyncio.sleep(0.02)
+        self.adp.close()
+        results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+        self.assertEqual(self.adp._queue, [])
+
+    async def test_concurrent_sets_are_coalesced(self):
+        responses = await asyncio.gather(
+            self.adp.set_data({"mode": 1}),
+            self.adp.set_data({"tempSet": 5}),
+            self.adp.set_data({"fan": 2}),
+        )
+        self.assertEqual(len(self.stream.sent), 1)
+        self.assertEqual(self.stream.sent[0].payload, [0x02, 0x0e, 0x00, 0x00, 0x01, 0x05, 0x02] + [0x00]*9)
+        self.assertIs(responses[0], responses[1])
+        self.assertIs(responses[0], responses[2])
+
+    async def test_coalesced_set_last_write_wins(self):
+        async def set_later():
+            await asyncio.sleep(0.02)
+            return await self.adp.set_data({"power": 0, "fan": 3})
+        await asyncio.gather(self.adp.set_data({"power": 1, "mode": 3}), set_later())
+        self.assertEqual(len(self.stream.sent), 1)
+        self.assertEqual(self.stream.sent[0].payload[1], 0x0b)
+        self.assertEqual(self.stream.sent[0].payload[3:7], [0x00, 0x03, 0x00, 0x03])
+
+    async def test_set_after_window_is_sent_separately(self):
+        self.adp.coalesce_window_ms = 0
+        await self.adp.set_data({"power": 1})
+        await self.adp.set_data({"power": 0})
+        self.assertEqual(len(self.stream.sent), 2)
+
+
+class TestCN105Poller(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.adp = cn105_adapter.CN105Server(tx=0)
+        self.stream = ac_sim.CN105SimStream()
+        self.adp.sreader = self.stream
+        self.adp.swriter = self.stream
+
+    def tearDown(self):
+        self.adp._stop_sim()
+
+    def count(self, rtype):
+        return len([r for r in self.stream.sent if r.packet_type == 0x42 and r.payload[0] == rtype])
+
+    async def test_all_info_pages(self):
+        poller = cn105_adapter.CN105Poller(self.adp)
+        responses = await poller.poll()
+        self.assertEqual([r.raw[5] for r in responses], list(cn105_adapter.POLL_INTERVALS))
+        self.assertEqual(responses[4].data, {'compressorFrequency': 0, 'operating': 0})
+        # nothing is due right after polling
+        self.assertEqual(await poller.poll(), [])
+        self.assertAlmostEqual(poller.next_delay(), 1, delta=0.1)
+
+    async def test_pages_are_polled_on_their_own_interval(self):
+        received = []
+        poller = cn105_adapter.CN105Poller(self.adp, intervals={0x02: 0.2, 0x03: 0.04}, on_response=received.append)
+        task = asyncio.create_task(poller.run())
+        await asyncio.sleep(0.3)
+        task.cancel()
+        self.assertEqual(self.stream.sent[0].packet_type, 0x5a)
+        self.assertEqual(self.count(0x02), 2)
+        self.assertGreaterEqual(self.count(0x03), 5)
+        # the last request may still be waiting for its response
+        self.assertLessEqual(self.count(0x02) + self.count(0x03) - len(received), 1)
+
+    async def test_unchanged_page_backs_off(self):
+        poller = cn105_adapter.CN105Poller(self.adp, intervals={0x02: 0.4}, min_intervals={0x02: 0.05})
+        task = asyncio.create_task(poller.run())
+        await asyncio.sleep(0.5)
+        task.cancel()
+        # polled after 0, 0.05, 0.15, 0.35 s, then the interval stays at 0.4 s
+        self.assertEqual(self.count(0x02), 4)
+        self.assertEqual(poller._interval[0x02], 0.4)
+
+    async def test_change_resets_interval(self):
+        poller = cn105_adapter.CN105Poller(self.adp, intervals={0x02: 0.4}, min_intervals={0x02: 0.05})
+        await poller.poll()
+        poller._due[0x02] = cn105_adapter.cn105_adapter._ticks_ms()
+        await poller.poll()
+        self.assertEqual(poller._interval[0x02], 0.2)
+        self.stream.page(0x02)[3] = 0x01
+        poller._due[0x02] = cn105_adapter.cn105_adapter._ticks_ms()
+        await poller.poll()
+        self.assertEqual(poller._interval[0x02], 0.1)
+        self.assertAlmostEqual(poller.next_delay(), 0.05, delta=0.02)
+
+    async def test_wake_polls_now(self):
+        poller = cn105_adapter.CN105Poller(self.adp, intervals={0x02: 10, 0x03: 10}, min_intervals={0x02: 1, 0x03: 1})
+        task = asyncio.create_task(poller.run())
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.count(0x02), 1)
+        await self.adp.set_data({"power": 1})
+        poller.wake(0x02)
+        await asyncio.sleep(0.05)
+        task.cancel()
+        self.assertEqual(self.count(0x02), 2)
+        self.assertEqual(self.count(0x03), 1)
+        self.assertEqual(self.stream.page(0x02)[3], 1)
+        self.assertEqual(poller._interval[0x02], 2)
+
+
+class TestCN105ServerRetries(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.adp = cn105_adapter.CN105Server(tx=0, response_timeout=0.05)
+        self.stream = ac_sim.CN105SimStream()
+        self.adp.sreader = self.stream
+        self.adp.swriter = self.stream
+
+    def tearDown(self):
+        self.adp._stop_sim()
+
+    async def test_connect(self):
+        self.assertEqual(self.adp.state, cn105_adapter.STATE_DISCONNECTED)
+        self.assertTrue(await self.adp.connect())
+        self.assertEqual(self.adp.state, cn105_adapter.STATE_CONNECTED)
+
+    async def test_lost_response_is_retried(self):
+        await self.adp.connect()
+        self.stream.drop = 1
+        response = await self.adp.get_data(2)
+        self.assertEqual(response.packet_type, 0x62)
+        self.assertEqual(len(self.stream.sent), 3)
+        self.assertEqual(self.adp.retry_count, 1)
+        self.assertEqual(self.adp.state, cn105_adapter.STATE_CONNECTED)
+
+    async def test_failed_transactions_degrade_and_disconnect(self):
+        await self.adp.connect()
+        self.stream.drop = 100
+        for i in range(2):
+            with self.assertRaises(ValueError):
+                await self.adp.get_data(2)
+            self.assertEqual(self.adp.state, cn105_adapter.STATE_DEGRADED)
+        # 1 connect request and 3 attempts per transaction
+        self.assertEqual(len(self.stream.sent), 7)
+        with self.assertRaises(ValueError):
+            await self.adp.get_data(2)
+        self.assertEqual(self.adp.state, cn105_adapter.STATE_DISCONNECTED)
+        self.assertFalse(self.adp.connected)
+
+    async def test_answer_recovers_degraded(self):
+        await self.adp.connect()
+        self.stream.drop = 3
+        with self.assertRaises(ValueError):
+            await self.adp.get_data(2)
+        self.assertEqual(self.adp.state, cn105_adapter.STATE_DEGRADED)
+        await self.adp.get_data(2)
+        self.assertEqual(self.adp.state, cn105_adapter.STATE_CONNECTED)
+        self.assertEqual(self.adp.failures, 0)
+
+    async def test_late_response_is_not_taken_for_the_next_request(self):
+        self.adp.retries = 0
+        self.stream.delay = 0.1
+        with self.assertRaises(ValueError):
+            await self.adp.get_data(2)
+        # the response to the request for page 0x02 arrives now, in front of the one for page 0x03
+        self.stream.delay = 0
+        response = await self.adp.get_data(3)
+        self.assertEqual(response.raw[5], 0x03)
+
+    async def test_deadline_limits_retries(self):
+        self.stream.drop = 100
+        start = asyncio.get_running_loop().time()
+        with self.assertRaises(ValueError):
+            await self.adp.get_data(2, timeout=0.08)
+        self.assertLess(asyncio.get_running_loop().time() - start, 0.15)
+        self.assertEqual(len(self.stream.sent), 1)
+
+    async def test_failed_connect(self):
+        self.stream.drop = 100
+        with self.assertRaises(ValueError):
+            await self.adp.connect()
+        self.assertEqual(self.adp.state, cn105_adapter.STATE_DISCONNECTED)
+
+
+class TestCN105ServerMetrics(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.adp = cn105_adapter.CN105Server(tx=0, response_timeout=0.05, verbose=False)
+        self.stream = ac_sim.CN105SimStream(delay=0.01)
+        self.adp.sreader = self.stream
+        self.adp.swriter = self.stream
+
+    def tearDown(self):
+        self.adp._stop_sim()
+
+    def test_histogram(self):
+        histogram = cn105_adapter.CN105Histogram((10, 100))
+        for value in (5, 10, 11, 100, 1000):
+            histogram.observe(value)
+        self.assertEqual(histogram.to_dict(), {"le": [10, 100], "counts": [2, 2, 1], "count": 5, "sum": 1126})
+
+    async def test_rtt_by_packet_type(self):
+        await self.adp.connect()
+        await self.adp.get_data(2)
+        await self.adp.get_data(3)
+        await self.adp.set_data({"power": 1})
+        stats = self.adp.stats()
+        self.assertEqual(stats["transactions"], 4)
+        self.assertEqual(stats["rttMs"]["connect"]["count"], 1)
+        self.assertEqual(stats["rttMs"]["get"]["count"], 2)
+        self.assertEqual(stats["rttMs"]["set"]["count"], 1)
+        self.assertGreaterEqual(stats["rttMs"]["get"]["sum"], 2 * 10)
+        self.assertEqual(stats["queueWaitMs"]["count"], 4)
+
+    async def test_timeouts_and_retries(self):
+        await self.adp.connect()
+        self.stream.drop = 100
+        with self.assertRaises(ValueError):
+            await self.adp.get_data(2)
+        stats = self.adp.stats()
+        self.assertEqual(stats["timeouts"], 3)
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(stats["rttMs"]["get"]["count"], 0)
+        self.assertEqual(stats["state"], cn105_adapter.STATE_DEGRADED)
+
+    async def test_crc_errors_and_resyncs(self):
+        self.stream.noise = b"\x00\xfc\x62\x55"
+        await self.adp.connect()
+        await self.adp.get_data(2)
+        stats = self.adp.stats()
+        self.assertGreater(stats["resyncs"], 0)
+        self.assertEqual(stats["errors"], 0)
+
+
+class TestCN105ServerInterleaving(unittest.IsolatedAsyncioTestCase):
+    async def test_two_links_run_side_by_side(self):
+        servers = []
+        for i in range(2):
+            server = cn105_adapter.CN105Server(tx=0, verbose=False)
+            server.sreader = server.swriter = ac_sim.CN105SimStream(delay=0.1)
+            servers.append(server)
+        start = asyncio.get_running_loop().time()
+        responses = await asyncio.gather(*[server.get_data(2) for server in servers])
+        # each response takes 0.1 s, the links wait at the same time
+        self.assertLess(asyncio.get_running_loop().time() - start, 0.18)
+        self.assertEqual([r.packet_type for r in responses], [0x62, 0x62])
+        for server in servers:
+            server._stop_sim()
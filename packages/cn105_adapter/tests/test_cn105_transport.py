@@ -0,0 +1,79 @@
+import unittest
+import asyncio
+import os
+import sys
+import cn105_adapter
+import ac_sim
+
+if sys.platform != "win32":
+    import termios
+    from cn105_adapter import transport
+
+
+@unittest.skipIf(sys.platform == "win32", "ptys are required")
+class TestCN105SerialTransport(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # the test is the AC on the master side of a pty, the server opens the slave side
+        self.master, slave = os.openpty()
+        self.path = os.ttyname(slave)
+        os.close(slave)
+        os.set_blocking(self.master, False)
+        self.stream = ac_sim.CN105SimStream()
+        self.rx = bytearray()
+        asyncio.get_running_loop().add_reader(self.master, self.answer)
+        self.adp = cn105_adapter.CN105Server(tx=0, verbose=False)
+        await self.adp.open(self.path)
+
+    def answer(self):
+        try:
+            self.rx += os.read(self.master, 64)
+        except OSError:
+            return
+        while len(self.rx) >= 22 or (len(self.rx) >= 6 and len(self.rx) >= self.rx[4] + 6):
+            n = self.rx[4] + 6
+            self.stream.write(bytes(self.rx[:n]))
+            del self.rx[:n]
+            os.write(self.master, bytes(self.stream._rx))
+            self.stream._rx = bytearray()
+
+    async def asyncTearDown(self):
+        asyncio.get_running_loop().remove_reader(self.master)
+        self.adp.close()
+        os.close(self.master)
+
+    def test_configure(self):
+        attrs = termios.tcgetattr(self.adp.transport._fd)
+        self.assertEqual(attrs[4], termios.B2400)
+        # ptys ignore the parity, only the line discipline settings are checked
+        self.assertEqual(attrs[3] & termios.ECHO, 0)
+
+    def test_unsupported_settings(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_NOCTTY)
+        try:
+            with self.assertRaises(ValueError):
+                transport.configure(fd, 1234)
+            with self.assertRaises(ValueError):
+                transport.configure(fd, parity="X")
+        finally:
+            os.close(fd)
+
+    async def test_transactions(self):
+        self.assertTrue(await self.adp.connect())
+        self.stream.page(0x02)[3] = 1
+        response = await self.adp.get_data(2)
+        self.assertEqual(response.data["power"], 1)
+        await self.adp.set_data({"tempSet": 5})
+        self.assertEqual(self.stream.page(0x02)[5], 5)
+        self.assertEqual([r.packet_type for r in self.stream.sent], [0x5a, 0x42, 0x41])
+
+    async def test_noise_between_transactions_is_dropped(self):
+        await self.adp.connect()
+        os.write(self.master, b"\xfc\x62\x01\x30")
+        await asyncio.sleep(0.01)
+        response = await self.adp.get_data(3)
+        self.assertEqual(response.raw[5], 3)
+
+    async def test_closed_port(self):
+        self.adp.transport.close()
+        self.assertIsNone(self.adp.transport)
+        self.assertFalse(self.adp.connected)
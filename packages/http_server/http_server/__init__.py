@@ -1 +1,2 @@
-from .http_server import HttpRequest, HttpServer, HttpResponse, HttpError
\ No newline at end of file
+from .http_server import HttpRequest, HttpServer, HttpResponse, HttpError, HttpRouter, HttpEventSource, HttpEventStream, \
+    parse_query, encode_event
\ No newline at end of file
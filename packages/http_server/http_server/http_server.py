@@ -10,6 +10,92 @@ if sys.implementation.name == "micropython":
     import ujson as json
     import uos as os
 
+# Seconds, an idle persistent connection waits for the next request
+KEEP_ALIVE_TIMEOUT = 5
+# Requests, that are served on one connection, before it is closed
+MAX_KEEP_ALIVE_REQUESTS = 100
+
+# Subscribers of an event source, further clients get 503
+MAX_EVENT_SUBSCRIBERS = 4
+# Events, that are queued per subscriber, a subscriber, that falls further behind, is dropped
+EVENT_QUEUE_SIZE = 8
+# Seconds, a write to a subscriber may take, before it is dropped
+EVENT_WRITE_TIMEOUT = 5
+# Seconds without events, after which a comment is sent, so closed connections are noticed
+EVENT_PING_INTERVAL = 15
+
+# The status lines of the supported status codes, they are encoded once
+STATUS_LINES = {
+    200: b"HTTP/1.1 200 OK\r\n",
+    400: b"HTTP/1.1 400 Bad Request\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\n",
+    405: b"HTTP/1.1 405 Method Not Allowed\r\n",
+    500: b"HTTP/1.1 500 Internal Server Error\r\n",
+    503: b"HTTP/1.1 503 Service Unavailable\r\n",
+}
+
+# The types of path parameters, e.g. "/units/{unit:int}/state", a parameter without type is a str
+PARAM_TYPES = {
+    "str": str,
+    "int": int,
+}
+
+
+def _unquote(s: str) -> str:
+    # decodes the %XX escapes of an URL
+    if "%" not in s:
+        return s
+    parts = s.split("%")
+    buf = bytearray(parts[0].encode("utf-8"))
+    for part in parts[1:]:
+        try:
+            buf.append(int(part[:2], 16))
+            buf.extend(part[2:].encode("utf-8"))
+        except ValueError:
+            buf.extend(("%" + part).encode("utf-8"))
+    return bytes(buf).decode("utf-8")
+
+
+def parse_query(query: str) -> dict:
+    """Parses a query string.
+
+    Args:
+        query (str): The query string, without "?" (e.g. "unit=1&verbose").
+
+    Returns:
+        dict: name -> value (str), a name without value is mapped to "". If a name occurs more than once, the last value wins.
+    """
+    params = {}
+    for pair in query.split("&"):
+        if pair == "":
+            continue
+        name, _, value = pair.partition("=")
+        params[_unquote(name.replace("+", " "))] = _unquote(value.replace("+", " "))
+    return params
+
+
+def encode_event(data: any, event: str=None, event_id: int=None) -> bytes:
+    """Encodes a Server-Sent Event.
+
+    Args:
+        data (any): The data of the event, str is sent as it is, everything else as json.
+        event (str, optional): The type of the event. Defaults to None (a "message").
+        event_id (int, optional): The id of the event. Defaults to None.
+
+    Returns:
+        bytes: The event, including the empty line, that ends it.
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data)
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}\n")
+    if event is not None:
+        lines.append(f"event: {event}\n")
+    for line in data.split("\n"):
+        lines.append(f"data: {line}\n")
+    lines.append("\n")
+    return "".join(lines).encode("utf-8")
 
 class HttpRequest:
     """A basic http request
@@ -30,6 +116,9 @@ class HttpRequest:
         self.reader = reader
         self.writer = writer
         self.headers = {}
+        # if the connection is kept open after the response, set by the server
+        self.keep_alive = False
+        self.closed = False
 
     async def _process_headers(self, ignore_headers:bool=False):
         while self.reader is not None:
@@ -40,22 +129,32 @@ class HttpRequest:
             if not ignore_headers:
                 self.headers[header_items[0]] = header_items[1].strip()
     
+    def _wants_keep_alive(self) -> bool:
+        # HTTP/1.1 connections are persistent, unless the client asks to close them
+        connection = self.headers.get("Connection", "").lower()
+        if self.version == "HTTP/1.1":
+            return connection != "close"
+        return connection == "keep-alive"
+
     async def _process_body(self):
         self.raw_body = ""
         if "Content-Length" in self.headers:
+            # the whole body is read, even if it isn't parsed, the next request of the connection follows it
             if "Content-Type" in self.headers:
                 try:            
                     if self.headers["Content-Type"].startswith("text/html"):
-                        self.raw_body = await self.reader.read(int(self.headers["Content-Length"]))
+                        self.raw_body = await self.reader.readexactly(int(self.headers["Content-Length"]))
                         self.body = self.raw_body.decode("utf-8")
                     elif self.headers["Content-Type"].startswith("application/json"):
-                        self.raw_body = await self.reader.read(int(self.headers["Content-Length"]))
+                        self.raw_body = await self.reader.readexactly(int(self.headers["Content-Length"]))
                         self.body = json.loads(self.raw_body.decode("utf-8"))
                     else:
-                        self.raw_body = await self.reader.read(int(self.headers["Content-Length"]))   
+                        self.raw_body = await self.reader.readexactly(int(self.headers["Content-Length"]))   
                 except:
                     print("Could not parse Request Body")
                     raise ValueError("Could not parse Request Body")
+            else:
+                self.raw_body = await self.reader.readexactly(int(self.headers["Content-Length"]))
     
     async def write(self, buf):
         if type(buf) is str:
@@ -65,10 +164,14 @@ class HttpRequest:
         #await self.writer.awrite(buf)
         await self.writer.drain()
 
-    async def close(self):
+    async def close(self, read: bool=True):
+        if self.closed:
+            return
+        self.closed = True
         try:
-            # Seems to be required for some Browsers
-            await self.reader.read(-1)
+            if read:
+                # Seems to be required for some Browsers
+                await self.reader.read(-1)
         finally:
             self.writer.close()
 
@@ -86,69 +189,82 @@ class HttpResponse:
         self.request = request
         self.data = data
         self.code = code
+        self._body = None
         if headers is None:
             self.headers = {}
         else:
             self.headers = headers
-        _default_headers = {
-            "Connection": "close",
-            "Access-Control-Allow-Origin": "*"
-            }
-        
-        if isinstance(self.data, str):
-            _default_headers["Content-Length"] = len(self.data)
-            _default_headers["Content-Type"] = "text/html"
-        elif isinstance(self.data, dict):
-            _default_headers["Content-Length"] = len(json.dumps(self.data))
-            _default_headers["Content-Type"] = "application/json"
-        elif isinstance(self.data, list):
-            _default_headers["Content-Length"] = len(json.dumps(self.data))
-            _default_headers["Content-Type"] = "application/json"
-        elif isinstance(self.data, tuple):
-            if self.data[0] == "file":
-                if sys.platform == "win32":
-                    _default_headers["Content-Length"] = os.stat(self.data[2])[6]-2
-                else:
-                    _default_headers["Content-Length"] = os.stat(self.data[2])[6]
-                _default_headers["Content-Type"] = self.data[1]
-
         if default_headers:
+            _default_headers = {
+                "Connection": "keep-alive" if request is not None and request.keep_alive else "close",
+                "Access-Control-Allow-Origin": "*"
+                }
+
+            # the body is encoded once, the length is counted in bytes
+            if isinstance(self.data, str):
+                _default_headers["Content-Length"] = len(self.body)
+                _default_headers["Content-Type"] = "text/html"
+            elif isinstance(self.data, dict):
+                _default_headers["Content-Length"] = len(self.body)
+                _default_headers["Content-Type"] = "application/json"
+            elif isinstance(self.data, list):
+                _default_headers["Content-Length"] = len(self.body)
+                _default_headers["Content-Type"] = "application/json"
+            elif isinstance(self.data, (bytes, bytearray, memoryview)):
+                # pre-encoded by the route
+                _default_headers["Content-Length"] = len(self.body)
+                _default_headers["Content-Type"] = "application/octet-stream"
+            elif isinstance(self.data, tuple):
+                if self.data[0] == "file":
+                    if sys.platform == "win32":
+                        _default_headers["Content-Length"] = os.stat(self.data[2])[6]-2
+                    else:
+                        _default_headers["Content-Length"] = os.stat(self.data[2])[6]
+                    _default_headers["Content-Type"] = self.data[1]
+
             for header in _default_headers:
                 if header not in self.headers:
-                    self.headers[header] = _default_headers[header]   
+                    self.headers[header] = _default_headers[header]
+
+    @property
+    def body(self) -> bytes:
+        """The encoded body. str is encoded as UTF-8, dict and list as json, bytes, bytearray and memoryview
+        are sent as they are. It is encoded on first access and then reused, files are streamed instead.
+        """
+        if self._body is None:
+            data = self.data
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                self._body = data
+            elif isinstance(data, str):
+                self._body = data.encode("utf-8")
+            elif isinstance(data, (dict, list)):
+                self._body = json.dumps(data).encode("utf-8")
+            else:
+                self._body = b""
+        return self._body
+
+    def _head(self) -> bytes:
+        # the status line and the headers, up to the empty line
+        status = STATUS_LINES.get(self.code)
+        if status is None:
+            status = f"HTTP/1.1 {self.code} \r\n".encode("utf-8")
+        lines = [f"{header}: {self.headers[header]}\r\n" for header in self.headers]
+        lines.append("\r\n")
+        return status + "".join(lines).encode("utf-8")
 
     async def _send(self):
-        if self.code == 200:
-            await self.request.write(f"HTTP/1.1 200 OK\r\n")
-        elif self.code == 400:
-            await self.request.write(f"HTTP/1.1 400 Bad Request\r\n")
-        elif self.code == 404:
-            await self.request.write(f"HTTP/1.1 404 Not Found\r\n")
-        elif self.code == 405:
-            await self.request.write(f"HTTP/1.1 405 Method Not Allowed\r\n")
-        elif self.code == 500:
-            await self.request.write(f"HTTP/1.1 500 Internal Server Error\r\n")
-
-        for header in self.headers:
-            await self.request.write(f"{header}: {self.headers[header]}\r\n")
-
-        await self.request.write(f"\r\n")
-
-        if isinstance(self.data, str):
-            await self.request.write(self.data)
-        elif isinstance(self.data, dict):
-            await self.request.write(json.dumps(self.data))
-        elif isinstance(self.data, list):
-            await self.request.write(json.dumps(self.data))
-        elif isinstance(self.data, tuple):
+        # the head and the body are assembled in one buffer and sent with a single write
+        head = self._head()
+        if isinstance(self.data, tuple):
             if self.data[0] == "file":
+                # the first chunk of the file goes out with the head
                 with open(self.data[2], encoding="utf-8") as f:
-                    while True:
-                        s = f.read(1024)
-                        if s != '':
-                            await self.request.write(s)
-                        else:
-                            break
+                    buf = head + f.read(1024).encode("utf-8")
+                    while buf:
+                        await self.request.write(buf)
+                        buf = f.read(1024).encode("utf-8")
+                return
+        await self.request.write(head + self.body)
 
 class HttpError(HttpResponse):
     def __init__(self, request: HttpRequest, code: int, message: str=None):
@@ -170,19 +286,287 @@ class HttpError(HttpResponse):
                 super().__init__(request, "Method Not Allowed", code)      
             elif code == 500:
                 super().__init__(request, "Internal Server Error", code)
+            elif code == 503:
+                super().__init__(request, "Service Unavailable", code)
+
+
+class HttpEventStream(HttpResponse):
+    """The response of a subscriber of a `HttpEventSource`. It holds the connection open and sends the events,
+    that are published, until the client disconnects or is dropped. You shouldn't have to create one by
+    yourself, use `HttpEventSource.subscribe`.
+    """
+    def __init__(self, request: HttpRequest, source, initial: bytes=b""):
+        """Initializes the stream.
+
+        Args:
+            request (HttpRequest): the request of the subscriber.
+            source (HttpEventSource): the event source.
+            initial (bytes, optional): encoded events, that are sent first. Defaults to b"".
+        """
+        super().__init__(request, initial, headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Connection": "close",
+            "Access-Control-Allow-Origin": "*",
+        }, default_headers=False)
+        self.source = source
+        # the encoded events, that weren't sent yet
+        self.queue = []
+        self.dropped = False
+        self._event = asyncio.Event()
+
+    def _drop(self):
+        self.dropped = True
+        self.queue = []
+        self._event.set()
+
+    async def _next(self) -> bytes:
+        # the queued events in one buffer, a comment, if there were none for a while, None, if dropped
+        while not self.queue:
+            if self.dropped:
+                return None
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), self.source.ping_interval)
+            except asyncio.TimeoutError:
+                return b": ping\n\n"
+        buf = b"".join(self.queue)
+        self.queue = []
+        return buf
+
+    async def _send(self):
+        # the head and the initial events go out in one write, then all queued events in one write each
+        buf = self._head() + self.body
+        try:
+            while buf is not None:
+                await asyncio.wait_for(self.request.write(buf), self.source.write_timeout)
+                buf = await self._next()
+        except (asyncio.TimeoutError, OSError):
+            # the client is too slow or disconnected
+            pass
+        finally:
+            self.source._remove(self)
+            # the client doesn't send anything, that could be read
+            await self.request.close(read=False)
+
+
+class HttpEventSource:
+    """Pushes Server-Sent Events (text/event-stream) to the clients, that subscribed to it.
+
+    A route returns `subscribe(request)`, the response holds the connection open. Each `publish` encodes the
+    event once and queues it for every subscriber, so clients get one event per change, instead of polling.
+    The number of subscribers is bounded, further clients get 503. A subscriber, that has `queue_size` events
+    queued, or whose write takes longer than `write_timeout` seconds, is dropped and its connection is
+    closed, so a slow client can neither hold memory nor slow down the others.
+    """
+    def __init__(self, max_subscribers: int=MAX_EVENT_SUBSCRIBERS, queue_size: int=EVENT_QUEUE_SIZE,
+            write_timeout: float=EVENT_WRITE_TIMEOUT, ping_interval: float=EVENT_PING_INTERVAL):
+        """Initializes the event source.
+
+        Args:
+            max_subscribers (int, optional): Subscribers at the same time. Defaults to MAX_EVENT_SUBSCRIBERS.
+            queue_size (int, optional): Events, that are queued per subscriber. Defaults to EVENT_QUEUE_SIZE.
+            write_timeout (float, optional): Seconds, a write to a subscriber may take. Defaults to EVENT_WRITE_TIMEOUT.
+            ping_interval (float, optional): Seconds without events, after which a comment is sent. Defaults to EVENT_PING_INTERVAL.
+        """
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.write_timeout = write_timeout
+        self.ping_interval = ping_interval
+        self.subscribers = []
+        self.last_id = 0
+        # subscribers, that were dropped, because they were too slow
+        self.dropped = 0
+
+    def subscribe(self, request: HttpRequest, initial: list=None) -> HttpResponse:
+        """Subscribes a client. This is the return value of the route handler.
+
+        Args:
+            request (HttpRequest): the request of the client.
+            initial (list, optional): events (event, data), that are sent to this client first, e.g. the
+                current state. Defaults to None.
+
+        Returns:
+            HttpResponse: the event stream, or a 503 error, if there are `max_subscribers` already.
+        """
+        if len(self.subscribers) >= self.max_subscribers:
+            return HttpError(request, 503, "Too many subscribers")
+        buf = b""
+        if initial is not None:
+            buf = b"".join([encode_event(data, event) for event, data in initial])
+        stream = HttpEventStream(request, self, buf)
+        self.subscribers.append(stream)
+        return stream
+
+    def publish(self, data: any, event: str=None) -> int:
+        """Sends an event to all subscribers.
+
+        Args:
+            data (any): The data of the event, str is sent as it is, everything else as json.
+            event (str, optional): The type of the event. Defaults to None (a "message").
+
+        Returns:
+            int: The subscribers, the event was queued for.
+        """
+        self.last_id += 1
+        if not self.subscribers:
+            return 0
+        buf = encode_event(data, event, self.last_id)
+        n = 0
+        for stream in self.subscribers[:]:
+            if len(stream.queue) >= self.queue_size:
+                self.dropped += 1
+                self._remove(stream)
+            else:
+                stream.queue.append(buf)
+                stream._event.set()
+                n += 1
+        return n
+
+    def close(self):
+        """Ends all event streams."""
+        for stream in self.subscribers[:]:
+            self._remove(stream)
+
+    def _remove(self, stream: HttpEventStream):
+        stream._drop()
+        if stream in self.subscribers:
+            self.subscribers.remove(stream)
+
+class _RouteNode:
+    # a node of the segment trie: the static children, the parameter child and the routes, that end here
+    def __init__(self):
+        self.children = {}
+        # (name, type, node)
+        self.param = None
+        # method -> (is async, pattern)
+        self.methods = None
+        # the value of the Allow header of a 405 response
+        self.allow = None
+
+
+class HttpRouter:
+    """Finds the route of a request path. You shouldn't have to create one by yourself, the server compiles
+    it from its `routes` and `async_routes`.
+
+    Routes without parameters are found with a single dict lookup, routes with parameters (e.g.
+    "/units/{unit}/state" or "/units/{unit:int}/state") in a trie of the path segments. Static segments are
+    preferred over parameters. The methods of each route are collected, when the router is compiled.
+    """
+    def __init__(self, routes: dict, async_routes: dict):
+        """Compiles the routes.
+
+        Args:
+            routes (dict): pattern -> (methods, handler).
+            async_routes (dict): pattern -> (methods, async handler).
+
+        Raises:
+            ValueError: If a parameter has an unknown type, or two routes have different parameters at the same position.
+        """
+        self.static = {}
+        self.root = _RouteNode()
+        self.size = len(routes) + len(async_routes)
+        for pattern in routes:
+            self._add(pattern, routes[pattern][0], False)
+        for pattern in async_routes:
+            self._add(pattern, async_routes[pattern][0], True)
+
+    def _add(self, pattern: str, methods: tuple, is_async: bool):
+        if "{" not in pattern:
+            node = self.static.get(pattern)
+            if node is None:
+                node = self.static[pattern] = _RouteNode()
+        else:
+            node = self.root
+            for segment in pattern.split("/")[1:]:
+                if segment.startswith("{") and segment.endswith("}"):
+                    name, _, type_name = segment[1:-1].partition(":")
+                    param_type = PARAM_TYPES.get(type_name or "str")
+                    if param_type is None:
+                        raise ValueError(f"Unknown parameter type {type_name} in route {pattern}")
+                    if node.param is None:
+                        node.param = (name, param_type, _RouteNode())
+                    elif node.param[0] != name or node.param[1] is not param_type:
+                        raise ValueError(f"Parameter {segment} of route {pattern} conflicts with another route")
+                    node = node.param[2]
+                else:
+                    child = node.children.get(segment)
+                    if child is None:
+                        child = node.children[segment] = _RouteNode()
+                    node = child
+        if node.methods is None:
+            node.methods = {}
+        for method in methods:
+            node.methods[method] = (is_async, pattern)
+        node.allow = ", ".join(sorted(node.methods))
+
+    def match(self, path: str) -> tuple:
+        """Finds the route of a path.
+
+        Args:
+            path (str): The path, without query string.
+
+        Returns:
+            tuple: (node, params), node.methods maps the allowed methods to (is async, pattern), params the
+                names of the path parameters to their values. (None, None), if no route matches.
+        """
+        node = self.static.get(path)
+        if node is not None:
+            return node, {}
+        params = {}
+        node = self._match(self.root, path.split("/"), 1, params)
+        if node is None:
+            return None, None
+        return node, params
+
+    def _match(self, node: _RouteNode, segments: list, i: int, params: dict) -> _RouteNode:
+        if i == len(segments):
+            return node if node.methods is not None else None
+        child = node.children.get(segments[i])
+        if child is not None:
+            found = self._match(child, segments, i + 1, params)
+            if found is not None:
+                return found
+        if node.param is not None and segments[i] != "":
+            name, param_type, child = node.param
+            try:
+                value = param_type(_unquote(segments[i]))
+            except ValueError:
+                return None
+            found = self._match(child, segments, i + 1, params)
+            if found is not None:
+                params[name] = value
+                return found
+        return None
+
 
 class HttpServer:
     """A HTTP Server that proviedes basic functionality and runs on micropython.
+
+    Connections are persistent (HTTP/1.1 keep-alive): the requests of a connection, also pipelined ones, are
+    answered one after the other, in the order they arrived. A connection is closed, if the client asks for it,
+    if it was idle for `keep_alive_timeout` seconds or after `max_requests` requests.
+
+    Routes are added to `routes` (or `async_routes` for coroutines), with the decorators or directly:
+    pattern -> (methods, handler). A pattern can have path parameters, e.g. "/units/{unit}/state" or
+    "/units/{unit:int}/state", the handler finds them in `request.params`, the query string in
+    `request.query`. The routes are compiled into a `HttpRouter`, when the server starts, and again, when
+    routes are added. If you remove routes or change their methods while the server runs, call `compile()`.
     """
-    def __init__(self, port: int=80, address: str='0.0.0.0'):
+    def __init__(self, port: int=80, address: str='0.0.0.0', keep_alive_timeout: float=KEEP_ALIVE_TIMEOUT, max_requests: int=MAX_KEEP_ALIVE_REQUESTS):
         """Initializes the server.
 
         Args:
             port (int, optional): The port, on which the server listens. Defaults to 80.
             address (str, optional): The IP address of the server. Defaults to '0.0.0.0'.
+            keep_alive_timeout (float, optional): Seconds, an idle connection is kept open. Defaults to KEEP_ALIVE_TIMEOUT.
+            max_requests (int, optional): Requests per connection, 1 disables keep-alive. Defaults to MAX_KEEP_ALIVE_REQUESTS.
         """
         self.port = port
         self.address = address
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests = max_requests
+        self._router = None
         self.routes = {}
         self.async_routes = {}
         self.server = None
@@ -202,18 +586,34 @@ class HttpServer:
         return decorator
     
     async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-        req_line = await reader.readline()
-        
-        # request line should be like
-        # GET /index.html HTTP/1.1
-        req_items = req_line.decode("ascii").split(" ")
-        if len(req_items) != 3:
-            return
-        request = HttpRequest(req_items[0], req_items[1], req_items[2], reader, writer)
-        
+        served = 0
+        while True:
+            if served == 0:
+                req_line = await reader.readline()
+            else:
+                try:
+                    req_line = await asyncio.wait_for(reader.readline(), self.keep_alive_timeout)
+                except (asyncio.TimeoutError, OSError):
+                    req_line = b""
+            
+            # request line should be like
+            # GET /index.html HTTP/1.1
+            req_items = req_line.decode("ascii").split(" ")
+            if len(req_items) != 3:
+                # the client closed the connection, or it was idle for too long
+                writer.close()
+                return
+            served += 1
+            request = HttpRequest(req_items[0], req_items[1], req_items[2].strip(), reader, writer)
+            if not await self._handle_request(request, served >= self.max_requests):
+                return
+
+    async def _handle_request(self, request: HttpRequest, last: bool) -> bool:
+        # Answers one request. Returns, if the connection is kept open for the next one.
         print(f"Request: {request.method:.10} {request.url:.30} -> ", end="")
         
         failed = False
+        keep_alive = False
 
         try:
             try:
@@ -233,31 +633,56 @@ class HttpServer:
                     await response._send()
                     print(f"400 (Could not process body)")
             if not failed:
-                if request.url in self.routes:
-                    if request.method in self.routes[request.url][0]:
-                        try:
-                            response = self.routes[request.url][1](request)
-                        except Exception as e:
-                            response = HttpError(request, 500, message="Internal Server Error: " + str(e))     
-                    else:
-                        response = HttpError(request, 405, f"Method {request.method} not allowed on route {request.url}")            
-                elif request.url in self.async_routes:
-                    if request.method in self.async_routes[request.url][0]:
-                        try:
-                            response = await self.async_routes[request.url][1](request)
-                        except Exception as e:
-                            response = HttpError(request, 500, message="Internal Server Error: " + str(e))                 
-                    else:
-                        response = HttpError(request, 405, f"Method {request.method} not allowed on route {request.url}")            
-                else:
-                    response = HttpError(request, 404, f"URL {request.url} not found")
+                request.keep_alive = not last and request._wants_keep_alive()
+                response = await self._dispatch(request)
                 
                 await response._send()
                 print(f"{response.code} {str(response.data):.100}")
+                # without a length, the client reads the body until the connection is closed
+                keep_alive = request.keep_alive and response.headers.get("Connection") == "keep-alive" \
+                    and "Content-Length" in response.headers
         finally:
-            await request.close()
+            if not keep_alive:
+                await request.close()
+        return keep_alive
+
+    def compile(self) -> HttpRouter:
+        """Compiles the routes. The server does it, when it starts and when routes are added.
+
+        Returns:
+            HttpRouter: The router.
+        """
+        self._router = HttpRouter(self.routes, self.async_routes)
+        return self._router
+
+    async def _dispatch(self, request: HttpRequest) -> HttpResponse:
+        router = self._router
+        if router is None or router.size != len(self.routes) + len(self.async_routes):
+            router = self.compile()
+        path, _, query = request.url.partition("?")
+        request.path = path
+        try:
+            request.query = parse_query(query)
+        except (ValueError, UnicodeError):
+            return HttpError(request, 400, "Could not parse query string")
+        node, request.params = router.match(path)
+        if node is None:
+            return HttpError(request, 404, f"URL {request.url} not found")
+        route = node.methods.get(request.method)
+        if route is None:
+            response = HttpError(request, 405, f"Method {request.method} not allowed on route {path}")
+            response.headers["Allow"] = node.allow
+            return response
+        is_async, pattern = route
+        try:
+            if is_async:
+                return await self.async_routes[pattern][1](request)
+            return self.routes[pattern][1](request)
+        except Exception as e:
+            return HttpError(request, 500, message="Internal Server Error: " + str(e))
 
     async def run(self):
+        self.compile()
         if self.server is None:
             self.server = await asyncio.start_server(self.handle, self.address, self.port)
 
@@ -1,8 +1,9 @@
 import unittest
-from http_server import HttpServer, HttpRequest, HttpResponse
+from http_server import HttpServer, HttpRequest, HttpResponse, HttpRouter, HttpEventSource, parse_query, encode_event
 import httpx
 import asyncio
 import json
+from unittest import mock
 from ddt import ddt, data, unpack
 import sys
 
@@ -148,5 +149,306 @@ class TestAscyncHttpServer(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(response.status_code, 500)
 
 
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.routes = {
+            "/state": (("GET", "POST"), None),
+            "/units/{unit:int}/state": (("GET",), None),
+            "/units/all/state": (("GET",), None),
+            "/files/{name}": (("GET",), None),
+        }
+        self.async_routes = {
+            "/units/{unit:int}/state": (("POST",), None),
+        }
+        self.router = HttpRouter(self.routes, self.async_routes)
+
+    def test_static_route(self):
+        node, params = self.router.match("/state")
+        self.assertEqual(node.methods, {"GET": (False, "/state"), "POST": (False, "/state")})
+        self.assertEqual(params, {})
+
+    def test_typed_parameter(self):
+        node, params = self.router.match("/units/3/state")
+        self.assertEqual(params, {"unit": 3})
+        # sync and async handlers of one route are combined
+        self.assertEqual(node.methods["GET"], (False, "/units/{unit:int}/state"))
+        self.assertEqual(node.methods["POST"], (True, "/units/{unit:int}/state"))
+        self.assertEqual(node.allow, "GET, POST")
+        self.assertEqual(self.router.match("/units/x/state"), (None, None))
+
+    def test_static_segment_wins(self):
+        node, params = self.router.match("/units/all/state")
+        self.assertEqual(node.methods, {"GET": (False, "/units/all/state")})
+
+    def test_escaped_parameter(self):
+        node, params = self.router.match("/files/living%20room")
+        self.assertEqual(params, {"name": "living room"})
+
+    def test_no_match(self):
+        for path in ("/", "/units", "/units/1", "/units/1/state/x", "/files/", "/state/"):
+            self.assertEqual(self.router.match(path), (None, None), path)
+
+    def test_conflicting_parameters(self):
+        self.routes["/units/{name}/config"] = (("GET",), None)
+        with self.assertRaises(ValueError):
+            HttpRouter(self.routes, {})
+
+    def test_unknown_parameter_type(self):
+        with self.assertRaises(ValueError):
+            HttpRouter({"/units/{unit:float}": (("GET",), None)}, {})
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query("a=1&b=x+y&c&d=%C3%BC&a=2"), {"a": "2", "b": "x y", "c": "", "d": "ü"})
+        self.assertEqual(parse_query(""), {})
+
+
+class FakeWriter:
+    def __init__(self):
+        self.writes = []
+        self.drains = 0
+
+    def write(self, buf):
+        self.writes.append(bytes(buf))
+
+    async def drain(self):
+        self.drains += 1
+
+
+class TestResponseSerialization(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.writer = FakeWriter()
+        self.request = HttpRequest("GET", "/", "HTTP/1.1", None, self.writer)
+
+    async def test_single_write(self):
+        response = HttpResponse(self.request, {"key": "value"})
+        await response._send()
+        self.assertEqual(len(self.writer.writes), 1)
+        self.assertEqual(self.writer.drains, 1)
+        self.assertEqual(self.writer.writes[0],
+            b"HTTP/1.1 200 OK\r\n"
+            b"Connection: close\r\n"
+            b"Access-Control-Allow-Origin: *\r\n"
+            b"Content-Length: 16\r\n"
+            b"Content-Type: application/json\r\n"
+            b"\r\n"
+            b'{"key": "value"}')
+
+    async def test_non_ascii_body(self):
+        response = HttpResponse(self.request, "Küche")
+        self.assertEqual(response.headers["Content-Length"], 6)
+        await response._send()
+        head, body = self.writer.writes[0].split(b"\r\n\r\n", 1)
+        self.assertEqual(body.decode("utf-8"), "Küche")
+
+    async def test_json_is_serialized_once(self):
+        with mock.patch("http_server.http_server.json.dumps", wraps=json.dumps) as dumps:
+            response = HttpResponse(self.request, ["a", "b"])
+            await response._send()
+        self.assertEqual(dumps.call_count, 1)
+
+    async def test_pre_encoded_body(self):
+        body = bytearray(b"\x00\x01\x02")
+        response = HttpResponse(self.request, body, headers={"Content-Type": "application/cbor"})
+        self.assertIs(response.body, body)
+        await response._send()
+        self.assertTrue(self.writer.writes[0].endswith(b"\r\n\r\n\x00\x01\x02"))
+        self.assertIn(b"Content-Type: application/cbor\r\n", self.writer.writes[0])
+        self.assertIn(b"Content-Length: 3\r\n", self.writer.writes[0])
+
+    async def test_unknown_status_code(self):
+        response = HttpResponse(self.request, "", code=204)
+        await response._send()
+        self.assertTrue(self.writer.writes[0].startswith(b"HTTP/1.1 204 \r\n"))
+
+    async def test_file_head_and_first_chunk(self):
+        response = HttpResponse(self.request, ("file", "text/html", "./tests/test.html"))
+        await response._send()
+        self.assertEqual(len(self.writer.writes), 1)
+        head, body = self.writer.writes[0].split(b"\r\n\r\n", 1)
+        with open("./tests/test.html", "rb") as f:
+            self.assertEqual(body, f.read())
+
+
+class TestRouting(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.srv = HttpServer(port=8083)
+        await self.srv.run()
+
+    async def asyncTearDown(self):
+        self.srv.stop()
+
+    async def test_parameters_and_query(self):
+        @self.srv.async_route("/units/{unit:int}/state", methods=("GET", "POST"))
+        async def unit_state(request: HttpRequest):
+            return HttpResponse(request, {"unit": request.params["unit"], "query": request.query, "path": request.path})
+
+        async with httpx.AsyncClient() as client:
+            response = await client.get("http://127.0.0.1:8083/units/2/state?verbose=1")
+            self.assertEqual(response.json(), {"unit": 2, "query": {"verbose": "1"}, "path": "/units/2/state"})
+            response = await client.get("http://127.0.0.1:8083/units/two/state")
+            self.assertEqual(response.status_code, 404)
+
+    async def test_405_has_allow_header(self):
+        @self.srv.route("/state", methods=("GET", "POST"))
+        def state(request: HttpRequest):
+            return HttpResponse(request, "OK")
+
+        async with httpx.AsyncClient() as client:
+            response = await client.delete("http://127.0.0.1:8083/state")
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.headers["allow"], "GET, POST")
+
+    async def test_replaced_handler_is_used(self):
+        self.srv.routes["/state"] = (("GET",), lambda request: HttpResponse(request, "old"))
+        async with httpx.AsyncClient() as client:
+            self.assertEqual((await client.get("http://127.0.0.1:8083/state")).text, "old")
+            self.srv.routes["/state"] = (("GET",), lambda request: HttpResponse(request, "new"))
+            self.assertEqual((await client.get("http://127.0.0.1:8083/state")).text, "new")
+
+
+class TestKeepAlive(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.srv = HttpServer(port=8082, keep_alive_timeout=0.2, max_requests=3)
+        await self.srv.run()
+
+        @self.srv.route("/test_route", methods=("GET", "POST"))
+        def test_route(request: HttpRequest):
+            if request.method == "POST":
+                return HttpResponse(request, request.body)
+            return HttpResponse(request, "TEST")
+
+    async def asyncTearDown(self):
+        self.srv.stop()
+
+    async def read_response(self, reader):
+        status = await reader.readline()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("ascii").strip()
+            if line == "":
+                break
+            key, value = line.split(": ", 1)
+            headers[key] = value
+        body = await reader.readexactly(int(headers["Content-Length"]))
+        return status.decode("ascii").split(" ")[1], headers, body.decode("utf-8")
+
+    async def test_connection_is_reused(self):
+        async with httpx.AsyncClient() as client:
+            for i in range(3):
+                response = await client.get("http://127.0.0.1:8082/test_route")
+                self.assertEqual(response.content, b"TEST")
+            # the third request was the last one of the connection
+            self.assertEqual(response.headers["connection"], "close")
+            response = await client.get("http://127.0.0.1:8082/test_route")
+            self.assertEqual(response.headers["connection"], "keep-alive")
+
+    async def test_pipelined_requests_are_answered_in_order(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", 8082)
+        writer.write(
+            b"POST /test_route HTTP/1.1\r\nContent-Type: text/html\r\nContent-Length: 5\r\n\r\nfirst"
+            b"GET /nothing HTTP/1.1\r\n\r\n"
+            b"POST /test_route HTTP/1.1\r\nContent-Type: text/html\r\nContent-Length: 6\r\n\r\nsecond")
+        await writer.drain()
+        code, headers, body = await self.read_response(reader)
+        self.assertEqual((code, headers["Connection"], body), ("200", "keep-alive", "first"))
+        code, headers, body = await self.read_response(reader)
+        self.assertEqual(code, "404")
+        code, headers, body = await self.read_response(reader)
+        self.assertEqual((code, headers["Connection"], body), ("200", "close", "second"))
+        writer.close()
+
+    async def test_connection_close(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", 8082)
+        writer.write(b"GET /test_route HTTP/1.1\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        code, headers, body = await self.read_response(reader)
+        self.assertEqual(headers["Connection"], "close")
+        writer.write_eof()
+        self.assertEqual(await reader.read(), b"")
+        writer.close()
+
+    async def test_http_1_0_closes(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", 8082)
+        writer.write(b"GET /test_route HTTP/1.0\r\n\r\n")
+        await writer.drain()
+        code, headers, body = await self.read_response(reader)
+        self.assertEqual(headers["Connection"], "close")
+        writer.close()
+
+    async def test_idle_connection_is_closed(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", 8082)
+        writer.write(b"GET /test_route HTTP/1.1\r\n\r\n")
+        await writer.drain()
+        await self.read_response(reader)
+        self.assertEqual(await asyncio.wait_for(reader.read(), 1), b"")
+        writer.close()
+
+
+class TestEventSource(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.srv = HttpServer(port=8084)
+        self.events = HttpEventSource(max_subscribers=2, queue_size=2, ping_interval=0.1)
+
+        @self.srv.route("/events")
+        def events(request: HttpRequest):
+            return self.events.subscribe(request, [("state", {"power": 0})])
+
+        await self.srv.run()
+
+    async def asyncTearDown(self):
+        self.events.close()
+        self.srv.stop()
+
+    async def _subscribe(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", 8084)
+        writer.write(b"GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 1)
+        return reader, writer, head
+
+    async def _read_event(self, reader) -> bytes:
+        return await asyncio.wait_for(reader.readuntil(b"\n\n"), 1)
+
+    def test_encode_event(self):
+        self.assertEqual(encode_event({"power": 1}, "state", 3), b'id: 3\nevent: state\ndata: {"power": 1}\n\n')
+        self.assertEqual(encode_event("a\nb"), b"data: a\ndata: b\n\n")
+
+    async def test_stream(self):
+        reader, writer, head = await self._subscribe()
+        self.assertTrue(head.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertIn(b"Content-Type: text/event-stream\r\n", head)
+        self.assertNotIn(b"Content-Length", head)
+        self.assertEqual(await self._read_event(reader), b'event: state\ndata: {"power": 0}\n\n')
+
+        self.assertEqual(self.events.publish({"power": 1}, "state"), 1)
+        self.assertEqual(await self._read_event(reader), b'id: 1\nevent: state\ndata: {"power": 1}\n\n')
+        # without events, a comment keeps the connection alive
+        self.assertEqual(await self._read_event(reader), b": ping\n\n")
+
+        self.events.close()
+        self.assertEqual(await asyncio.wait_for(reader.read(), 1), b"")
+        writer.close()
+
+    async def test_max_subscribers(self):
+        connections = [await self._subscribe() for i in range(2)]
+        async with httpx.AsyncClient() as client:
+            response = await client.get("http://127.0.0.1:8084/events")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.events.subscribers), 2)
+        for reader, writer, head in connections:
+            writer.close()
+
+    def test_slow_subscriber_is_dropped(self):
+        # the stream isn't sent, so nothing is taken from its queue
+        request = HttpRequest("GET", "/events", "HTTP/1.1", None, FakeWriter())
+        slow = self.events.subscribe(request)
+        self.assertEqual(self.events.publish("1"), 1)
+        self.assertEqual(self.events.publish("2"), 1)
+        self.assertEqual(self.events.publish("3"), 0)
+        self.assertTrue(slow.dropped)
+        self.assertEqual(slow.queue, [])
+        self.assertEqual(self.events.subscribers, [])
+        self.assertEqual(self.events.dropped, 1)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()